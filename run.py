@@ -44,6 +44,13 @@ def parse_args():
         help=f"Number of worker processes (default: {DEFAULT_WORKERS})"
     )
     
+    parser.add_argument(
+        "--index",
+        type=str,
+        default=os.getenv("INDEX_SNAPSHOT"),
+        help="Serve a prebuilt index read-only instead of indexing at startup (see sympai_index.py)"
+    )
+    
     parser.add_argument(
         "--reload",
         action="store_true",
@@ -69,15 +76,25 @@ def main():
         print(f"  Port: {args.port}")
         print(f"  Workers: {args.workers}")
         print(f"  Reload: {args.reload}")
+        print(f"  Index: {args.index or 'built at startup'}")
         print(f"  Debug: {DEBUG}")
     
+    # uvicorn ignores the workers when reloading
+    if args.reload and args.workers > 1:
+        print(f"Auto-reload is disabled to run {args.workers} workers")
+    
+    # Workers read the prebuilt index and the worker count from the environment
+    if args.index:
+        os.environ["INDEX_SNAPSHOT"] = args.index
+    os.environ["WORKERS"] = str(args.workers)
+    
     # Start the server
     uvicorn.run(
         "server.app.main:app",
         host=args.host,
         port=args.port,
         workers=args.workers,
-        reload=args.reload,
+        reload=args.reload and args.workers == 1,
         log_config=log_config,
         log_level="debug" if DEBUG else "info"
     )
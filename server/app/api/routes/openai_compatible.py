@@ -6,19 +6,26 @@ import time
 import json
 import os
 from dotenv import load_dotenv
-from server.app.core.models.online import LangChainChat
+from langchain_core.messages import HumanMessage, SystemMessage
+from server.app.core.models.online import LangChainChat, ChatContext, ERROR_RESPONSE
+from server.app.utils.tokens import count_tokens, count_message_tokens, REPLY_PRIMING
+from server.app.utils.usage import UsageMeter
 
 load_dotenv()
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
 router = APIRouter(prefix="/v1")
 model = LangChainChat()
+usage_meter = UsageMeter()
 
 class ChatMessage(BaseModel):
     role: str
     content: str
     name: Optional[str] = None
 
+class StreamOptions(BaseModel):
+    include_usage: bool = False
+
 class ChatCompletionRequest(BaseModel):
     model: str
     messages: List[ChatMessage]
@@ -26,6 +33,7 @@ class ChatCompletionRequest(BaseModel):
     top_p: Optional[float] = 1.0
     n: Optional[int] = 1
     stream: Optional[bool] = False
+    stream_options: Optional[StreamOptions] = None
     stop: Optional[List[str]] = None
     max_tokens: Optional[int] = None
     presence_penalty: Optional[float] = 0
@@ -58,13 +66,27 @@ async def verify_auth(request: Request):
     # Here you can add your own API key validation logic
     return api_key
 
+def count_prompt_tokens(context: ChatContext, message: str) -> int:
+    """
+    Count the tokens of the prompt sent for a message, the system prompt and the message itself
+    """
+    messages = [SystemMessage(content=context.system_prompt), HumanMessage(content=message)]
+    return count_message_tokens(messages, context.model_name) + REPLY_PRIMING
+
 async def stream_generator(request: ChatCompletionRequest, api_key: str) -> AsyncGenerator[str, None]:
     """
     Generate streaming chat response in OpenAI format
+
+    The completion tokens are counted chunk by chunk, so a stream ended by the client
+    is metered up to its last chunk. With `stream_options.include_usage` a final chunk
+    without choices carries the usage.
     """
+    include_usage = request.stream_options is not None and request.stream_options.include_usage
+    completion_id = f"chatcmpl-{int(time.time())}"
+    prompt_tokens = 0
+    completion_tokens = 0
     try:
-        # Configure model
-        model.configure(
+        context = model.context(
             api_key=api_key,
             model_name=request.model,
             temperature=request.temperature,
@@ -76,13 +98,17 @@ async def stream_generator(request: ChatCompletionRequest, api_key: str) -> Asyn
                            if msg.role == "user"), None)
         if not last_message:
             raise ValueError("No user message found")
+        prompt_tokens = count_prompt_tokens(context, last_message)
 
-        async for chunk in model.astream_chat(last_message):
+        async for chunk in model.astream_chat(last_message, context=context):
             if DEBUG:
                 print(f"Streaming chunk: {chunk}")
+            # The error answer of a failed generation is not a completion
+            if chunk != ERROR_RESPONSE:
+                completion_tokens += count_tokens(chunk, request.model)
             
             response = {
-                "id": f"chatcmpl-{int(time.time())}",
+                "id": completion_id,
                 "object": "chat.completion.chunk",
                 "created": int(time.time()),
                 "model": request.model,
@@ -94,6 +120,24 @@ async def stream_generator(request: ChatCompletionRequest, api_key: str) -> Asyn
                     "finish_reason": None
                 }]
             }
+            if include_usage:
+                response["usage"] = None
+            yield f"data: {json.dumps(response)}\n\n"
+        
+        if include_usage:
+            usage = Usage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+            response = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.model,
+                "choices": [],
+                "usage": usage.model_dump()
+            }
             yield f"data: {json.dumps(response)}\n\n"
             
         # Send the final [DONE] message
@@ -109,6 +153,9 @@ async def stream_generator(request: ChatCompletionRequest, api_key: str) -> Asyn
             }
         }
         yield f"data: {json.dumps(error_response)}\n\n"
+    finally:
+        if prompt_tokens:
+            usage_meter.record(api_key, request.model, prompt_tokens, completion_tokens)
 
 @router.post("/chat/completions", response_model=ChatCompletionResponse)
 async def create_chat_completion(
@@ -145,7 +192,7 @@ async def create_chat_completion(
             )
         
         # For non-streaming responses
-        model.configure(
+        context = model.context(
             api_key=api_key,
             model_name=request.model,
             temperature=request.temperature,
@@ -158,7 +205,10 @@ async def create_chat_completion(
         if not last_message:
             raise ValueError("No user message found")
 
-        response = await model.achat(last_message)
+        response = await model.achat(last_message, context=context)
+        prompt_tokens = count_prompt_tokens(context, last_message)
+        completion_tokens = count_tokens(response, request.model) if response != ERROR_RESPONSE else 0
+        usage_meter.record(api_key, request.model, prompt_tokens, completion_tokens)
         
         return ChatCompletionResponse(
             model=request.model,
@@ -170,7 +220,11 @@ async def create_chat_completion(
                 },
                 "finish_reason": "stop"
             }],
-            usage=Usage()
+            usage=Usage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
         )
 
     except Exception as e:
@@ -178,6 +232,15 @@ async def create_chat_completion(
             print(f"Error in chat completion: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/usage")
+async def get_usage(request: Request):
+    """Token usage of the API key by model since the server started"""
+    api_key = await verify_auth(request)
+    return {
+        "object": "usage",
+        "data": usage_meter.usage(api_key)
+    }
+
 @router.get("/models")
 async def list_models(request: Request):
     """List available models"""
@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException, Request, Depends
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from server.app.core.models.online import LangChainChat
+from server.app.api.routes import openai_compatible
 from server.app.utils.config import RAGPipeline
 from server.app.utils.prompt import SYSTEM_PROMPT, TITLE_SYSTEM_PROMPT
 import json
@@ -47,7 +48,7 @@ async def verify_auth(request: Request):
 async def get_rag_pipeline(request: Request) -> RAGPipeline:
     """Get RAG pipeline instance"""
     if not hasattr(request.app.state, 'rag_pipeline'):
-        request.app.state.rag_pipeline = RAGPipeline.get_instance()
+        request.app.state.rag_pipeline = RAGPipeline.get_instance(background=True)
     return request.app.state.rag_pipeline
 
 async def stream_generator(request: ChatRequest, rag: RAGPipeline) -> AsyncGenerator[str, None]:
@@ -55,11 +56,8 @@ async def stream_generator(request: ChatRequest, rag: RAGPipeline) -> AsyncGener
     Generate streaming chat response with RAG enhancement
     """
     try:
-        # Get RAG-enhanced prompt
-        rag_prompt = rag.get_enhanced_prompt(request.message)
-        
-        # Configure the model
-        model.configure(
+        # Pooled context of the request settings, shared by concurrent requests without modifying the model
+        context = model.context(
             base_url=request.base_url,
             api_key=request.api_key,
             model_name=request.model,
@@ -67,8 +65,11 @@ async def stream_generator(request: ChatRequest, rag: RAGPipeline) -> AsyncGener
             max_messages=request.max_messages
         )
         
+        # Get RAG-enhanced prompt, with the retrieved context within the token budget of the model
+        rag_prompt = await rag.aget_enhanced_prompt(request.message, context.budget)
+        
         # Use the RAG-enhanced prompt for chat
-        async for chunk in model.astream_chat(rag_prompt, request.session_id):
+        async for chunk in model.astream_chat(rag_prompt, request.session_id, context=context):
             if DEBUG:
                 print(f"Streaming chunk: {chunk}")
             yield f"data: {json.dumps({'text': chunk})}\n\n"
@@ -117,6 +118,24 @@ async def get_models(request: Request):
         "models": model.list_models()
     }
 
+@router.get("/api/rag/stats")
+async def get_rag_stats(
+    req: Request,
+    rag: RAGPipeline = Depends(get_rag_pipeline)
+):
+    """
+    Get hit rates of the retrieval caches, and the token usage of the OpenAI-compatible API by API key
+    """
+    await verify_auth(req)
+    return {
+        "status": "success",
+        "code": 200,
+        "stats": rag.cache_stats(),
+        "llm_clients": model.client_pool.stats(),
+        "summaries": model.summarizer.stats(),
+        "usage": openai_compatible.usage_meter.stats()
+    }
+
 @router.post("/api/generate_title")
 async def generate_title(
     request: TitleRequest,
@@ -125,8 +144,8 @@ async def generate_title(
     """Generate a title for the conversation"""
     await verify_auth(req)
     try:
-        # Configure the model for title generation
-        model.configure(
+        # Context for title generation
+        context = model.context(
             base_url=request.base_url,
             api_key=request.api_key,
             model_name=request.model,
@@ -135,7 +154,7 @@ async def generate_title(
         )
         
         # Generate title using non-streaming chat
-        title = await model.achat(request.message)
+        title = await model.achat(request.message, context=context)
         
         return {
             "status": "success",
@@ -0,0 +1,642 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple, Union, Any
+from collections import OrderedDict
+from pathlib import Path
+import argparse
+import atexit
+import json
+import multiprocessing
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+import os
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, SystemMessage, messages_from_dict, message_to_dict, messages_to_dict
+from langchain_community.chat_message_histories.file import FileChatMessageHistory
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+HISTORY_DB_FILE = "history.db"
+SUMMARY_PREFIX = "Previous conversation summary:\n"
+HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", "1024"))
+HISTORY_CACHE_BYTES = int(os.getenv("HISTORY_CACHE_BYTES", str(64 << 20)))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1.0"))
+# Server worker processes, set by run.py. The cache is per process, so it is bypassed with several workers
+SERVER_WORKERS = int(os.getenv("WORKERS", "1"))
+
+def _in_worker_process() -> bool:
+    """
+    Whether this process is one of several server workers
+
+    WORKERS is only set by run.py, uvicorn started with --workers directly spawns
+    each worker as a child process, which is detected as well.
+    """
+    return SERVER_WORKERS > 1 or multiprocessing.parent_process() is not None
+
+class HistoryBackend(ABC):
+    """
+    Storage of the chat histories of all sessions
+    """
+    @abstractmethod
+    def get_history(self, session_id: str) -> BaseChatMessageHistory:
+        """Get the history of a session"""
+        pass
+
+    def summarize(self, session_id: str, summary: SystemMessage, keep_last: int) -> List[BaseMessage]:
+        """
+        Replace all but the last messages of a session with a summary
+
+        Args:
+            session_id: Session to summarize
+            summary: Summary of the replaced messages
+            keep_last: Number of latest messages kept after the summary
+
+        Returns:
+            List[BaseMessage]: Messages of the session afterwards
+        """
+        history = self.get_history(session_id)
+        keep_messages = history.messages[-keep_last:] if keep_last else []
+        history.clear()
+        history.add_messages([summary] + keep_messages)
+        return [summary] + keep_messages
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """Delete the history of a session"""
+        pass
+
+    @abstractmethod
+    def delete_all(self):
+        """Delete the histories of all sessions"""
+        pass
+
+    @abstractmethod
+    def list_sessions(self) -> List[str]:
+        """List the sessions with a history"""
+        pass
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]):
+        """Append messages to a session"""
+        self.get_history(session_id).add_messages(list(messages))
+
+    def flush(self):
+        """Write buffered changes"""
+        pass
+
+    def close(self):
+        """Write buffered changes and release the storage"""
+        pass
+
+class FileHistoryBackend(HistoryBackend):
+    """
+    One JSON file per session, rewritten on every message
+    """
+    def __init__(self, history_dir: Union[str, Path]):
+        self.history_dir = Path(history_dir)
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_history(self, session_id: str) -> BaseChatMessageHistory:
+        return FileChatMessageHistory(str(self.history_dir / f"{session_id}.json"))
+
+    def _write(self, session_id: str, messages: List[BaseMessage]):
+        (self.history_dir / f"{session_id}.json").write_text(json.dumps(messages_to_dict(messages)))
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]):
+        # Rewrite the file once for all messages
+        self._write(session_id, self.get_history(session_id).messages + list(messages))
+
+    def summarize(self, session_id: str, summary: SystemMessage, keep_last: int) -> List[BaseMessage]:
+        messages = [summary] + (self.get_history(session_id).messages[-keep_last:] if keep_last else [])
+        self._write(session_id, messages)
+        return messages
+
+    def delete(self, session_id: str):
+        (self.history_dir / f"{session_id}.json").unlink(missing_ok=True)
+
+    def delete_all(self):
+        for file in self.history_dir.glob("*.json"):
+            file.unlink()
+
+    def list_sessions(self) -> List[str]:
+        return [f.stem for f in self.history_dir.glob("*.json")]
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """
+    Append-only history of all sessions in one SQLite database in WAL mode
+
+    Every message is one row, and a summary is a row pointing at the first message
+    kept after it, so adding a message or a summary never rewrites earlier rows.
+    A history is read from its latest summary on, through indexes on the session.
+    """
+    def __init__(self, path: Union[str, Path], timeout: float = 30.0):
+        """
+        Args:
+            path: Database file
+            timeout: Seconds to wait for a write lock held by another process
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at);
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                kind TEXT NOT NULL,
+                keep_from INTEGER,
+                message TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+            CREATE INDEX IF NOT EXISTS idx_messages_time ON messages (session_id, created_at);
+            CREATE INDEX IF NOT EXISTS idx_summaries ON messages (session_id, id) WHERE kind = 'summary';
+        """)
+
+    def get_history(self, session_id: str) -> BaseChatMessageHistory:
+        return SQLiteChatMessageHistory(self, session_id)
+
+    def _touch(self, session_id: str, now: float):
+        self._conn.execute(
+            "INSERT INTO sessions (session_id, created_at, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET updated_at = excluded.updated_at",
+            (session_id, now, now)
+        )
+
+    def _insert(self, session_id: str, now: float, kind: str, message: BaseMessage, keep_from: Optional[int] = None):
+        """
+        Insert a row, a summary without `keep_from` keeps only the messages written after it
+        """
+        cursor = self._conn.execute(
+            "INSERT INTO messages (session_id, created_at, kind, keep_from, message) VALUES (?, ?, ?, ?, ?)",
+            (session_id, now, kind, keep_from, json.dumps(message_to_dict(message), ensure_ascii=False))
+        )
+        if kind == "summary" and keep_from is None:
+            self._conn.execute("UPDATE messages SET keep_from = id WHERE id = ?", (cursor.lastrowid,))
+
+    def append(self, session_id: str,
+               messages: Sequence[BaseMessage],
+               created_at: Optional[float] = None,
+               summary: Optional[SystemMessage] = None):
+        """
+        Append messages to a session in one transaction
+
+        Args:
+            session_id: Session of the messages
+            messages: Messages to append
+            created_at: Time of the messages, now if None
+            summary: Summary written before the messages, replacing all earlier ones
+        """
+        now = time.time() if created_at is None else created_at
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._touch(session_id, now)
+                if summary is not None:
+                    self._insert(session_id, now, "summary", summary)
+                for message in messages:
+                    self._insert(session_id, now, "message", message)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def read(self, session_id: str) -> List[BaseMessage]:
+        """
+        Read the latest summary of a session and the messages kept after it
+        """
+        with self._lock:
+            summary = self._conn.execute(
+                "SELECT keep_from, message FROM messages WHERE session_id = ? AND kind = 'summary' ORDER BY id DESC LIMIT 1",
+                (session_id,)
+            ).fetchone()
+            keep_from = summary[0] if summary else 0
+            rows = self._conn.execute(
+                "SELECT message FROM messages WHERE session_id = ? AND id >= ? AND kind = 'message' ORDER BY id",
+                (session_id, keep_from)
+            ).fetchall()
+        items = ([json.loads(summary[1])] if summary else []) + [json.loads(row[0]) for row in rows]
+        return messages_from_dict(items)
+
+    def summarize(self, session_id: str, summary: SystemMessage, keep_last: int) -> List[BaseMessage]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                keep_from = None
+                if keep_last:
+                    # Messages hidden by the latest summary stay hidden
+                    current = self._conn.execute(
+                        "SELECT keep_from FROM messages WHERE session_id = ? AND kind = 'summary' ORDER BY id DESC LIMIT 1",
+                        (session_id,)
+                    ).fetchone()
+                    visible_from = current[0] if current else 0
+                    row = self._conn.execute(
+                        "SELECT id FROM messages WHERE session_id = ? AND kind = 'message' AND id >= ? "
+                        "ORDER BY id DESC LIMIT 1 OFFSET ?",
+                        (session_id, visible_from, keep_last - 1)
+                    ).fetchone()
+                    # With fewer messages than kept, all of them are kept
+                    keep_from = row[0] if row else visible_from
+                now = time.time()
+                self._touch(session_id, now)
+                self._insert(session_id, now, "summary", summary, keep_from)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.read(session_id)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_all(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM messages")
+                self._conn.execute("DELETE FROM sessions")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def list_sessions(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT session_id FROM sessions ORDER BY updated_at DESC")]
+
+    def has_session(self, session_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """
+    History of one session in a `SQLiteHistoryBackend`
+    """
+    def __init__(self, backend: SQLiteHistoryBackend, session_id: str):
+        self.backend = backend
+        self.session_id = session_id
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self.backend.read(self.session_id)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.backend.append(self.session_id, list(messages))
+
+    def clear(self) -> None:
+        self.backend.delete(self.session_id)
+
+class _HotSession:
+    """
+    Cached messages of a session and its writes not yet flushed
+    """
+    def __init__(self, messages: List[BaseMessage], has_summary: bool):
+        self.messages = messages
+        self.has_summary = has_summary
+        self.pending: List[Tuple[str, Any]] = []
+        self.size = sum(_message_size(message) for message in messages)
+
+def _message_size(message: BaseMessage) -> int:
+    content = message.content
+    return 64 + (len(content) * 2 if isinstance(content, str) else len(json.dumps(content, ensure_ascii=False)) * 2)
+
+class CachedHistoryBackend(HistoryBackend):
+    """
+    Bounded LRU cache of hot sessions in front of a history backend, with write-behind flushing
+
+    Reads of cached sessions never touch the storage. Appends and summaries update
+    the cache at once and are written to the wrapped backend in batches by a
+    background thread every `flush_interval` seconds, and on `flush` or `close`.
+    The least recently used sessions without pending writes are evicted once the
+    cache holds more than `max_sessions` sessions or `max_bytes` of messages.
+    """
+    def __init__(self,
+                 backend: HistoryBackend,
+                 max_sessions: int = HISTORY_CACHE_SESSIONS,
+                 max_bytes: int = HISTORY_CACHE_BYTES,
+                 flush_interval: float = HISTORY_FLUSH_INTERVAL):
+        """
+        Args:
+            backend: Backend storing the histories
+            max_sessions: Maximum number of cached sessions
+            max_bytes: Maximum estimated size of the cached messages
+            flush_interval: Seconds between writes of buffered changes, 0 writes through
+        """
+        self.backend = backend
+        self.max_sessions = max(max_sessions, 1)
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self._sessions: OrderedDict[str, _HotSession] = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self._thread = None
+        if flush_interval > 0:
+            self._thread = threading.Thread(target=self._flush_loop, name="history-flush", daemon=True)
+            self._thread.start()
+
+    def get_history(self, session_id: str) -> BaseChatMessageHistory:
+        return CachedChatMessageHistory(self, session_id)
+
+    def _session(self, session_id: str) -> _HotSession:
+        """
+        Get a cached session, loading it from the backend on a miss
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                self.hits += 1
+                return session
+            self.misses += 1
+            messages = self.backend.get_history(session_id).messages
+            has_summary = bool(messages) and isinstance(messages[0], SystemMessage) and \
+                str(messages[0].content).startswith(SUMMARY_PREFIX)
+            session = _HotSession(messages, has_summary)
+            self._sessions[session_id] = session
+            self._size += session.size
+            self._evict()
+            return session
+
+    def read(self, session_id: str) -> List[BaseMessage]:
+        """
+        Read the messages of a session from the cache
+        """
+        with self._lock:
+            return list(self._session(session_id).messages)
+
+    def _evict(self):
+        """
+        Drop least recently used sessions without pending writes while over the bounds
+        """
+        # The most recently used session is the one being read or written
+        for session_id in list(self._sessions)[:-1]:
+            if len(self._sessions) <= self.max_sessions and self._size <= self.max_bytes:
+                break
+            session = self._sessions[session_id]
+            if not session.pending:
+                del self._sessions[session_id]
+                self._size -= session.size
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]):
+        messages = list(messages)
+        if not messages:
+            return
+        with self._lock:
+            session = self._session(session_id)
+            session.messages.extend(messages)
+            added = sum(_message_size(message) for message in messages)
+            session.size += added
+            self._size += added
+            if session.pending and session.pending[-1][0] == "append":
+                session.pending[-1][1].extend(messages)
+            else:
+                session.pending.append(("append", messages))
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def summarize(self, session_id: str, summary: SystemMessage, keep_last: int) -> List[BaseMessage]:
+        with self._lock:
+            session = self._session(session_id)
+            body = session.messages[1:] if session.has_summary else session.messages
+            messages = [summary] + (body[-keep_last:] if keep_last else [])
+            size = sum(_message_size(message) for message in messages)
+            self._size += size - session.size
+            session.messages, session.size, session.has_summary = messages, size, True
+            session.pending.append(("summarize", (summary, keep_last)))
+        if self.flush_interval <= 0:
+            self.flush()
+        return list(messages)
+
+    def delete(self, session_id: str):
+        with self._flush_lock, self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._size -= session.size
+            self.backend.delete(session_id)
+
+    def delete_all(self):
+        with self._flush_lock, self._lock:
+            self._sessions.clear()
+            self._size = 0
+            self.backend.delete_all()
+
+    def list_sessions(self) -> List[str]:
+        with self._lock:
+            unflushed = [session_id for session_id, session in self._sessions.items() if session.pending]
+        sessions = self.backend.list_sessions()
+        return sessions + [session_id for session_id in unflushed if session_id not in set(sessions)]
+
+    def flush(self):
+        """
+        Write the pending appends and summaries of all sessions to the backend
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = [(session_id, session.pending) for session_id, session in self._sessions.items() if session.pending]
+                for session_id, _ in batch:
+                    self._sessions[session_id].pending = []
+            for i, (session_id, operations) in enumerate(batch):
+                done = 0
+                try:
+                    for operation, value in operations:
+                        if operation == "append":
+                            self.backend.append(session_id, value)
+                        else:
+                            self.backend.summarize(session_id, *value)
+                        done += 1
+                except Exception as e:
+                    print(f"[CachedHistoryBackend] Failed to flush history of session {session_id}: {e}")
+                    # Keep the unwritten operations of this and the remaining sessions for the next flush,
+                    # replaying a written append would duplicate its messages
+                    with self._lock:
+                        for failed_id, failed in [(session_id, operations[done:])] + batch[i + 1:]:
+                            session = self._sessions.get(failed_id)
+                            if session is not None:
+                                session.pending[:0] = failed
+                    return
+            if batch:
+                self.flushes += 1
+                if DEBUG:
+                    print(f"[CachedHistoryBackend] Flushed {len(batch)} sessions")
+        with self._lock:
+            self._evict()
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+        self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the size, hit rate and flush count of the cache
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._size,
+                "pending": sum(1 for session in self._sessions.values() if session.pending),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "flushes": self.flushes
+            }
+
+class CachedChatMessageHistory(BaseChatMessageHistory):
+    """
+    History of one session in a `CachedHistoryBackend`
+    """
+    def __init__(self, backend: CachedHistoryBackend, session_id: str):
+        self.backend = backend
+        self.session_id = session_id
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self.backend.read(self.session_id)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.backend.append(self.session_id, messages)
+
+    def clear(self) -> None:
+        self.backend.delete(self.session_id)
+
+# Cached backends are shared by every chat model of the process
+_shared_backends: Dict[Tuple[str, str], HistoryBackend] = {}
+_shared_lock = threading.Lock()
+
+def create_history_backend(backend: str, history_dir: Union[str, Path], cache: bool = True) -> HistoryBackend:
+    """
+    Create the history backend
+
+    Args:
+        backend: "file" for one JSON file per session, or "sqlite" for the append-only database
+        history_dir: Directory of the JSON files or the database
+        cache: Return the process-wide hot-session cache of the backend, unless
+            HISTORY_CACHE_SESSIONS is 0 or the server runs several workers, whose
+            caches would serve stale histories and reorder buffered writes
+
+    Returns:
+        HistoryBackend: History backend
+    """
+    backend = (backend or "file").lower()
+    if backend not in ("file", "sqlite"):
+        raise ValueError(f"Unsupported history backend: {backend}")
+    if cache and HISTORY_CACHE_SESSIONS > 0 and not _in_worker_process():
+        key = (backend, str(Path(history_dir).resolve()))
+        with _shared_lock:
+            if key not in _shared_backends:
+                _shared_backends[key] = CachedHistoryBackend(create_history_backend(backend, history_dir, cache=False))
+            return _shared_backends[key]
+    if backend == "sqlite":
+        return SQLiteHistoryBackend(Path(history_dir) / HISTORY_DB_FILE)
+    return FileHistoryBackend(history_dir)
+
+@atexit.register
+def close_history_backends():
+    """
+    Flush and close the shared history backends, e.g. on shutdown
+    """
+    with _shared_lock:
+        backends = list(_shared_backends.values())
+        _shared_backends.clear()
+    for backend in backends:
+        backend.close()
+
+def migrate_json_histories(history_dir: Union[str, Path],
+                           backend: SQLiteHistoryBackend,
+                           overwrite: bool = False,
+                           delete: bool = False) -> int:
+    """
+    Import the JSON history files of the file backend into a SQLite backend
+
+    A leading summary message written by the file backend becomes a summary row.
+    Sessions already in the database are skipped unless `overwrite` is set.
+
+    Args:
+        history_dir: Directory of the JSON history files
+        backend: Target backend
+        overwrite: Replace sessions already in the database
+        delete: Delete the JSON files once imported
+
+    Returns:
+        int: Number of imported sessions
+    """
+    imported = 0
+    for file in sorted(Path(history_dir).glob("*.json")):
+        session_id = file.stem
+        try:
+            messages = messages_from_dict(json.loads(file.read_text(encoding="utf-8") or "[]"))
+        except Exception as e:
+            print(f"[HistoryMigration] Skipping {file}: {e}")
+            continue
+        if backend.has_session(session_id):
+            if not overwrite:
+                continue
+            backend.delete(session_id)
+
+        summary = None
+        if messages and isinstance(messages[0], SystemMessage) and str(messages[0].content).startswith(SUMMARY_PREFIX):
+            summary, messages = messages[0], messages[1:]
+        backend.append(session_id, messages, file.stat().st_mtime, summary)
+        imported += 1
+        if delete:
+            file.unlink()
+        if DEBUG:
+            print(f"[HistoryMigration] Imported {len(messages)} messages of session {session_id}")
+    return imported
+
+def main():
+    """
+    Import the JSON chat histories into the SQLite history database
+    """
+    from server.app.core.models.online import HISTORY_DIR
+
+    parser = argparse.ArgumentParser(description="Migrate JSON chat histories to the SQLite history backend")
+    parser.add_argument("--history-dir", type=Path, default=HISTORY_DIR, help=f"Directory of the JSON histories (default: {HISTORY_DIR})")
+    parser.add_argument("--db", type=Path, default=None, help=f"SQLite database (default: <history-dir>/{HISTORY_DB_FILE})")
+    parser.add_argument("--overwrite", action="store_true", help="Replace sessions already in the database")
+    parser.add_argument("--delete", action="store_true", help="Delete the JSON files once imported")
+    args = parser.parse_args()
+
+    backend = SQLiteHistoryBackend(args.db or args.history_dir / HISTORY_DB_FILE)
+    imported = migrate_json_histories(args.history_dir, backend, args.overwrite, args.delete)
+    print(f"Imported {imported} session(s) into {backend.path}, set HISTORY_BACKEND=sqlite to use it")
+    backend.close()
+
+if __name__ == "__main__":
+    main()
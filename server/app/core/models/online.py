@@ -1,6 +1,9 @@
 import os
 import uuid
-from typing import Dict, List, Optional
+import threading
+from typing import Dict, List, Optional, Tuple, Any
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
 from dotenv import load_dotenv
 import sys
@@ -12,14 +15,15 @@ from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages import (
     BaseMessage,
     HumanMessage,
-    SystemMessage,
-    RemoveMessage
+    SystemMessage
 )
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_openai import ChatOpenAI
-from langchain_core.runnables import RunnableWithMessageHistory
-from langchain_community.chat_message_histories.file import FileChatMessageHistory
+from langchain_core.runnables import Runnable, RunnableLambda, RunnableWithMessageHistory
 from server.app.core.models.base import BaseLLM
+from server.app.core.models.history import HistoryBackend, create_history_backend, SUMMARY_PREFIX
+from server.app.core.models.summarizer import RollingSummarizer
+from server.app.utils.tokens import TokenBudget, token_budget, CHAT_TOKEN_BUDGET, REPLY_PRIMING
 from server.app.utils.prompt import SUMMARY_PROMPT, SYSTEM_PROMPT
 
 load_dotenv()
@@ -28,52 +32,65 @@ HISTORY_DIR = PROJECT_ROOT / "server" / "app" / "core" / "models" / "history"
 HISTORY_DIR.mkdir(parents=True, exist_ok=True)
 
 SUMMARY_PROMPT_TEMPLATE = SUMMARY_PROMPT
-
-class ChatState:
-    """
-    State class for managing chat history and summary
-    """
-    def __init__(self):
-        self.messages: List[BaseMessage] = []
-        self.summary: str = ""
+LLM_CLIENT_POOL_SIZE = int(os.getenv("LLM_CLIENT_POOL_SIZE", "32"))
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "file")
+# Cheaper model creating the history summaries, the chat model if empty
+SUMMARY_MODEL_NAME = os.getenv("SUMMARY_MODEL_NAME", "")
+# Answer of failed chat requests
+ERROR_RESPONSE = "Error occurred. Please try again."
 
 class ChatMessageManager:
     """
-    Manages chat message histories for different sessions using file storage
+    Manages chat message histories for different sessions in the configured history backend
     """
     def __init__(
         self, 
         history_dir: Path = HISTORY_DIR,
         max_messages: int = 6,
-        llm: Optional[ChatOpenAI] = None
+        llm: Optional[ChatOpenAI] = None,
+        backend: str = HISTORY_BACKEND
     ):
         self.history_dir = history_dir
         self.max_messages = max_messages
         self.llm = llm
-        self._histories: Dict[str, BaseChatMessageHistory] = {}
-        self._states: Dict[str, ChatState] = {}
+        # Process-wide hot-session cache shared by all managers of the same histories
+        self.backend: HistoryBackend = create_history_backend(backend, history_dir)
     
     def get_history(self, session_id: str) -> BaseChatMessageHistory:
         """
         Get or create history for a session
         """
-        if session_id not in self._histories:
-            history_file = self.history_dir / f"{session_id}.json"
-            self._histories[session_id] = FileChatMessageHistory(str(history_file))
-            self._states[session_id] = ChatState()
-        return self._histories[session_id]
+        return self.backend.get_history(session_id)
     
-    def should_summarize(self, messages: List[BaseMessage]) -> bool:
+    def should_summarize(self,
+                         messages: List[BaseMessage],
+                         max_messages: Optional[int] = None,
+                         budget: Optional[TokenBudget] = None) -> bool:
         """
-        Check if we should summarize the conversation
+        Check if we should summarize the conversation, by its history tokens with a token budget
         """
-        return len(messages) > self.max_messages
+        if budget is not None:
+            return budget.count(self._body(messages)) > budget.history
+        return len(messages) > (max_messages or self.max_messages)
+    
+    @staticmethod
+    def _body(messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Messages without the leading summary
+        """
+        if messages and isinstance(messages[0], SystemMessage) and str(messages[0].content).startswith(SUMMARY_PREFIX):
+            return messages[1:]
+        return messages
     
-    async def create_summary(self, messages: List[BaseMessage], summary_prompt: str = SUMMARY_PROMPT_TEMPLATE) -> str:
+    async def create_summary(self,
+                             messages: List[BaseMessage],
+                             summary_prompt: str = SUMMARY_PROMPT_TEMPLATE,
+                             llm: Optional[ChatOpenAI] = None) -> str:
         """
-        Create a summary of the conversation
+        Create a summary of the conversation, with the LLM of the request if given
         """
-        if not self.llm:
+        llm = llm or self.llm
+        if not llm:
             raise ValueError("LLM not initialized for summarization")
         
         conversation = "\n".join([
@@ -88,7 +105,7 @@ class ChatMessageManager:
         
         try:
             # Call LLM directly with messages
-            response = await self.llm.ainvoke(summary_messages)
+            response = await llm.ainvoke(summary_messages)
             if not response or not response.content:
                 return "No summary available"
             return response.content
@@ -96,76 +113,176 @@ class ChatMessageManager:
             print(f"Error creating summary: {e}")
             raise
     
-    async def process_messages(self, session_id: str, summary_prompt: str = SUMMARY_PROMPT_TEMPLATE) -> List[BaseMessage]:
+    async def process_messages(self,
+                               session_id: str,
+                               summary_prompt: str = SUMMARY_PROMPT_TEMPLATE,
+                               llm: Optional[ChatOpenAI] = None,
+                               max_messages: Optional[int] = None,
+                               keep_last: int = 4,
+                               raise_errors: bool = False,
+                               budget: Optional[TokenBudget] = None) -> List[BaseMessage]:
         """
-        Process messages and create summary if needed
+        Fold all but the latest messages into the rolling summary if the session is too long
+        
+        Only the previous summary and the messages it replaces are sent to the LLM.
+        Messages added while the summary is created stay after it.
+        
+        Args:
+            session_id: Session of the messages
+            summary_prompt: System prompt of the summary
+            llm: LLM of the request, the manager's LLM if None
+            max_messages: Messages kept before summarizing, the manager's limit if None
+            keep_last: Latest messages kept after the summary, 2 exchanges by default
+            raise_errors: Raise instead of returning the unchanged messages on errors
+            budget: Token budget, summarizes once the history exceeds its share and keeps
+                the latest messages within half of it instead of `keep_last`
         """
         history = self.get_history(session_id)
-        state = self._states[session_id]
         messages = history.messages
         
-        if self.should_summarize(messages):
+        if self.should_summarize(messages, max_messages, budget):
             try:
-                # Create summary
-                summary = await self.create_summary(messages, summary_prompt)
-                state.summary = summary
-                
-                # Keep only the last 2 exchanges (4 messages)
-                keep_messages = messages[-4:]
+                if budget is not None:
+                    keep_last = len(budget.window(self._body(messages), budget.total - budget.history // 2))
+                # Create summary of the previous summary and the older turns
+                folded = messages[:-keep_last] if keep_last else messages
+                if not folded:
+                    return messages
+                summary = await self.create_summary(folded, summary_prompt, llm)
                 
-                # Create remove messages for the old ones
-                remove_messages = [
-                    RemoveMessage(id=msg.id)
-                    for msg in messages[:-4]
-                ]
-                
-                # Clear the history
-                history.clear()
-                
-                # Add the summary as system message first
+                # Replace the folded messages with the summary as system message
                 summary_msg = SystemMessage(
-                    content=f"Previous conversation summary:\n{summary}"
+                    content=f"{SUMMARY_PREFIX}{summary}"
                 )
-                history.add_message(summary_msg)
-                
-                # Add back the kept messages
-                for msg in keep_messages:
-                    history.add_message(msg)
-                
-                # Update state
-                state.messages = [summary_msg] + keep_messages
-                
-                return state.messages
+                kept = len(history.messages) - len(folded)
+                return self.backend.summarize(session_id, summary_msg, keep_last=max(kept, 0))
                 
             except Exception as e:
                 print(f"Error in processing messages: {e}")
+                if raise_errors:
+                    raise
                 return messages
                 
         return messages
     
     def clear_history(self, session_id: str):
         """
-        Clear history for a specific session and remove the file
+        Clear history for a specific session and remove it from the backend
         """
-        if session_id in self._histories:
-            history_file = self.history_dir / f"{session_id}.json"
-            if history_file.exists():
-                history_file.unlink()  # Delete the file
-            del self._histories[session_id]
+        self.backend.delete(session_id)
     
     def clear_all_histories(self):
         """
-        Clear all histories and remove all history files
+        Clear all histories and remove them from the backend
         """
-        for file in self.history_dir.glob("*.json"):
-            file.unlink()
-        self._histories.clear()
+        self.backend.delete_all()
     
     def list_sessions(self) -> List[str]:
         """
         List all available session IDs
         """
-        return [f.stem for f in self.history_dir.glob("*.json")]
+        return self.backend.list_sessions()
+
+class LLMClientPool:
+    """
+    Bounded pool of chat clients keyed by endpoint, API key, model and sampling parameters
+
+    Every client owns an OpenAI client and its HTTP connection pool, so requests with
+    the same settings reuse keep-alive connections instead of constructing a client.
+    The least recently used client is dropped when the pool is full.
+    """
+    def __init__(self, max_size: int = LLM_CLIENT_POOL_SIZE):
+        """
+        Args:
+            max_size: Maximum number of pooled clients
+        """
+        self.max_size = max(max_size, 1)
+        self._clients: OrderedDict[Tuple, ChatOpenAI] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(base_url: Optional[str], api_key: Optional[str], model_name: Optional[str], **params) -> Tuple:
+        """
+        Get the pool key of a client, parameters left as None do not count
+        """
+        params = tuple(sorted(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in params.items() if value is not None
+        ))
+        return (base_url, api_key, model_name, params)
+
+    def get(self, base_url: Optional[str], api_key: Optional[str], model_name: Optional[str], **params) -> ChatOpenAI:
+        """
+        Get the pooled client for these settings, creating it on first use
+
+        Args:
+            base_url: API base URL
+            api_key: API key
+            model_name: Model name
+            **params: Sampling parameters of ChatOpenAI, e.g. temperature or max_tokens
+
+        Returns:
+            ChatOpenAI: Shared client, it must not be modified
+        """
+        key = self.key(base_url, api_key, model_name, **params)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return client
+            self.misses += 1
+
+        client = self._create_client(base_url, api_key, model_name, dict(key[3]))
+        with self._lock:
+            # Keep the client of a concurrent request for the same settings
+            client = self._clients.setdefault(key, client)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+        return client
+
+    def _create_client(self, base_url: Optional[str], api_key: Optional[str], model_name: Optional[str],
+                       params: Dict[str, Any]) -> ChatOpenAI:
+        return ChatOpenAI(
+            model=model_name,
+            base_url=base_url,
+            api_key=api_key,
+            streaming=True,
+            **params
+        )
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the size and hit rate of the pool
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._clients),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+@dataclass(frozen=True)
+class ChatContext:
+    """
+    Immutable LLM, prompts and chain of a chat request
+    """
+    llm: ChatOpenAI
+    summary_llm: ChatOpenAI
+    model_name: Optional[str]
+    system_prompt: str
+    summary_prompt: str
+    max_messages: int
+    runnable_chain: Runnable
+    budget: Optional[TokenBudget] = None
 
 class LangChainChat(BaseLLM):
     """
@@ -180,6 +297,8 @@ class LangChainChat(BaseLLM):
         summary_prompt: str = SUMMARY_PROMPT_TEMPLATE,
         history_dir: Path = HISTORY_DIR,
         max_messages: int = 6,
+        summary_model_name: str = SUMMARY_MODEL_NAME,
+        token_budget: int = CHAT_TOKEN_BUDGET,
         **kwargs
     ):
         """
@@ -192,40 +311,118 @@ class LangChainChat(BaseLLM):
             max_messages=max_messages
         )
         
-        self.llm = ChatOpenAI(
-            model=model_name,
+        # Clients and chains shared by the requests with the same settings
+        self.client_pool = LLMClientPool()
+        self._contexts: OrderedDict[Tuple, ChatContext] = OrderedDict()
+        self._contexts_lock = threading.Lock()
+        
+        # Histories are shared by all contexts, summaries use the LLM of the request
+        self.message_manager = ChatMessageManager(
+            history_dir=history_dir,
+            max_messages=max_messages
+        )
+        self.summarizer = RollingSummarizer(self.message_manager)
+        self.summary_model_name = summary_model_name
+        self.token_budget = token_budget
+        
+        self.default_context = self.context(
             base_url=base_url,
             api_key=api_key,
-            streaming=True
+            model_name=model_name,
+            system_prompt=system_prompt,
+            summary_prompt=summary_prompt,
+            max_messages=max_messages,
+            **kwargs
         )
+
+    @property
+    def llm(self) -> ChatOpenAI:
+        return self.default_context.llm
+
+    @property
+    def summary_prompt(self) -> str:
+        return self.default_context.summary_prompt
+
+    @property
+    def runnable_chain(self) -> Runnable:
+        return self.default_context.runnable_chain
+
+    def context(self,
+                base_url: str = os.getenv("OPENAI_BASE_URL"),
+                api_key: str = os.getenv("OPENAI_API_KEY"),
+                model_name: str = os.getenv("OPENAI_MODEL_NAME"),
+                system_prompt: str = SYSTEM_PROMPT,
+                summary_prompt: str = SUMMARY_PROMPT_TEMPLATE,
+                max_messages: int = 6,
+                **params) -> ChatContext:
+        """
+        Get the chat context of a request
+        
+        Contexts are immutable and pooled, so concurrent requests with different
+        settings never change each other's model, and a request with known settings
+        skips building the client, prompt and chain.
         
-        # Create the prompt template
-        self.prompt = ChatPromptTemplate.from_messages([
+        Args:
+            base_url: API base URL
+            api_key: API key
+            model_name: Model name
+            system_prompt: System prompt
+            summary_prompt: System prompt of history summaries
+            max_messages: Messages kept before summarizing
+            **params: Sampling parameters of the model, e.g. temperature or max_tokens
+        
+        Returns:
+            ChatContext: Context to pass to `achat` or `astream_chat`
+        """
+        key = (LLMClientPool.key(base_url, api_key, model_name, **params), system_prompt, summary_prompt, max_messages)
+        with self._contexts_lock:
+            context = self._contexts.get(key)
+            if context is not None:
+                self._contexts.move_to_end(key)
+                return context
+        
+        llm = self.client_pool.get(base_url, api_key, model_name, **params)
+        budget = token_budget(model_name, system_prompt, self.token_budget, params.get("max_tokens"))
+        summary_model = self.summary_model_name or model_name
+        summary_params = dict(params) if summary_model == model_name else {}
+        if budget is not None:
+            # Keep summaries within their share of the budget
+            summary_params["max_tokens"] = budget.summary
+        summary_llm = llm
+        if summary_model != model_name or summary_params != params:
+            summary_llm = self.client_pool.get(base_url, api_key, summary_model, **summary_params)
+        prompt = ChatPromptTemplate.from_messages([
             ("system", system_prompt),
             MessagesPlaceholder(variable_name="history"),
             MessagesPlaceholder(variable_name="input"),
         ])
-        
-        # Store summary prompt
-        self.summary_prompt = summary_prompt
-        
-        # Create the chain
-        self.chain = self.prompt | self.llm
-        
-        # Initialize message manager with summarization capability
-        self.message_manager = ChatMessageManager(
-            history_dir=history_dir,
+        if budget is not None:
+            # Send only the latest history that fits next to the system prompt and the input
+            prompt = RunnableLambda(lambda inputs: {
+                **inputs,
+                "history": budget.window(inputs["history"], budget.system + budget.count(inputs["input"]) + REPLY_PRIMING)
+            }) | prompt
+        context = ChatContext(
+            llm=llm,
+            summary_llm=summary_llm,
+            model_name=model_name,
+            system_prompt=system_prompt,
+            summary_prompt=summary_prompt,
             max_messages=max_messages,
-            llm=self.llm
-        )
-        
-        # Create runnable with history
-        self.runnable_chain = RunnableWithMessageHistory(
-            self.chain,
-            lambda session_id: self.message_manager.get_history(session_id),
-            input_messages_key="input",
-            history_messages_key="history"
+            runnable_chain=RunnableWithMessageHistory(
+                prompt | llm,
+                self.message_manager.get_history,
+                input_messages_key="input",
+                history_messages_key="history"
+            ),
+            budget=budget
         )
+        with self._contexts_lock:
+            context = self._contexts.setdefault(key, context)
+            self._contexts.move_to_end(key)
+            while len(self._contexts) > self.client_pool.max_size:
+                self._contexts.popitem(last=False)
+        return context
 
     def configure(self, 
                   base_url: str = os.getenv("OPENAI_BASE_URL"),
@@ -236,75 +433,74 @@ class LangChainChat(BaseLLM):
                   history_dir: Path = HISTORY_DIR,
                   max_messages: int = 6,
                   **kwargs):
-        """Configure the model"""
-        self.base_url = base_url
-        self.api_key = api_key
-        self.model_name = model_name
-        self.system_prompt = system_prompt
-        self.summary_prompt = summary_prompt
-        self.history_dir = history_dir
-        self.max_messages = max_messages
+        """
+        Configure the default context of requests without one
         
-        # Update LLM configuration
-        self.llm = ChatOpenAI(
-            model=model_name,
+        Shared servers should pass a context per request instead, the default is
+        replaced at once but is used by every request without a context.
+        """
+        if Path(history_dir) != Path(self.message_manager.history_dir):
+            self.message_manager = ChatMessageManager(history_dir=history_dir, max_messages=max_messages)
+            self.summarizer = RollingSummarizer(self.message_manager, self.summarizer.concurrency)
+            with self._contexts_lock:
+                self._contexts.clear()
+        self.default_context = self.context(
             base_url=base_url,
             api_key=api_key,
-            streaming=True
-        )
-        
-        # Update prompt template with new system prompt
-        self.prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            MessagesPlaceholder(variable_name="history"),
-            MessagesPlaceholder(variable_name="input"),
-        ])
-        
-        # Update the chain with new prompt and llm
-        self.chain = self.prompt | self.llm
-        
-        # Update runnable chain
-        self.runnable_chain = RunnableWithMessageHistory(
-            self.chain,
-            lambda session_id: self.message_manager.get_history(session_id),
-            input_messages_key="input",
-            history_messages_key="history"
-        )
-        
-        # Update message manager
-        self.message_manager = ChatMessageManager(
-            history_dir=history_dir,
+            model_name=model_name,
+            system_prompt=system_prompt,
+            summary_prompt=summary_prompt,
             max_messages=max_messages,
-            llm=self.llm
+            **kwargs
         )
+        self.model_name = model_name
+        self.system_prompt = system_prompt
+        self.history_dir = history_dir
+        self.max_messages = max_messages
 
     async def achat(
         self,
         message: str,
         session_id: Optional[str] = None,
+        context: Optional[ChatContext] = None,
         **kwargs
     ) -> str:
-        """Async chat with summary support"""
+        """Async chat with summary support, in the given context or the default one"""
+        # A generated session is never continued, so it is not summarized
+        summarize = session_id is not None
         if session_id is None:
             session_id = str(uuid.uuid4())
             
+        context = context or self.default_context
         config = {"configurable": {"session_id": session_id}}
         messages = [HumanMessage(content=message)]
         
         try:
-            # Process messages and get summary if needed
-            await self.message_manager.process_messages(session_id, self.summary_prompt)
+            # Summarize before answering only without background summaries
+            if self.summarizer.inline:
+                await self.message_manager.process_messages(
+                    session_id, context.summary_prompt, context.summary_llm, context.max_messages, budget=context.budget
+                )
             
             # Get response using the configured chain
-            response = await self.runnable_chain.ainvoke(
+            response = await context.runnable_chain.ainvoke(
                 {"input": messages},
                 config,
                 **kwargs
             )
+            if summarize:
+                self._schedule_summary(session_id, context)
             return response.content
         except Exception as e:
             print(f"Error in chat completion: {e}")
-            return "Error occurred. Please try again."
+            return ERROR_RESPONSE
+
+    def _schedule_summary(self, session_id: str, context: ChatContext):
+        """
+        Fold older turns into the rolling summary in the background once the response is complete
+        """
+        if not self.summarizer.inline:
+            self.summarizer.schedule(session_id, context.summary_prompt, context.summary_llm, context.max_messages, context.budget)
 
     def chat(
         self,
@@ -316,36 +512,51 @@ class LangChainChat(BaseLLM):
         Synchronous wrapper for achat
         """
         import asyncio
-        return asyncio.run(self.achat(message, session_id, **kwargs))
+        
+        async def chat_and_summarize():
+            # The event loop ends with the call, so wait for the summary
+            response = await self.achat(message, session_id, **kwargs)
+            await self.summarizer.join()
+            return response
+        
+        return asyncio.run(chat_and_summarize())
 
     async def astream_chat(
         self,
         message: str,
         session_id: Optional[str] = None,
+        context: Optional[ChatContext] = None,
         **kwargs
     ):
-        """Async streaming chat with summary support"""
+        """Async streaming chat with summary support, in the given context or the default one"""
+        summarize = session_id is not None
         if session_id is None:
             session_id = str(uuid.uuid4())
             
+        context = context or self.default_context
         config = {"configurable": {"session_id": session_id}}
         messages = [HumanMessage(content=message)]
         
         try:
-            # Process messages and get summary if needed
-            await self.message_manager.process_messages(session_id, self.summary_prompt)
+            # Summarize before answering only without background summaries
+            if self.summarizer.inline:
+                await self.message_manager.process_messages(
+                    session_id, context.summary_prompt, context.summary_llm, context.max_messages, budget=context.budget
+                )
             
             # Stream response using the configured chain
-            async for chunk in self.runnable_chain.astream(
+            async for chunk in context.runnable_chain.astream(
                 {"input": messages},
                 config,
                 **kwargs
             ):
                 if chunk.content:
                     yield chunk.content
+            if summarize:
+                self._schedule_summary(session_id, context)
         except Exception as e:
             print(f"Error in streaming chat: {e}")
-            yield "Error occurred. Please try again."
+            yield ERROR_RESPONSE
 
     def stream_chat(
         self,
@@ -0,0 +1,106 @@
+from typing import Dict, Any, Optional, Tuple
+import asyncio
+from dotenv import load_dotenv
+import os
+from server.app.utils.tokens import TokenBudget
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "2"))
+
+class RollingSummarizer:
+    """
+    Background queue folding the older turns of long sessions into a rolling summary
+
+    A summary is scheduled after a response completes, so it never delays an answer:
+    the next request of the session simply reads the latest summary. Every session
+    has at most one summary in progress, and at most `concurrency` summaries call
+    the LLM at once. With a concurrency of 0 the summary is created before answering.
+    """
+    def __init__(self, manager, concurrency: int = SUMMARY_CONCURRENCY):
+        """
+        Args:
+            manager: ChatMessageManager of the summarized histories
+            concurrency: Maximum number of summaries created at once, 0 summarizes inline
+        """
+        self.manager = manager
+        self.concurrency = max(concurrency, 0)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+        self.scheduled = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def inline(self) -> bool:
+        return self.concurrency == 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """
+        Get the semaphore of the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore[0] is not loop:
+            self._semaphore = (loop, asyncio.Semaphore(self.concurrency))
+        return self._semaphore[1]
+
+    def schedule(self, session_id: str, summary_prompt: str, llm, max_messages: int,
+                 budget: Optional[TokenBudget] = None) -> Optional[asyncio.Task]:
+        """
+        Summarize a session in the background if it exceeds `max_messages`, or the history share of its token budget
+
+        Args:
+            session_id: Session to summarize
+            summary_prompt: System prompt of the summary
+            llm: LLM creating the summary
+            max_messages: Messages kept before summarizing
+            budget: Token budget of the chat, summarizing by history tokens instead of messages
+
+        Returns:
+            Optional[asyncio.Task]: Summary task of the session, None if it needs none
+        """
+        task = self._tasks.get(session_id)
+        if task is not None and not task.done():
+            return task
+        messages = self.manager.get_history(session_id).messages
+        if not self.manager.should_summarize(messages, max_messages, budget):
+            return None
+
+        task = asyncio.get_running_loop().create_task(self._run(session_id, summary_prompt, llm, max_messages, budget))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None) if self._tasks.get(session_id) is task else None)
+        self.scheduled += 1
+        return task
+
+    async def _run(self, session_id: str, summary_prompt: str, llm, max_messages: int, budget: Optional[TokenBudget]):
+        async with self._get_semaphore():
+            try:
+                await self.manager.process_messages(session_id, summary_prompt, llm, max_messages, raise_errors=True, budget=budget)
+                self.completed += 1
+                if DEBUG:
+                    print(f"[RollingSummarizer] Summarized session {session_id}")
+            except Exception as e:
+                self.failed += 1
+                print(f"[RollingSummarizer] Failed to summarize session {session_id}: {e}")
+
+    async def join(self):
+        """
+        Wait for the scheduled summaries of the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        tasks = [task for task in self._tasks.values() if task.get_loop() is loop]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the counts of scheduled, running, completed and failed summaries
+        """
+        return {
+            "concurrency": self.concurrency,
+            "scheduled": self.scheduled,
+            "running": sum(1 for task in self._tasks.values() if not task.done()),
+            "completed": self.completed,
+            "failed": self.failed
+        }
@@ -0,0 +1,235 @@
+from typing import Dict, Any, Optional, Tuple, List
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+import unicodedata
+import numpy as np
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a query for cache lookups: Unicode NFKC, case folding and collapsed whitespace
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with optional TTL and hit/miss counters
+    """
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_size: Maximum number of entries
+            ttl: Seconds an entry stays valid, None keeps entries until evicted
+        """
+        self.max_size = max(1, max_size)
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Any, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Any, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+class QueryEmbeddingCache(LRUCache):
+    """
+    Cache of query embeddings keyed by normalized query text and model name
+    """
+    def get_vector(self, query: str, model: str) -> Optional[np.ndarray]:
+        """
+        Get the cached embedding of a query
+
+        Returns:
+            Optional[np.ndarray]: Read-only float32 vector, None on a miss
+        """
+        return self.get((model, normalize_query(query)))
+
+    def put_vector(self, query: str, model: str, vector) -> np.ndarray:
+        """
+        Cache the embedding of a query
+
+        Returns:
+            np.ndarray: The stored read-only float32 vector
+        """
+        array = np.array(vector, dtype=np.float32)
+        array.setflags(write=False)
+        self.put((model, normalize_query(query)), array)
+        return array
+
+class RerankScoreCache(LRUCache):
+    """
+    Cache of reranking relevance scores keyed by (normalized query hash, chunk content hash, model)
+    """
+    @staticmethod
+    def _key(query: str, content: str, model: Optional[str]) -> Tuple[str, str, str]:
+        query_hash = hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+        content_hash = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        return (str(model), query_hash, content_hash)
+
+    def get_score(self, query: str, content: str, model: Optional[str]) -> Optional[float]:
+        return self.get(self._key(query, content, model))
+
+    def put_score(self, query: str, content: str, model: Optional[str], score: float):
+        self.put(self._key(query, content, model), score)
+
+class SemanticCache:
+    """
+    Cache of retrieval results looked up by query embedding similarity
+
+    A lookup hits when a cached query embedding has a cosine similarity of at least
+    `threshold` with the new query and was stored for the same index version. Entries
+    of an older index version are dropped as soon as a newer version is seen.
+    """
+    def __init__(self, max_size: int = 512, threshold: float = 0.95):
+        """
+        Initialize the cache
+
+        Args:
+            max_size: Maximum number of entries, the oldest entry is replaced first
+            threshold: Minimum cosine similarity for a hit
+        """
+        self.max_size = max(1, max_size)
+        self.threshold = threshold
+        self.version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._values: List[Any] = [None] * self.max_size
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        array = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(array))
+        return array / norm if norm > 0 else None
+
+    def lookup(self, vector, version: Optional[str]) -> Optional[Any]:
+        """
+        Get the cached value of the most similar query
+
+        Args:
+            vector: Query embedding
+            version: Current index version
+
+        Returns:
+            Optional[Any]: Cached value, None on a miss
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            if query is None or self._size == 0 or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            similarities = self._vectors[:self._size] @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if DEBUG:
+                print(f"[SemanticCache] Hit with similarity {similarities[best]:.4f}")
+            return self._values[best]
+
+    def store(self, vector, version: Optional[str], value: Any):
+        """
+        Cache a value for a query embedding
+
+        Args:
+            vector: Query embedding
+            version: Index version the value was computed with
+            value: Value to cache
+        """
+        query = self._normalize(vector)
+        if query is None:
+            return
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self._vectors = np.zeros((self.max_size, query.shape[0]), dtype=np.float32)
+                self._size = 0
+                self._next = 0
+            self._vectors[self._next] = query
+            self._values[self._next] = value
+            self._next = (self._next + 1) % self.max_size
+            self._size = min(self._size + 1, self.max_size)
+
+    def _reset(self, version: Optional[str]):
+        self.version = version
+        self._values = [None] * self.max_size
+        self._size = 0
+        self._next = 0
+
+    def clear(self, version: Optional[str] = None):
+        """
+        Drop all entries, e.g. after the knowledge base was reindexed
+        """
+        with self._lock:
+            self._reset(version)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters
+        """
+        total = self.hits + self.misses
+        return {
+            "size": self._size,
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -1,11 +1,15 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Union, Iterator, Optional, Tuple
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import json
+import time
 from datasets import load_dataset
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from server.app.core.rag.splitter import RecursiveSplitter, split_on_separators, find_overlap
 from langchain.schema import Document
-from ...utils.config import PROJECT_ROOT
+from server.app.core.rag.manifest import source_key
 from dotenv import load_dotenv
 import os
 load_dotenv()
@@ -45,12 +49,10 @@ class TextSplitter:
         """
         Set the chunk size, overlap, and separators.
         """
-        self.splitter = RecursiveCharacterTextSplitter(
+        self.splitter = RecursiveSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
-            separators=separators,
-            keep_separator=False,
-            is_separator_regex=False
+            separators=separators
         )
         
     def split(self, text: str, metadata: Dict[str, Any] = {}) -> List[Document]:
@@ -64,27 +66,30 @@ class TextSplitter:
         Returns:
             List[Document]: The list of chunks.
         """
-        chunks = [text]
-        if self.special_separators:
-            for separator in self.special_separators:
-                new_chunks = []
-                for chunk in chunks:
-                    new_chunks.extend(chunk.split(separator))
-                chunks = new_chunks
+        return list(self.iter_split(text, metadata))
+
+    def iter_split(self, text: str, metadata: Dict[str, Any] = {}) -> Iterator[Document]:
+        """
+        Split the text into chunks lazily.
+
+        Args:
+            text (str): The text to split.
+            metadata (Dict[str, Any]): The metadata of the text.
+
+        Yields:
+            Document: The chunks.
+        """
+        chunks = split_on_separators(text, self.special_separators) if self.special_separators else [text]
 
-        documents = []
         for chunk in chunks:
             if not chunk.strip():
                 continue
                 
             if len(chunk) > self.chunk_size:
-                sub_chunks = self.splitter.split_text(chunk)
-                documents.extend([Document(page_content=sub_chunk, metadata=metadata) 
-                               for sub_chunk in sub_chunks])
+                for sub_chunk in self.splitter.split_text(chunk):
+                    yield Document(page_content=sub_chunk, metadata=metadata)
             else:
-                documents.append(Document(page_content=chunk.strip(), metadata=metadata))
-                
-        return documents
+                yield Document(page_content=chunk.strip(), metadata=metadata)
 
     def print_split_result(self, documents: List[Document]):
         """
@@ -120,11 +125,7 @@ class TextSplitter:
         Returns:
             str: The overlap between the two texts.
         """
-        min_length = min(len(text1), len(text2))
-        for i in range(min_length, 0, -1):
-            if text1[-i:] == text2[:i]:
-                return text1[-i:]
-        return ""
+        return find_overlap(text1, text2)
 
 class BaseDocumentLoader(ABC):
     def __init__(self, chunk_size: int = 200, chunk_overlap: int = 50, separators: List[str] = None):
@@ -133,12 +134,21 @@ class BaseDocumentLoader(ABC):
     @abstractmethod
     def load(self, source: Union[str, Path], title: str = None) -> List[Document]:
         pass
+    
+    def iter_load(self, source: Union[str, Path], title: str = None) -> Iterator[Document]:
+        """
+        Load the chunks of a source lazily, loaders that can stream override this
+        """
+        yield from self.load(source, title)
 
 class TextFileLoader(BaseDocumentLoader):
     """
     Handle text file
     """
     def load(self, source: Union[str, Path], title: str = None) -> List[Document]:
+        return list(self.iter_load(source, title))
+    
+    def iter_load(self, source: Union[str, Path], title: str = None) -> Iterator[Document]:
         source_path = Path(source)
         if not source_path.exists():
             raise FileNotFoundError(f"File not found: {source_path}")
@@ -153,35 +163,163 @@ class TextFileLoader(BaseDocumentLoader):
             "chunk_overlap": self.splitter.chunk_overlap,
             "separators": self.splitter.special_separators
         }
-        return self.splitter.split(text, metadata)
+        yield from self.splitter.iter_split(text, metadata)
+
+def is_json_array(source: Union[str, Path]) -> bool:
+    """
+    Check whether a JSON file holds an array rather than JSON lines
+    """
+    with Path(source).open('r', encoding='utf-8') as f:
+        while True:
+            block = f.read(4096)
+            if not block:
+                return False
+            stripped = block.lstrip("\ufeff \t\r\n")
+            if stripped:
+                return stripped.startswith("[")
+
+def iter_jsonl_range(source: Union[str, Path], start: int, end: int) -> Iterator[Any]:
+    """
+    Stream the JSONL records whose line starts within a byte range
+
+    Adjacent ranges never share or split a line, so a file can be cut at any
+    byte offsets and processed in parallel.
+
+    Args:
+        source: File path
+        start: First byte of the range
+        end: Byte after the range
+    """
+    source_path = Path(source)
+    with source_path.open('rb') as f:
+        if start > 0:
+            # Skip the line running into the range, the previous range owns it
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line_start = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            line = line.decode('utf-8').strip().lstrip("\ufeff")
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Error parsing line at byte {line_start} of JSONL file {source_path}: {e}")
+
+def iter_json_records(source: Union[str, Path],
+                      block_size: int = 1 << 20,
+                      byte_range: Optional[Tuple[int, int]] = None) -> Iterator[Any]:
+    """
+    Stream the records of a JSONL file or of a JSON array file
+
+    JSONL is read line by line. A JSON array is decoded one element at a time from a
+    sliding buffer, so memory stays bounded by the largest record, not the file.
+
+    Args:
+        source: File path
+        block_size: Characters read at a time from a JSON array file
+        byte_range: Only read the JSONL lines starting in this (start, end) byte range
+
+    Yields:
+        Any: Decoded records
+    """
+    source_path = Path(source)
+    if byte_range is not None:
+        yield from iter_jsonl_range(source_path, *byte_range)
+        return
+    with source_path.open('r', encoding='utf-8') as f:
+        first = f.read(block_size)
+        stripped = first.lstrip("\ufeff \t\r\n")
+        if not stripped.startswith("["):
+            # JSONL: rewind and parse line by line
+            f.seek(0)
+            for line_number, line in enumerate(f, 1):
+                line = line.strip().lstrip("\ufeff")
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Error parsing line {line_number} of JSONL file {source_path}: {e}")
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = stripped
+        pos = 1
+        while True:
+            # Skip separators between elements, reading more when the buffer runs out
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                buffer = f.read(block_size)
+                pos = 0
+                if not buffer:
+                    raise ValueError(f"Unterminated JSON array: {source_path}")
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The element is cut off, grow the buffer geometrically and retry
+                more = f.read(max(block_size, len(buffer)))
+                if not more:
+                    print(f"Error parsing JSON file: {source_path}")
+                    raise
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            yield record
+            pos = end
+            if pos >= block_size:
+                buffer = buffer[pos:]
+                pos = 0
 
 class JsonlLoader(BaseDocumentLoader):
     """
-    Handle JSON and JSONL file
+    Handle JSON and JSONL file of Q&A records ({"Q": ..., "A": ...})
+
+    Records are streamed and every record is chunked on its own, so Q&A pairs are
+    never merged into one chunk and memory does not grow with the file size.
     """
     def load(self, source: Union[str, Path], title: str = None) -> List[Document]:
+        return list(self.iter_load(source, title))
+    
+    def iter_load(self,
+                  source: Union[str, Path],
+                  title: str = None,
+                  byte_range: Optional[Tuple[int, int]] = None) -> Iterator[Document]:
+        """
+        Args:
+            source: File path
+            title: Source title
+            byte_range: Only load the JSONL lines starting in this byte range,
+                record numbers then count from the start of the range
+        """
+        self.records_loaded = 0
         source_path = Path(source)
+        if not source_path.exists():
+            raise FileNotFoundError(f"File not found: {source_path}")
         
-        with source_path.open('r', encoding='utf-8') as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError as e:
-                print(f"Error parsing JSONL file: {source_path}")
-                raise e
-            
-            text = ""
-            for i, line in enumerate(data, 1):
-                text += "<Question>: " + line["Q"] + "\n<Answer>: " + line["A"] + "\n<Q&A Break>"
-                metadata = {
-                    "source": str(source_path),
-                    "type": "jsonl",
-                    "title": title or source_path.name,
-                    "chunk_size": self.splitter.chunk_size,
-                    "chunk_overlap": self.splitter.chunk_overlap,
-                    "separators": self.splitter.special_separators
-                }
-                
-            return self.splitter.split(text, metadata)
+        base_metadata = {
+            "source": str(source_path),
+            "type": "jsonl",
+            "title": title or source_path.name,
+            "chunk_size": self.splitter.chunk_size,
+            "chunk_overlap": self.splitter.chunk_overlap,
+            "separators": self.splitter.special_separators
+        }
+        for i, record in enumerate(iter_json_records(source_path, byte_range=byte_range), 1):
+            self.records_loaded = i
+            if not isinstance(record, dict) or "Q" not in record or "A" not in record:
+                print(f"Skipping record {i} without Q&A fields in {source_path}")
+                continue
+            text = "<Question>: " + record["Q"] + "\n<Answer>: " + record["A"]
+            metadata = {**base_metadata, "record": i, "question": record["Q"]}
+            yield from self.splitter.iter_split(text, metadata)
     
 
 class HuggingFaceLoader(BaseDocumentLoader):
@@ -190,9 +328,11 @@ class HuggingFaceLoader(BaseDocumentLoader):
     TODO: May be removed in the future since different datasets with different formats, can not be unified.
     """
     def load(self, source: str, title: str = None) -> List[Document]:
+        return list(self.iter_load(source, title))
+    
+    def iter_load(self, source: str, title: str = None) -> Iterator[Document]:
         try:
             dataset = load_dataset(source)
-            documents = []
             
             for split in dataset.keys():
                 for idx, item in enumerate(dataset[split]):
@@ -209,11 +349,11 @@ class HuggingFaceLoader(BaseDocumentLoader):
                             "separators": self.splitter.special_separators,
                             **item
                         }
-                        documents.extend(self.splitter.split(text, metadata))
+                        chunks = self.splitter.split(text, metadata)
                     except Exception as e:
                         print(f"Error processing item {idx} in split {split}: {e}")
-            
-            return documents
+                        continue
+                    yield from chunks
         except Exception as e:
             raise ValueError(f"Failed to load dataset {source}: {e}")
 
@@ -231,10 +371,37 @@ class DocumentLoader:
             
         return loaders[source_type](chunk_size, chunk_overlap, separators)
 
+def _preprocess_part(source: Dict[str, Any], path: str, byte_range: Optional[Tuple[int, int]]) -> Tuple[List[Document], int, float]:
+    """
+    Load and split one part of a data source in a worker process
+
+    Returns:
+        Tuple[List[Document], int, float]: Chunks, number of records read and seconds spent
+    """
+    started = time.perf_counter()
+    loader = DataPreprocessor.create_source_loader(source)
+    if byte_range is not None:
+        documents = list(loader.iter_load(path, source.get("title", "unknown"), byte_range=byte_range))
+    else:
+        documents = list(loader.iter_load(path, source.get("title", "unknown")))
+    return documents, getattr(loader, "records_loaded", 0), time.perf_counter() - started
+
 class DataPreprocessor:
-    def __init__(self):
+    def __init__(self,
+                 workers: int = int(os.getenv("PREPROCESS_WORKERS", "0")),
+                 part_bytes: int = int(os.getenv("PREPROCESS_PART_BYTES", str(64 << 20)))):
+        """
+        Initialize the data preprocessor
+
+        Args:
+            workers: Worker processes loading and splitting sources in parallel, 0 or 1 works serially
+            part_bytes: JSONL files larger than this are split into byte ranges processed in parallel
+        """
         self.splitter = TextSplitter()
         self.loader = DocumentLoader()
+        self.workers = workers
+        self.part_bytes = max(1, part_bytes)
+        self.timings: Dict[str, Dict[str, Any]] = {}
     
     def process(self, config_path: Union[str, Path]) -> List[Document]:
         """
@@ -266,19 +433,55 @@ class DataPreprocessor:
         Returns:
             List[Document]: Processed document list
         """
-        
+        return list(self.iter_documents(config_path))
+
+    def iter_documents(self, config_path: Union[str, Path]) -> Iterator[Document]:
+        """
+        Process data source configuration file lazily, see `process`
+
+        Yields:
+            Document: Processed documents, source by source
+        """
+        sources = [(source, self.source_path(source)) for source in self.load_config(config_path)]
+        for _, documents in self.iter_sources(sources):
+            yield from documents
+
+    def load_config(self, config_path: Union[str, Path]) -> List[Dict[str, Any]]:
+        """
+        Load the data source configuration file
+
+        Args:
+            config_path: Data source configuration file path
+
+        Returns:
+            List[Dict[str, Any]]: Data source configurations
+        """
         with open(config_path, 'r', encoding='utf-8') as f:
             config = json.load(f)
         
         if not isinstance(config, list):
             raise ValueError("Data source configuration file loads error")
-        
-        documents = []
-        for source in config:
-            data_path = PROJECT_ROOT / "server" / "data" / "raw"
-            path = data_path / source["filename"]
-            documents.extend(self.process_single_source(source, path))
-        return documents
+        return config
+
+    def source_path(self, source: Dict[str, Any]) -> Path:
+        """
+        Get the raw data path of a data source
+        """
+        from server.app.utils.config import PROJECT_ROOT
+        data_path = PROJECT_ROOT / "server" / "data" / "raw"
+        return data_path / source["filename"]
+
+    @staticmethod
+    def create_source_loader(source: Dict[str, Any]) -> BaseDocumentLoader:
+        """
+        Create the loader configured for a data source
+        """
+        return DocumentLoader.create_loader(
+            source["type"], 
+            source.get("chunk_size", 200), 
+            source.get("chunk_overlap", 50), 
+            source.get("separators", None)
+        )
 
     def process_single_source(self, source: Dict[str, Any], path: Union[str, Path]) -> List[Document]:
         """
@@ -291,16 +494,139 @@ class DataPreprocessor:
         Returns:
             List[Document]: Processed document list
         """
+        return list(self.iter_source(source, path))
+
+    def iter_source(self, source: Dict[str, Any], path: Union[str, Path]) -> Iterator[Document]:
+        """
+        Process a single data source lazily
+
+        Args:
+            source: Data source configuration
+            path: Data source path
+
+        Yields:
+            Document: Processed documents
+        """
         if DEBUG:   
             print(f"\n[DataPreprocessor] Deal the source: {path}")
             print(f"[DataPreprocessor] Source config: {source}")
         
-        loader = self.loader.create_loader(
-            source["type"], 
-            source.get("chunk_size", 200), 
-            source.get("chunk_overlap", 50), 
-            source.get("separators", None)
-        )
-        documents = loader.load(path, source.get("title", "unknown"))
+        loader = self.create_source_loader(source)
+        yield from loader.iter_load(path, source.get("title", "unknown"))
+
+    def iter_sources(self, sources: List[Tuple[Dict[str, Any], Path]]) -> Iterator[Tuple[Dict[str, Any], Iterator[Document]]]:
+        """
+        Process several data sources, in parallel when workers are configured
+
+        Chunks are always returned in source order and, within a source, in file
+        order, so the result does not depend on the number of workers. The time
+        spent on every source is recorded in `timings`.
+
+        Args:
+            sources: (source configuration, path) pairs
+
+        Yields:
+            Tuple[Dict[str, Any], Iterator[Document]]: Every source with its chunks,
+            which are discarded if not consumed before the next source
+        """
+        self.timings = {}
+        if self.workers <= 1:
+            for source, path in sources:
+                documents = self._timed(source, self.iter_source(source, path))
+                yield source, documents
+                for _ in documents:
+                    pass
+            return
+        yield from self._iter_sources_parallel(sources)
+
+    def _timed(self, source: Dict[str, Any], documents: Iterator[Document]) -> Iterator[Document]:
+        """
+        Record the time spent producing the chunks of a source
+        """
+        timing = {"parts": 1, "chunks": 0, "seconds": 0.0, "wall_seconds": 0.0}
+        self.timings[source_key(source)] = timing
+        started = time.perf_counter()
+        iterator = iter(documents)
+        while True:
+            step = time.perf_counter()
+            try:
+                document = next(iterator)
+            except StopIteration:
+                timing["seconds"] += time.perf_counter() - step
+                break
+            timing["seconds"] += time.perf_counter() - step
+            timing["chunks"] += 1
+            yield document
+        timing["wall_seconds"] = time.perf_counter() - started
+        self._print_timing(source)
+
+    def _print_timing(self, source: Dict[str, Any]):
+        key = source_key(source)
+        timing = self.timings[key]
+        print(f"[DataPreprocessor] {key}: {timing['chunks']} chunks from {timing['parts']} part(s), "
+              f"{timing['seconds']:.2f}s processing, {timing['wall_seconds']:.2f}s elapsed")
+
+    def _plan_parts(self, source: Dict[str, Any], path: Path) -> List[Optional[Tuple[int, int]]]:
+        """
+        Split large JSONL files into byte ranges, other sources are processed whole
+        """
+        path = Path(path)
+        if source.get("type") != "jsonl" or not path.is_file():
+            return [None]
+        size = path.stat().st_size
+        if size <= self.part_bytes or is_json_array(path):
+            return [None]
+        return [(start, min(start + self.part_bytes, size)) for start in range(0, size, self.part_bytes)]
+
+    def _iter_sources_parallel(self, sources: List[Tuple[Dict[str, Any], Path]]) -> Iterator[Tuple[Dict[str, Any], Iterator[Document]]]:
+        """
+        Process source parts on a process pool, at most two parts per worker ahead of the consumer
+        """
+        parts = iter([
+            (index, byte_range)
+            for index, (source, path) in enumerate(sources)
+            for byte_range in self._plan_parts(source, path)
+        ])
+        pending = deque()
         
-        return documents
+        # Spawned workers do not inherit the threads of the server process
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            def fill():
+                while len(pending) < self.workers * 2:
+                    part = next(parts, None)
+                    if part is None:
+                        return
+                    index, byte_range = part
+                    source, path = sources[index]
+                    pending.append((index, pool.submit(_preprocess_part, source, str(path), byte_range)))
+            
+            def source_documents(index: int) -> Iterator[Document]:
+                source = sources[index][0]
+                timing = {"parts": 0, "chunks": 0, "seconds": 0.0, "wall_seconds": 0.0}
+                self.timings[source_key(source)] = timing
+                started = time.perf_counter()
+                record_offset = 0
+                while pending and pending[0][0] == index:
+                    documents, records, seconds = pending.popleft()[1].result()
+                    fill()
+                    if record_offset:
+                        # Record numbers of a byte range count from the start of the range
+                        documents = [
+                            Document(page_content=doc.page_content, metadata={**doc.metadata, "record": doc.metadata["record"] + record_offset})
+                            if "record" in doc.metadata else doc
+                            for doc in documents
+                        ]
+                    record_offset += records
+                    timing["parts"] += 1
+                    timing["chunks"] += len(documents)
+                    timing["seconds"] += seconds
+                    yield from documents
+                timing["wall_seconds"] = time.perf_counter() - started
+                self._print_timing(source)
+            
+            fill()
+            for index, (source, _) in enumerate(sources):
+                documents = source_documents(index)
+                yield source, documents
+                for _ in documents:
+                    pass
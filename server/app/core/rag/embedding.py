@@ -1,24 +1,58 @@
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Union, Iterator, Iterable, Tuple, Optional
 from pathlib import Path
-import json
 import time
+import asyncio
 import requests
-import numpy as np
+import httpx
 from langchain.schema import Document
 from dotenv import load_dotenv
 import os
 from server.app.utils.config import PROJECT_ROOT
+from server.app.core.rag.manifest import chunk_id
+from server.app.core.rag.cache import QueryEmbeddingCache
+from server.app.core.rag.snapshot import EmbeddingSnapshot
+from server.app.utils.http import AsyncHTTPClient
+from server.app.utils.tokens import estimate_tokens
 
 load_dotenv()
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
+class EmbeddingAPIError(Exception):
+    """
+    Error response of the embedding API
+    """
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def throttled(self) -> bool:
+        """
+        Whether the provider asked us to slow down (429, 5xx or Retry-After)
+        """
+        return self.retry_after is not None or self.status_code == 429 or (self.status_code or 0) >= 500
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header given in seconds
+    """
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
 class EmbeddingService:
     def __init__(self, 
                  base_url: str = os.getenv("EMBEDDING_BASE_URL"),
                  api_key: str = os.getenv("EMBEDDING_API_KEY"),
                  model_name: str = os.getenv("EMBEDDING_MODEL_NAME", "BAAI/bge-large-zh-v1.5"),
                  max_retries: int = 3,
-                 retry_delay: int = 1):
+                 retry_delay: int = 1,
+                 batch_size: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+                 batch_max_tokens: int = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "8192")),
+                 query_cache_size: int = int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+                 query_cache_ttl: float = float(os.getenv("QUERY_CACHE_TTL", "3600"))):
         """
         Initialize the Embedding service
         
@@ -28,34 +62,56 @@ class EmbeddingService:
             model_name: Model name
             max_retries: Maximum retries
             retry_delay: Retry delay (seconds)
+            batch_size: Maximum number of texts per embedding request, 1 disables batching
+            batch_max_tokens: Maximum estimated tokens per embedding request
+            query_cache_size: Maximum number of cached query embeddings, 0 disables the cache
+            query_cache_ttl: Seconds a cached query embedding stays valid, 0 never expires
         """
         self.base_url = base_url
         self.api_key = api_key
         self.model = model_name
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.batch_size = max(1, batch_size)
+        self.batch_max_tokens = max(1, batch_max_tokens)
+        self._http = AsyncHTTPClient()
+        self._snapshot: Optional[EmbeddingSnapshot] = None
+        self.query_cache = QueryEmbeddingCache(query_cache_size, query_cache_ttl) if query_cache_size > 0 else None
         
         if not all([self.base_url, self.api_key, self.model]):
             raise ValueError("Missing required configuration. Please check your .env file.")
 
-    def _get_embedding(self, text: str) -> List[float]:
-        """
-        Get the embedding vector of a single text using API
-        """
-        payload = {
+    def _payload(self, input: Union[str, List[str]]) -> Dict[str, Any]:
+        return {
             "model": self.model,
-            "input": text,
+            "input": input,
             "encoding_format": "float"
         }
-        headers = {
+
+    def _headers(self) -> Dict[str, str]:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
+
+    @staticmethod
+    def _parse_embeddings(body: Dict[str, Any], count: int) -> List[List[float]]:
+        """
+        Extract the embedding vectors in input order from an API response
+        """
+        data = sorted(body["data"], key=lambda item: item.get("index", 0))
+        if len(data) != count:
+            raise ValueError(f"Expected {count} embeddings, got {len(data)}")
+        return [item["embedding"] for item in data]
+
+    def _get_embedding(self, text: str) -> List[float]:
+        """
+        Get the embedding vector of a single text using API
+        """
         retries = 0
         while retries < self.max_retries:
             try:
-                response = requests.post(self.base_url, json=payload, headers=headers)
+                response = requests.post(self.base_url, json=self._payload(text), headers=self._headers())
                 response.raise_for_status()
                 return response.json()["data"][0]["embedding"]
             except Exception as e:
@@ -64,7 +120,150 @@ class EmbeddingService:
                     raise ValueError(f"Failed to get embedding after {self.max_retries} retries: {e}")
                 time.sleep(self.retry_delay)
 
-    def embed_documents(self, documents: List[Document]) -> List[Dict[str, Any]]:
+    def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Get the embedding vectors of several texts with a single API request
+        """
+        retries = 0
+        while retries < self.max_retries:
+            try:
+                response = requests.post(self.base_url, json=self._payload(texts), headers=self._headers())
+                response.raise_for_status()
+                return self._parse_embeddings(response.json(), len(texts))
+            except Exception as e:
+                retries += 1
+                if retries == self.max_retries:
+                    raise ValueError(f"Failed to get embeddings after {self.max_retries} retries: {e}")
+                time.sleep(self.retry_delay)
+
+    async def _aget_embeddings(self, client: httpx.AsyncClient, texts: List[str]) -> List[List[float]]:
+        """
+        Get the embedding vectors of several texts with a single async API request, without retries
+
+        Raises:
+            EmbeddingAPIError: If the request fails, carrying the status code and Retry-After hint
+        """
+        try:
+            response = await client.post(self.base_url, json=self._payload(texts), headers=self._headers())
+        except httpx.HTTPError as e:
+            raise EmbeddingAPIError(f"Embedding request failed: {e!r}") from e
+        if response.status_code >= 400:
+            raise EmbeddingAPIError(
+                f"Embedding API returned {response.status_code}: {response.text[:200]}",
+                status_code=response.status_code,
+                retry_after=_parse_retry_after(response.headers.get("Retry-After"))
+            )
+        try:
+            return self._parse_embeddings(response.json(), len(texts))
+        except Exception as e:
+            raise EmbeddingAPIError(f"Invalid embedding response: {e}") from e
+
+    def _iter_batches(self, items: Iterable[Tuple[Any, str]]) -> Iterator[List[Tuple[Any, str]]]:
+        """
+        Pack (key, text) pairs into batches bounded by batch_size and batch_max_tokens
+        """
+        batch = []
+        batch_tokens = 0
+        for item in items:
+            tokens = estimate_tokens(item[1])
+            if batch and (len(batch) >= self.batch_size or batch_tokens + tokens > self.batch_max_tokens):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            batch.append(item)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def _embed_batch(self, batch: List[Tuple[Any, str]]) -> Tuple[Dict[Any, List[float]], Dict[Any, Exception]]:
+        """
+        Embed a batch, splitting it in halves when the request keeps failing
+
+        Returns:
+            Tuple[Dict[Any, List[float]], Dict[Any, Exception]]: Vectors and errors by key
+        """
+        try:
+            vectors = self._get_embeddings([text for _, text in batch])
+            return {pos: vector for (pos, _), vector in zip(batch, vectors)}, {}
+        except Exception as e:
+            if len(batch) == 1:
+                return {}, {batch[0][0]: e}
+            if DEBUG:
+                print(f"[EmbeddingService] Batch of {len(batch)} failed, splitting: {e}")
+            middle = len(batch) // 2
+            vectors, errors = self._embed_batch(batch[:middle])
+            right_vectors, right_errors = self._embed_batch(batch[middle:])
+            vectors.update(right_vectors)
+            errors.update(right_errors)
+            return vectors, errors
+
+    def _iter_pending(self, documents: Iterable[Document], pending: Dict[str, Document]) -> Iterator[Tuple[str, str]]:
+        """
+        Lazily assign chunk IDs and drop duplicated chunks
+
+        Args:
+            documents: Document stream
+            pending: Filled with the yielded documents by chunk ID, callers drop them once embedded
+
+        Yields:
+            Tuple[str, str]: (chunk ID, text) pairs to embed
+        """
+        seen_ids = set()
+        for doc in documents:
+            doc_id = chunk_id(doc)
+            if doc_id in seen_ids:
+                # Identical chunk of the same source, already embedded
+                continue
+            seen_ids.add(doc_id)
+            pending[doc_id] = doc
+            yield doc_id, doc.page_content
+
+    def _iter_embedded(self, documents: Iterable[Document]) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Embed a document stream batch by batch, dropping the chunks that keep failing
+
+        Yields:
+            List[Dict[str, Any]]: Embedded documents of every batch with IDs, content, metadata and embedding vectors
+        """
+        pending: Dict[str, Document] = {}
+        processed = 0
+        for batch in self._iter_batches(self._iter_pending(documents, pending)):
+            vectors, errors = self._embed_batch(batch)
+            for doc_id, e in errors.items():
+                print(f"Error processing document {doc_id}: {e}")
+            processed += len(batch)
+            print(f"Processed document {processed}")
+            
+            embedded_docs = []
+            for doc_id, _ in batch:
+                doc = pending.pop(doc_id)
+                if doc_id in vectors:
+                    embedded_docs.append({
+                        "id": doc_id,
+                        "content": doc.page_content,
+                        "metadata": doc.metadata,
+                        "embedding": vectors[doc_id]
+                    })
+            if embedded_docs:
+                yield embedded_docs
+
+    def iter_embeddings(self, documents: Iterable[Document]) -> Iterator[Dict[str, Any]]:
+        """
+        Embed a document stream batch by batch
+        
+        Only the documents of the batch being embedded are held in memory, so the
+        stream can be consumed directly from the loaders.
+        
+        Args:
+            documents: Document stream
+            
+        Yields:
+            Dict[str, Any]: Chroma format data of every embedded batch
+        """
+        for embedded_docs in self._iter_embedded(documents):
+            yield self.get_chroma_data(embedded_docs)
+
+    def embed_documents(self, documents: Iterable[Document]) -> List[Dict[str, Any]]:
         """
         Process the document list, return the document list with embedding vectors
         
@@ -72,35 +271,72 @@ class EmbeddingService:
             documents: Document object list
             
         Returns:
-            List[Dict]: Document list with content, metadata and embedding vectors
+            List[Dict]: Document list with content-hashed IDs, content, metadata and embedding vectors
         """
-        embedded_docs = []
-        total = len(documents)
-        
-        for i, doc in enumerate(documents, 1):
-            try:
-                vector = self._get_embedding(doc.page_content)
-                embedded_docs.append({
-                    "id": f"doc_{i}",
-                    "content": doc.page_content,
-                    "metadata": doc.metadata,
-                    "embedding": vector
-                })
-                print(f"Processed document {i}/{total}")
-            except Exception as e:
-                print(f"Error processing document {i}: {e}")
-                continue
-                
+        embedded_docs = [doc for batch in self._iter_embedded(documents) for doc in batch]
+        if DEBUG:
+            print(f"[EmbeddingService] Embedded {len(embedded_docs)} documents")
         return embedded_docs
 
     def embed_query(self, query: str) -> List[float]:
-        return self._get_embedding(query)
+        if self.query_cache is None:
+            return self._get_embedding(query)
+        vector = self.query_cache.get_vector(query, self.model)
+        if vector is None:
+            vector = self.query_cache.put_vector(query, self.model, self._get_embedding(query))
+        return vector.tolist()
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """
+        Get the embedding vector of a query without blocking the event loop
+        """
+        if self.query_cache is None:
+            return await self._aget_embedding(query)
+        vector = self.query_cache.get_vector(query, self.model)
+        if vector is None:
+            vector = self.query_cache.put_vector(query, self.model, await self._aget_embedding(query))
+        return vector.tolist()
+
+    async def _aget_embedding(self, text: str) -> List[float]:
+        """
+        Get the embedding vector of a single text using async API calls
+        """
+        retries = 0
+        while True:
+            try:
+                return (await self._aget_embeddings(self._http.get(), [text]))[0]
+            except EmbeddingAPIError as e:
+                retries += 1
+                if retries >= self.max_retries:
+                    raise ValueError(f"Failed to get embedding after {self.max_retries} retries: {e}")
+                await asyncio.sleep(e.retry_after or self.retry_delay)
+
+    async def aclose(self):
+        """
+        Close the async HTTP client
+        """
+        await self._http.aclose()
+
+    def snapshot(self, output_dir: Union[str, Path] = PROJECT_ROOT / "server" / "data" / "vectors") -> EmbeddingSnapshot:
+        """
+        Get the embedding snapshot kept in the output directory
+        
+        Args:
+            output_dir: Output directory
+            
+        Returns:
+            EmbeddingSnapshot: Snapshot of the embedded chunks of this model
+        """
+        path = Path(output_dir) / "snapshot"
+        if self._snapshot is None or self._snapshot.path != path:
+            self._snapshot = EmbeddingSnapshot(path, embedding_model=self.model)
+        return self._snapshot
 
     def save_embeddings(self, 
                        vector_data: Dict[str, Any], 
                        output_dir: Union[str, Path] = PROJECT_ROOT / "server" / "data" / "vectors") -> Dict[str, Path]:
         """
-        Save the embedding vectors and document information
+        Append the embedding vectors and document information to the snapshot
         
         Args:
             vector_data: Vector data in Chroma format
@@ -109,29 +345,12 @@ class EmbeddingService:
         Returns:
             Dict[str, Path]: Saved file path dictionary
         """
-        output_dir = Path(output_dir)
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        timestamp = int(time.time())
-        json_filename = f"{timestamp}_vectors.json"
-        npy_filename = f"{timestamp}_vectors.npy"
-        
-        # Save as JSON format
-        json_file = output_dir / json_filename
-        with open(json_file, "w", encoding="utf-8") as f:
-            json.dump(vector_data, f, ensure_ascii=False, indent=2)
-        
-        # Save as numpy format - extract vectors from the Chroma format data
-        np_file = output_dir / npy_filename
-        np.save(np_file, np.array(vector_data["vectors"]))  # 直接使用vectors字段
+        output_paths = self.snapshot(output_dir).append(vector_data)
         
         if DEBUG:
-            print(f"[EmbeddingService] Embeddings saved to {json_file} and {np_file}")
+            print(f"[EmbeddingService] Embeddings saved to {output_paths}")
         
-        return {
-            "json_data": json_file,
-            "numpy_data": np_file
-        }
+        return output_paths
 
     def get_chroma_data(self, embedded_docs: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -162,6 +381,10 @@ class EmbeddingService:
                 "content": doc["content"],
                 "source": doc["metadata"].get("title", "unknown")
             }
+            # Keep the Q&A record a chunk came from
+            for key in ("record", "question"):
+                if doc["metadata"].get(key) is not None:
+                    metadata[key] = doc["metadata"][key]
             chroma_data["metadata"].append(metadata)
         
         if DEBUG:
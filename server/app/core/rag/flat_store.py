@@ -0,0 +1,486 @@
+from typing import Dict, Any, Optional, List
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import shutil
+import threading
+import numpy as np
+from server.app.core.rag.quantization import get_quantizer
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+STATE_VERSION = 1
+
+class FlatVectorStore:
+    """
+    Exact vector store over a memory-mapped matrix, a drop-in alternative to the Chroma `VectorStore`
+
+    A collection is a directory holding:
+        vectors.<gen>.bin   raw row-major float32/float16 vectors, memory-mapped read-only
+        norms.<gen>.bin     float32 squared norm of every row
+        codes.<gen>.bin     quantized rows, only with int8 or binary quantization
+        records.<gen>.jsonl one {"id", "content", "metadata"} line per row
+        state.json          dtype, dimension, row count, deleted rows and current generation
+
+    Inserts append rows and deletes mark rows as deleted, so the files are only
+    rewritten when compacting. Compaction writes a new generation and then
+    replaces state.json, so readers never see a half written collection.
+    Only IDs and record offsets are kept in memory; contents are read for the
+    returned results only. Scores are squared L2 distances, as in Chroma.
+
+    With quantization, searches scan the compact codes and only rescore a
+    shortlist against the full-precision rows, so the full vectors mostly stay
+    on disk and the resident index shrinks about 4x (int8) or 32x (binary).
+    """
+    def __init__(self,
+                 collection_name: str = "medical_knowledge",
+                 persist_directory: Optional[str] = None,
+                 reset: bool = False,
+                 dtype: str = os.getenv("FLAT_STORE_DTYPE", "float32"),
+                 quantization: str = os.getenv("FLAT_STORE_QUANTIZATION", "none"),
+                 rescore_factor: int = int(os.getenv("FLAT_STORE_RESCORE_FACTOR", "4")),
+                 search_workers: int = int(os.getenv("VECTOR_SEARCH_WORKERS", "4"))):
+        """
+        Initialize the flat vector store
+
+        Args:
+            collection_name: Collection name
+            persist_directory: Persistent directory path, required
+            reset: Drop the existing collection instead of reusing the persisted one
+            dtype: Storage type of new collections, "float32" or "float16"
+            quantization: Quantization of new collections, "none", "int8" or "binary"
+            rescore_factor: Shortlist size as a multiple of the search limit
+            search_workers: Threads serving async searches
+        """
+        if persist_directory is None:
+            raise ValueError("FlatVectorStore requires a persist_directory")
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported flat store dtype: {dtype}")
+
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        self.path = Path(persist_directory) / f"{collection_name}.flat"
+        self.dtype = dtype
+        self.quantization = quantization.lower()
+        self.quantizer = get_quantizer(self.quantization)
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, search_workers),
+            thread_name_prefix="vector-search"
+        )
+
+        if reset:
+            self.drop_collection()
+        self._load()
+        if self.quantization != quantization.lower():
+            # Re-encode an existing collection with the requested quantization
+            self.quantization = quantization.lower()
+            self.quantizer = get_quantizer(self.quantization)
+            self.compact()
+
+        if DEBUG:
+            print(f"[FlatVectorStore] Successfully initialized vector store: {collection_name} ({self.count()} documents)")
+
+    def _file(self, name: str, generation: Optional[int] = None) -> Path:
+        generation = self.generation if generation is None else generation
+        stem, suffix = name.split(".")
+        return self.path / f"{stem}.{generation}.{suffix}"
+
+    def _load(self):
+        """
+        Load the collection state and memory-map its vectors
+        """
+        state_path = self.path / "state.json"
+        if not state_path.exists():
+            self.generation = 0
+            self.dim = None
+            self.rows = 0
+            self._write_generation(np.zeros((0, 0), dtype=self.dtype), [], [])
+            return
+
+        with state_path.open("r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != STATE_VERSION:
+            raise ValueError(f"Unsupported flat store version: {state.get('version')}")
+        self.generation = state["generation"]
+        self.dtype = state["dtype"]
+        self.quantization = state.get("quantization", "none")
+        self.quantizer = get_quantizer(self.quantization)
+        self.dim = state["dim"]
+        self.rows = state["rows"]
+        self._deleted = set(state["deleted"])
+
+        # Rows appended after the last state update are ignored
+        self._ids: List[str] = []
+        self._offsets: List[int] = []
+        offset = 0
+        with self._file("records.jsonl").open("rb") as f:
+            for line in f:
+                if len(self._ids) == self.rows:
+                    break
+                self._ids.append(json.loads(line)["id"])
+                self._offsets.append(offset)
+                offset += len(line)
+        if len(self._ids) != self.rows:
+            raise ValueError(f"Flat store records are truncated: {len(self._ids)}/{self.rows}")
+        self._records_size = offset
+        self._map()
+        self._rows_by_id = {doc_id: row for row, doc_id in enumerate(self._ids) if self._alive[row]}
+
+    def _map(self):
+        """
+        Memory-map the first `rows` rows of the vector and norm files
+        """
+        if self.rows == 0 or not self.dim:
+            self._vectors = np.zeros((0, self.dim or 0), dtype=self.dtype)
+            self._norms = np.zeros(0, dtype=np.float32)
+            self._codes = None
+        else:
+            self._vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r", shape=(self.rows, self.dim))
+            self._norms = np.memmap(self._file("norms.bin"), dtype=np.float32, mode="r", shape=(self.rows,))
+            self._codes = np.memmap(
+                self._file("codes.bin"), dtype=np.uint8, mode="r", shape=(self.rows, self.quantizer.code_size(self.dim))
+            ) if self.quantizer else None
+        self._alive = np.ones(self.rows, dtype=bool)
+        if self._deleted:
+            self._alive[list(self._deleted)] = False
+
+    def _save_state(self):
+        state = {
+            "version": STATE_VERSION,
+            "generation": self.generation,
+            "dtype": self.dtype,
+            "quantization": self.quantization,
+            "dim": self.dim,
+            "rows": self.rows,
+            "deleted": sorted(self._deleted)
+        }
+        tmp_path = self.path / "state.json.tmp"
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path / "state.json")
+
+    def _write_generation(self, vectors: np.ndarray, ids: List[str], records: List[bytes]):
+        """
+        Write the given rows as a new generation and switch to it
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        old_generation = self.generation if (self.path / "state.json").exists() else None
+        generation = self.generation + 1 if old_generation is not None else 0
+
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype)
+        norms = np.einsum("ij,ij->i", vectors.astype(np.float32), vectors.astype(np.float32))
+        self._file("vectors.bin", generation).write_bytes(vectors.tobytes())
+        self._file("norms.bin", generation).write_bytes(norms.astype(np.float32).tobytes())
+        self._file("records.jsonl", generation).write_bytes(b"".join(records))
+        if self.quantizer:
+            self._file("codes.bin", generation).write_bytes(self.quantizer.encode(vectors).tobytes() if len(vectors) else b"")
+
+        self.generation = generation
+        self.rows = len(ids)
+        self._deleted = set()
+        self._ids = list(ids)
+        self._offsets = np.cumsum([0] + [len(record) for record in records[:-1]]).tolist() if records else []
+        self._records_size = sum(len(record) for record in records)
+        self._rows_by_id = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._save_state()
+        self._map()
+
+        if old_generation is not None and old_generation != generation:
+            for name in ("vectors.bin", "norms.bin", "records.jsonl", "codes.bin"):
+                self._file(name, old_generation).unlink(missing_ok=True)
+
+    @staticmethod
+    def _record(doc_id: str, content: str, metadata: Dict[str, Any]) -> bytes:
+        return (json.dumps({"id": doc_id, "content": content, "metadata": metadata}, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def _read_records(self, rows: List[int]) -> List[Dict[str, Any]]:
+        records = []
+        with self._file("records.jsonl").open("rb") as f:
+            for row in rows:
+                f.seek(self._offsets[row])
+                records.append(json.loads(f.readline()))
+        return records
+
+    def _append(self, name: str, offset: int, data: bytes):
+        """
+        Write data after the first `offset` bytes of a file, dropping anything beyond
+        """
+        with self._file(name).open("r+b") as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+
+    def insert(self, data: Dict[str, Any]) -> List[str]:
+        """
+        Insert data by batch, existing IDs are overwritten
+
+        Args:
+            data: Data in Chroma format
+
+        Returns:
+            List[str]: IDs of the inserted documents
+        """
+        try:
+            ids = list(data["ids"])
+            if not ids:
+                return []
+            vectors = np.asarray(data["vectors"], dtype=np.float32)
+            if vectors.ndim != 2 or len(vectors) != len(ids):
+                raise ValueError(f"Expected {len(ids)} vectors, got shape {vectors.shape}")
+
+            # The last occurrence of a repeated ID wins, as with Chroma upserts
+            latest = {doc_id: i for i, doc_id in enumerate(ids)}
+            keep = sorted(latest.values())
+            ids = [ids[i] for i in keep]
+            vectors = vectors[keep]
+            metadatas = [data["metadata"][i] for i in keep]
+            records = [self._record(doc_id, meta["content"], meta) for doc_id, meta in zip(ids, metadatas)]
+
+            with self._lock:
+                if self.dim is None or self.rows == 0:
+                    self.dim = vectors.shape[1]
+                if vectors.shape[1] != self.dim:
+                    raise ValueError(f"Vector dimension {vectors.shape[1]} does not match collection dimension {self.dim}")
+
+                for doc_id in ids:
+                    row = self._rows_by_id.get(doc_id)
+                    if row is not None:
+                        self._deleted.add(row)
+
+                stored = vectors.astype(self.dtype)
+                norms = np.einsum("ij,ij->i", stored.astype(np.float32), stored.astype(np.float32))
+                self._append("vectors.bin", self.rows * self.dim * stored.itemsize, stored.tobytes())
+                self._append("norms.bin", self.rows * 4, norms.astype(np.float32).tobytes())
+                if self.quantizer:
+                    code_size = self.quantizer.code_size(self.dim)
+                    self._append("codes.bin", self.rows * code_size, self.quantizer.encode(stored).tobytes())
+                with self._file("records.jsonl").open("r+b") as f:
+                    f.seek(self._records_size)
+                    for record in records:
+                        self._offsets.append(f.tell())
+                        f.write(record)
+                    self._records_size = f.tell()
+                    f.truncate()
+
+                for row, doc_id in enumerate(ids, start=self.rows):
+                    self._rows_by_id[doc_id] = row
+                self._ids.extend(ids)
+                self.rows += len(ids)
+                self._save_state()
+                self._map()
+
+            if DEBUG:
+                print(f"[FlatVectorStore] Inserted {len(ids)} documents")
+            return ids
+
+        except Exception as e:
+            print(f"[FlatVectorStore] Insert data failed: {str(e)}")
+            raise ValueError(f"Failed to insert data: {str(e)}")
+
+    def _distances(self, vectors: np.ndarray, norms: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        Squared L2 distances of all rows to the query
+        """
+        if vectors.dtype == np.float32:
+            dots = vectors @ query
+        else:
+            # NumPy has no BLAS kernel for float16, so upcast block by block
+            dots = np.empty(len(vectors), dtype=np.float32)
+            block = 16384
+            for start in range(0, len(vectors), block):
+                dots[start:start + block] = vectors[start:start + block].astype(np.float32) @ query
+        return norms - 2.0 * dots + float(query @ query)
+
+    @staticmethod
+    def _top_k(distances: np.ndarray, k: int) -> np.ndarray:
+        """
+        Indices of the k smallest distances, sorted
+        """
+        top = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+        return top[np.argsort(distances[top], kind="stable")]
+
+    def search(self, query_vector: List[float], limit: int = 10) -> List[Dict]:
+        """
+        Search for the most similar vectors by exact squared L2 distance
+
+        Args:
+            query_vector: Query vector
+            limit: Search limit
+
+        Returns:
+            List[Dict]: Search results
+        """
+        if DEBUG:
+            print(f"\n[FlatVectorStore] Performing vector search, limit={limit}")
+
+        try:
+            with self._lock:
+                vectors, norms, alive, codes = self._vectors, self._norms, self._alive, self._codes
+            alive_count = int(alive.sum())
+            if alive_count == 0 or limit <= 0:
+                return []
+
+            query = np.asarray(query_vector, dtype=np.float32).ravel()
+            if query.shape[0] != vectors.shape[1]:
+                raise ValueError(f"Query dimension {query.shape[0]} does not match collection dimension {vectors.shape[1]}")
+
+            k = min(limit, alive_count)
+            if codes is not None:
+                # Scan the codes, then rescore the shortlist at full precision
+                approximate = self.quantizer.approximate_distances(codes, norms, query)
+                approximate[~alive] = np.inf
+                shortlist = self._top_k(approximate, min(k * self.rescore_factor, alive_count))
+                shortlist.sort()
+                exact = self._distances(vectors[shortlist], norms[shortlist], query)
+                order = self._top_k(exact, k)
+                top, top_distances = shortlist[order], exact[order]
+            else:
+                distances = self._distances(vectors, norms, query)
+                distances[~alive] = np.inf
+                top = self._top_k(distances, k)
+                top_distances = distances[top]
+
+            with self._lock:
+                records = self._read_records(top.tolist())
+            formatted_results = [{
+                "id": record["id"],
+                "content": record["content"],
+                "metadata": record["metadata"],
+                "score": float(max(distance, 0.0))
+            } for distance, record in zip(top_distances, records)]
+
+            if DEBUG:
+                print(f"[FlatVectorStore] Found {len(formatted_results)} related documents")
+
+            return formatted_results
+
+        except Exception as e:
+            print(f"[FlatVectorStore] Search failed: {e}")
+            raise ValueError(f"Search failed: {e}")
+
+    async def asearch(self, query_vector: List[float], limit: int = 10) -> List[Dict]:
+        """
+        Search for the most similar vectors on the search thread pool, without blocking the event loop
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.search, query_vector, limit)
+
+    def delete(self, ids: List[str]):
+        """
+        Delete documents by ID, compacting the files once most rows are deleted
+
+        Args:
+            ids: Document IDs
+        """
+        try:
+            with self._lock:
+                rows = [self._rows_by_id.pop(doc_id) for doc_id in set(ids) if doc_id in self._rows_by_id]
+                if not rows:
+                    return
+                self._deleted.update(rows)
+                if len(self._deleted) * 2 > self.rows:
+                    self.compact()
+                else:
+                    self._save_state()
+                    self._map()
+            if DEBUG:
+                print(f"[FlatVectorStore] Deleted {len(rows)} documents")
+        except Exception as e:
+            print(f"[FlatVectorStore] Delete failed: {e}")
+            raise ValueError(f"Failed to delete data: {e}")
+
+    def compact(self):
+        """
+        Rewrite the collection without deleted rows
+        """
+        with self._lock:
+            rows = [row for row in range(self.rows) if row not in self._deleted]
+            vectors = np.asarray(self._vectors[rows]) if len(rows) else np.zeros((0, self.dim or 0), dtype=self.dtype)
+            with self._file("records.jsonl").open("rb") as f:
+                records = []
+                for row in rows:
+                    f.seek(self._offsets[row])
+                    records.append(f.readline())
+            ids = [self._ids[row] for row in rows]
+            self._write_generation(vectors, ids, records)
+
+    def iter_documents(self, batch_size: int = 1000):
+        """
+        Iterate over all stored documents without their embeddings
+
+        Yields:
+            Tuple[str, str, Dict]: Document ID, content and metadata
+        """
+        with self._lock:
+            path = self._file("records.jsonl")
+            rows, alive = self.rows, self._alive
+        with path.open("rb") as f:
+            for row in range(rows):
+                record = json.loads(f.readline())
+                if alive[row]:
+                    yield record["id"], record["content"], record["metadata"]
+
+    def export_batches(self, batch_size: int = 1000):
+        """
+        Iterate over all stored documents with their embeddings
+
+        Yields:
+            Dict[str, Any]: Batches in the format accepted by `insert`
+        """
+        batch = {"ids": [], "vectors": [], "metadata": []}
+        with self._lock:
+            vectors = self._vectors
+        for doc_id, _, metadata in self.iter_documents():
+            batch["ids"].append(doc_id)
+            batch["vectors"].append(vectors[self._rows_by_id[doc_id]].astype(np.float32).tolist())
+            batch["metadata"].append(metadata)
+            if len(batch["ids"]) == batch_size:
+                yield batch
+                batch = {"ids": [], "vectors": [], "metadata": []}
+        if batch["ids"]:
+            yield batch
+
+    def count(self) -> int:
+        """
+        Get the number of stored documents
+        """
+        return len(self._rows_by_id)
+
+    def warm_up(self, block: int = 65536):
+        """
+        Read the scanned rows once, so the first searches do not page them in from disk
+        """
+        with self._lock:
+            matrix = self._codes if self._codes is not None else self._vectors
+            for start in range(0, len(matrix), block):
+                np.asarray(matrix[start:start + block]).sum()
+
+    def reset_collection(self):
+        """
+        Drop all stored documents
+        """
+        with self._lock:
+            self.dim = None
+            self._write_generation(np.zeros((0, 0), dtype=self.dtype), [], [])
+
+    def drop_collection(self):
+        """
+        Drop collection
+        """
+        try:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.generation = 0
+        except Exception as e:
+            print(f"[FlatVectorStore] Drop collection failed: {e}")
+
+    def get_collection(self):
+        """
+        Get collection instance
+        """
+        return self
@@ -4,6 +4,7 @@ from enum import Enum
 import os
 from dotenv import load_dotenv
 from server.app.utils.prompt import QUERY_PROMPT
+from server.app.utils.tokens import count_tokens
 
 load_dotenv()
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
@@ -45,21 +46,34 @@ class PromptGenerator:
             )
         }
     
-    def _format_context(self, documents: List[Dict[str, Any]]) -> str:
+    def _format_context(self,
+                        documents: List[Dict[str, Any]],
+                        max_tokens: Optional[int] = None,
+                        model_name: Optional[str] = None) -> str:
         """
         Format context
         
         Args:
-            documents: List of retrieved relevant documents
+            documents: List of retrieved relevant documents, most relevant first
+            max_tokens: Token budget of the context, less relevant documents beyond it are left out
+            model_name: Model whose tokenizer counts the budget
             
         Returns:
             str: Formatted context string
         """
         formatted_docs = []
+        used = 0
         for i, doc in enumerate(documents, 1):
             content = doc.get("content", "").strip()
             title = doc.get("metadata", {}).get("source", "unknown")
-            formatted_docs.append(f"[{i}] {content}\nSource: {title}")
+            formatted = f"[{i}] {content}\nSource: {title}"
+            if max_tokens is not None:
+                used += count_tokens(formatted, model_name)
+                if used > max_tokens:
+                    if DEBUG:
+                        print(f"[PromptGenerator] Context token budget {max_tokens} reached, using {i - 1} documents")
+                    break
+            formatted_docs.append(formatted)
         
         return "\n\n".join(formatted_docs)
     
@@ -67,7 +81,9 @@ class PromptGenerator:
                 query: str, 
                 documents: List[Dict[str, Any]], 
                 strategy: Optional[PromptStrategy] = None,
-                max_relevance_score: float = 0.0) -> str:
+                max_relevance_score: float = 0.0,
+                max_context_tokens: Optional[int] = None,
+                model_name: Optional[str] = None) -> str:
         """
         Generate prompt
         
@@ -76,6 +92,8 @@ class PromptGenerator:
             documents: List of retrieved relevant documents
             strategy: Optional prompt strategy
             max_relevance_score: Highest relevance score
+            max_context_tokens: Token budget of the retrieved context, unlimited if None
+            model_name: Chat model whose tokenizer counts the budget
         """
         strategy = strategy or self.strategy
         if DEBUG:
@@ -96,7 +114,7 @@ class PromptGenerator:
             relevance_note = "The highest relevance score between the retrieved reference material and the question is {:.1f}%.".format(max_relevance_score * 100)
         
         template = self.templates[strategy]
-        context = self._format_context(documents)
+        context = self._format_context(documents, max_context_tokens, model_name)
         
         prompt = template.format(
             query=query,
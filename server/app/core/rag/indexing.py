@@ -1,6 +1,11 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union, Optional, Iterable, Iterator, Callable, Tuple
+from pathlib import Path
+import asyncio
 from server.app.core.rag.store import VectorStore
 from server.app.core.rag.embedding import EmbeddingService
+from server.app.core.rag.data_preprocess import DataPreprocessor
+from server.app.core.rag.manifest import IndexManifest, chunk_id, source_key, source_fingerprint
+from server.app.core.rag.ingestion import AsyncIngestionEngine
 from langchain.schema import Document
 from dotenv import load_dotenv
 import os
@@ -12,16 +17,27 @@ DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 class VectorIndexer:
     def __init__(self, 
                  embedding_service: EmbeddingService,
-                 vector_store: VectorStore):
+                 vector_store: VectorStore,
+                 ingestion_engine: Optional[AsyncIngestionEngine] = None,
+                 max_concurrency: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8"))):
         """
         Initialize the index manager
         
         Args:
             embedding_service: Embedding service instance
             vector_store: Vector store instance
+            ingestion_engine: Async ingestion engine, created from the services if not provided
+            max_concurrency: Maximum embedding requests in flight, 0 indexes serially
         """
         self.embedding_service = embedding_service
         self.vector_store = vector_store
+        self.ingestion_engine = ingestion_engine
+        if self.ingestion_engine is None and max_concurrency > 0:
+            self.ingestion_engine = AsyncIngestionEngine(
+                embedding_service=embedding_service,
+                vector_store=vector_store,
+                max_concurrency=max_concurrency
+            )
         
     def index_documents(self, documents: List[Document]) -> bool:
         """
@@ -34,42 +50,293 @@ class VectorIndexer:
             bool: True if index building is successful, False otherwise
         """
         try:
+            self._index(documents)
+            return True
+        
+        except Exception as e:
             if DEBUG:
-                print(f"\n[VectorIndexer] Processing {len(documents)} documents")
+                print(f"[VectorIndexer] Index building failed: {e}")
+                import traceback
+                print(traceback.format_exc())
+            return False
+    
+    def _index(self, documents: Iterable[Document]) -> List[str]:
+        """
+        Embed documents and insert them into the vector store
+        
+        Documents are consumed as a stream: restored, embedded and inserted batch by
+        batch, so only the IDs of the stored documents are kept.
+        
+        Args:
+            documents: Document list or stream
             
-            # Get embeddings
-            embedded_docs = self.embedding_service.embed_documents(documents)
+        Returns:
+            List[str]: IDs of the documents stored in the vector store
+        """
+        if DEBUG:
+            print(f"\n[VectorIndexer] Processing documents")
+        
+        # Chunks embedded before with the same model are restored without calling the API
+        restored_ids = []
+        documents = self._restore_from_snapshot(documents, restored_ids)
+        
+        if self.ingestion_engine is not None and not self._in_event_loop():
+            inserted_ids = self._index_concurrently(documents)
+            return restored_ids + inserted_ids
+        
+        inserted_ids = []
+        for vector_data in self.embedding_service.iter_embeddings(documents):
+            self._save_embeddings(vector_data)
+            inserted_ids.extend(self.vector_store.insert(vector_data))
+        if DEBUG:
+            print(f"[VectorIndexer] Index building completed")
+        
+        return restored_ids + inserted_ids
+    
+    def _save_embeddings(self, vector_data: Dict[str, Any]):
+        """
+        Save an embedded batch to the snapshot, indexing continues if saving fails
+        """
+        try:
+            output_paths = self.embedding_service.save_embeddings(vector_data)
             if DEBUG:
-                print(f"[VectorIndexer] Successfully generated embeddings for {len(embedded_docs)} documents")
+                print(f"[VectorIndexer] Vector data saved to: {output_paths}")
+        except Exception as save_error:
+            print(f"[VectorIndexer] Warning: Failed to save vectors: {save_error}")
+    
+    def _restore_from_snapshot(self,
+                               documents: Iterable[Document],
+                               restored_ids: List[str],
+                               batch_size: int = 256) -> Iterator[Document]:
+        """
+        Insert the chunks found in the embedding snapshot into the vector store
+        
+        Args:
+            documents: Document stream
+            restored_ids: Filled with the IDs of the restored chunks
+            batch_size: Chunks restored per vector store insert
             
-            # Convert to Chroma format
-            vector_data = self.embedding_service.get_chroma_data(embedded_docs)
-            if DEBUG:
-                print(f"[VectorIndexer] Data conversion completed, preparing to insert into vector store")
-                print(f"[VectorIndexer] Vector data format: {list(vector_data.keys())}")
+        Yields:
+            Document: Documents left to embed
+        """
+        try:
+            snapshot = self.embedding_service.snapshot()
+            available = set(snapshot.ids())
+        except Exception as e:
+            print(f"[VectorIndexer] Warning: Failed to read the embedding snapshot: {e}")
+            available = set()
+        if not available:
+            yield from documents
+            return
+        
+        batch: Dict[str, Document] = {}
+        
+        def restore() -> List[Document]:
+            inserted_ids, missing = self._refresh(batch)
+            restored_ids.extend(inserted_ids)
+            batch.clear()
+            return missing
+        
+        for doc in documents:
+            doc_id = chunk_id(doc)
+            if doc_id not in available:
+                yield doc
+                continue
+            batch[doc_id] = doc
+            if len(batch) >= batch_size:
+                yield from restore()
+        if batch:
+            yield from restore()
+        
+        if restored_ids:
+            print(f"[VectorIndexer] Restored {len(restored_ids)} chunks from the embedding snapshot")
+    
+    def _refresh(self, documents: Dict[str, Document]) -> Tuple[List[str], List[Document]]:
+        """
+        Insert chunks embedded before with their current metadata
+        
+        The vectors come from the embedding snapshot, so no chunk is embedded again.
+        Chunks whose metadata changed, e.g. a renamed title or shifted record numbers,
+        are also written to the snapshot again.
+        
+        Args:
+            documents: Chunks by ID
             
-            # Save the vector data
-            try:
-                output_paths = self.embedding_service.save_embeddings(vector_data)
-                if DEBUG:
-                    print(f"[VectorIndexer] Vector data saved to: {output_paths}")
-            except Exception as save_error:
-                print(f"[VectorIndexer] Warning: Failed to save vectors: {save_error}")
-                # Continue even if saving fails
+        Returns:
+            Tuple[List[str], List[Document]]: IDs of the inserted chunks, and the chunks
+            missing from the snapshot to embed again
+        """
+        refreshed = []
+        try:
+            for stored in self.embedding_service.snapshot().iter_batches(ids=set(documents)):
+                vector_data = self.embedding_service.get_chroma_data([{
+                    "id": doc_id,
+                    "content": documents[doc_id].page_content,
+                    "metadata": documents[doc_id].metadata,
+                    "embedding": vector
+                } for doc_id, vector in zip(stored["ids"], stored["vectors"])])
+                refreshed.extend(self.vector_store.insert(vector_data))
+                changed = [i for i, metadata in enumerate(vector_data["metadata"]) if metadata != stored["metadata"][i]]
+                if changed:
+                    self._save_embeddings({name: [values[i] for i in changed] for name, values in vector_data.items()})
+        except Exception as e:
+            print(f"[VectorIndexer] Warning: Failed to restore vectors from snapshot: {e}")
+        inserted = set(refreshed)
+        return refreshed, [doc for doc_id, doc in documents.items() if doc_id not in inserted]
+    
+    def _delete(self, ids: set):
+        """
+        Delete chunks from the vector store and the embedding snapshot
+        """
+        self.vector_store.delete(ids)
+        try:
+            self.embedding_service.snapshot().delete(ids)
+        except Exception as e:
+            print(f"[VectorIndexer] Warning: Failed to delete vectors from snapshot: {e}")
+    
+    @staticmethod
+    def _in_event_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+    
+    def _index_concurrently(self, documents: Iterable[Document]) -> List[str]:
+        """
+        Embed and insert documents with the async ingestion engine
+        """
+        report = asyncio.run(self.ingestion_engine.run(documents, on_insert=self._save_embeddings))
+        print(f"[VectorIndexer] {report.summary()}")
+        return report.inserted_ids
+    
+    def sync_sources(self,
+                     preprocessor: DataPreprocessor,
+                     config_path: Union[str, Path],
+                     manifest_path: Union[str, Path],
+                     on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Bring the vector store in line with the data sources of config.json
+        
+        Only sources whose configuration or raw file changed since the last sync are
+        re-chunked, and only chunks missing from the manifest are embedded. The chunks
+        a changed source still contains are stored again with their current metadata,
+        e.g. a renamed title or shifted record numbers, using their snapshot vectors.
+        Chunks that no longer exist are deleted.
+        
+        Args:
+            preprocessor: Data preprocessor
+            config_path: Data source configuration file path
+            manifest_path: Index manifest file path
+            on_progress: Called with the number of changed sources, synced sources and
+                processed chunks whenever a source starts or ends and every 1000 chunks
             
-            # Insert into vector store
-            self.vector_store.insert(vector_data)
-            if DEBUG:
-                print(f"[VectorIndexer] Index building completed")
+        Returns:
+            Dict[str, Any]: Number of added, deleted, unchanged and refreshed chunks, and the index version
+        """
+        stats = {"added": 0, "deleted": 0, "unchanged": 0, "refreshed": 0}
+        model = self.embedding_service.model
+        manifest = IndexManifest.load(manifest_path)
+        
+        # The manifest can only be trusted if it describes the persisted collection
+        if manifest.embedding_model != model or manifest.total_chunks() != self.vector_store.count():
+            if manifest.sources or self.vector_store.count():
+                print("[VectorIndexer] Index manifest does not match the vector store, rebuilding the index")
+            self.vector_store.reset_collection()
+            manifest.reset(embedding_model=model)
+        
+        config = preprocessor.load_config(config_path)
+        configured_keys = set()
+        changed = []
+        
+        for source in config:
+            key = source_key(source)
+            configured_keys.add(key)
+            path = preprocessor.source_path(source)
+            fingerprint = source_fingerprint(source, path)
             
-            return True
+            if manifest.is_current(key, fingerprint):
+                stats["unchanged"] += len(manifest.sources[key]["chunks"])
+                if DEBUG:
+                    print(f"[VectorIndexer] Source unchanged, skipping: {key}")
+                continue
+            changed.append((source, path, fingerprint))
         
-        except Exception as e:
+        progress = {"sources_total": len(changed), "sources_done": 0, "source": None, "chunks": 0}
+        
+        def report(**update):
+            progress.update(update)
+            if on_progress is not None:
+                on_progress(dict(progress))
+        
+        # Changed sources are loaded and split in parallel when the preprocessor has workers
+        fingerprints = {source_key(source): fingerprint for source, _, fingerprint in changed}
+        for source, documents in preprocessor.iter_sources([(source, path) for source, path, _ in changed]):
+            key = source_key(source)
+            old_ids = set(manifest.sources.get(key, {}).get("chunks", []))
+            new_ids = set()
+            kept: Dict[str, Document] = {}
+            refreshed = {"chunks": 0}
+            report(source=key)
+            
+            def refresh() -> List[Document]:
+                inserted_ids, missing = self._refresh(kept)
+                refreshed["chunks"] += len(inserted_ids)
+                kept.clear()
+                return missing
+            
+            def to_add(documents: Iterable[Document]) -> Iterator[Document]:
+                for doc in documents:
+                    doc_id = chunk_id(doc)
+                    if doc_id in new_ids:
+                        continue
+                    new_ids.add(doc_id)
+                    progress["chunks"] += 1
+                    if progress["chunks"] % 1000 == 0:
+                        report()
+                    if doc_id not in old_ids:
+                        yield doc
+                        continue
+                    # Kept chunks may carry changed metadata, chunks without a snapshot vector are embedded again
+                    kept[doc_id] = doc
+                    if len(kept) >= 256:
+                        yield from refresh()
+                if kept:
+                    yield from refresh()
+            
+            # Chunks stream from the loader into the index, new_ids is complete once consumed
+            added_ids = set(self._index(to_add(documents)))
+            stale_ids = (old_ids - new_ids) - manifest.chunk_ids(exclude=key)
+            self._delete(stale_ids)
+            
+            kept_ids = old_ids & new_ids
+            stored_ids = kept_ids | added_ids
+            # Kept chunks neither refreshed nor embedded again still carry the old metadata
+            complete = stored_ids == new_ids and refreshed["chunks"] + len(added_ids & kept_ids) == len(kept_ids)
+            manifest.update_source(key, fingerprints[key], list(stored_ids), complete=complete)
+            manifest.save()
+            
+            stats["added"] += len(added_ids - kept_ids)
+            stats["deleted"] += len(stale_ids)
+            stats["unchanged"] += len(kept_ids)
+            stats["refreshed"] += refreshed["chunks"] + len(added_ids & kept_ids)
+            report(sources_done=progress["sources_done"] + 1, source=None)
             if DEBUG:
-                print(f"[VectorIndexer] Index building failed: {e}")
-                import traceback
-                print(traceback.format_exc())
-            return False
+                print(f"[VectorIndexer] Source {key} synced: {len(added_ids)} added, {len(stale_ids)} deleted")
+        
+        # Drop sources removed from config.json
+        for key in set(manifest.sources) - configured_keys:
+            removed_ids = set(manifest.remove_source(key)) - manifest.chunk_ids()
+            self._delete(removed_ids)
+            stats["deleted"] += len(removed_ids)
+            manifest.save()
+        
+        if not manifest.path.exists():
+            manifest.save()
+        
+        stats["version"] = manifest.index_version()
+        print(f"[VectorIndexer] Index synced: {stats['added']} added, {stats['deleted']} deleted, {stats['unchanged']} unchanged")
+        return stats
     
     def rebuild_index(self):
         """
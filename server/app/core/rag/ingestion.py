@@ -0,0 +1,319 @@
+from typing import List, Dict, Any, Optional, Callable, Tuple, Iterable
+from dataclasses import dataclass, field
+import asyncio
+import random
+import time
+import httpx
+from langchain.schema import Document
+from dotenv import load_dotenv
+import os
+from server.app.core.rag.embedding import EmbeddingService
+from server.app.core.rag.store import VectorStore
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+# Longest wait between retries of a batch without a Retry-After hint
+MAX_RETRY_BACKOFF = 30.0
+# Rejected inputs, a batch is split to isolate the bad chunk instead of retried
+PAYLOAD_ERRORS = (400, 413)
+# Rejected credentials, no request of the run can succeed
+AUTH_ERRORS = (401, 403)
+
+class AdaptiveConcurrency:
+    """
+    AIMD limiter for in-flight embedding requests
+
+    The limit grows by one after a full window of successful requests and is halved
+    whenever the provider throttles (429, 5xx or Retry-After), which also pauses new
+    requests for the requested time.
+    """
+    def __init__(self, initial: int = 2, min_limit: int = 1, max_limit: int = 8):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial, self.min_limit), self.max_limit)
+        self.peak = self.limit
+        self.in_flight = 0
+        self._successes = 0
+        self._resume_at = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        """
+        Wait for a free request slot
+        """
+        async with self._condition:
+            while self.in_flight >= self.limit:
+                await self._condition.wait()
+            self.in_flight += 1
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self, throttled: bool = False, retry_after: Optional[float] = None):
+        """
+        Free a request slot and adapt the limit to the outcome of the request
+
+        Args:
+            throttled: Whether the provider throttled the request
+            retry_after: Seconds the provider asked to wait before the next request
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit // 2)
+                self._successes = 0
+                if retry_after:
+                    self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self.peak = max(self.peak, self.limit)
+                    self._successes = 0
+            self._condition.notify_all()
+
+@dataclass
+class IngestionReport:
+    """
+    Progress and throughput of an ingestion run
+    """
+    total: int = 0
+    embedded: int = 0
+    failed: int = 0
+    inserted_ids: List[str] = field(default_factory=list)
+    requests: int = 0
+    throttled: int = 0
+    elapsed: float = 0.0
+    final_concurrency: int = 0
+    peak_concurrency: int = 0
+    aborted: Optional[str] = None
+
+    @property
+    def throughput(self) -> float:
+        return self.embedded / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        summary = (
+            f"Ingested {len(self.inserted_ids)}/{self.total} chunks in {self.elapsed:.1f}s "
+            f"({self.throughput:.1f} chunks/s), {self.failed} failed, "
+            f"{self.requests} requests, {self.throttled} throttled, "
+            f"concurrency {self.final_concurrency} (peak {self.peak_concurrency})"
+        )
+        return f"{summary}, aborted: {self.aborted}" if self.aborted else summary
+
+class AsyncIngestionEngine:
+    def __init__(self,
+                 embedding_service: EmbeddingService,
+                 vector_store: VectorStore,
+                 max_concurrency: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8")),
+                 initial_concurrency: int = 2,
+                 queue_size: int = 8,
+                 insert_batch_size: int = 64,
+                 timeout: float = 60.0):
+        """
+        Initialize the async ingestion engine
+
+        Embedding batches are requested concurrently under an AIMD limit while a single
+        writer inserts finished batches into the vector store, so embedding and
+        insertion overlap.
+
+        Args:
+            embedding_service: Embedding service instance, provides batching and the API call
+            vector_store: Vector store instance
+            max_concurrency: Maximum number of embedding requests in flight
+            initial_concurrency: Number of embedding requests in flight at start
+            queue_size: Maximum number of embedded batches waiting for insertion
+            insert_batch_size: Number of documents per vector store insert
+            timeout: Embedding request timeout (seconds)
+        """
+        self.embedding_service = embedding_service
+        self.vector_store = vector_store
+        self.max_concurrency = max(1, max_concurrency)
+        self.initial_concurrency = initial_concurrency
+        self.queue_size = queue_size
+        self.insert_batch_size = insert_batch_size
+        self.timeout = timeout
+
+    async def run(self,
+                  documents: Iterable[Document],
+                  on_insert: Optional[Callable[[Dict[str, Any]], None]] = None) -> IngestionReport:
+        """
+        Embed and insert documents
+
+        Documents are pulled from the iterable only as embedding slots free up, and
+        the insert queue is bounded, so memory stays flat for any corpus size.
+
+        Args:
+            documents: Document list or stream
+            on_insert: Called with the Chroma format data of every inserted batch
+
+        Returns:
+            IngestionReport: Ingestion report
+        """
+        started = time.perf_counter()
+        pending: Dict[str, Document] = {}
+        report = IngestionReport(total=0)
+        limiter = AdaptiveConcurrency(
+            initial=self.initial_concurrency,
+            max_limit=self.max_concurrency
+        )
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            writer = asyncio.create_task(self._insert_worker(queue, report, on_insert))
+            tasks = set()
+            items = self.embedding_service._iter_pending(documents, pending)
+            for batch in self.embedding_service._iter_batches(items):
+                # Bound the number of scheduled batches, the limiter bounds the requests
+                while len(tasks) >= self.max_concurrency * 2:
+                    _, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                report.total += len(batch)
+                tasks.add(asyncio.create_task(
+                    self._embed_batch(client, limiter, batch, queue, report, pending)
+                ))
+            if tasks:
+                await asyncio.gather(*tasks)
+            await queue.put(None)
+            await writer
+
+        report.elapsed = time.perf_counter() - started
+        report.final_concurrency = limiter.limit
+        report.peak_concurrency = limiter.peak
+        return report
+
+    async def _embed_batch(self,
+                           client: httpx.AsyncClient,
+                           limiter: AdaptiveConcurrency,
+                           batch: List[Tuple[str, str]],
+                           queue: asyncio.Queue,
+                           report: IngestionReport,
+                           pending: Dict[str, Document]):
+        """
+        Embed a batch, retrying throttled and failed requests and splitting rejected ones
+
+        Throttling, server errors and timeouts are retried with backoff and fail the
+        batch once the retries run out. A rejected payload (400, 413) is split in
+        halves at once until the bad chunk is isolated, and rejected credentials
+        (401, 403) abort the run without further requests. The documents of the
+        batch are removed from `pending` once they are embedded or dropped.
+        """
+        texts = [text for _, text in batch]
+        attempt = 0
+        while True:
+            await limiter.acquire()
+            if report.aborted:
+                await limiter.release()
+                self._drop(batch, pending, report)
+                return
+            report.requests += 1
+            try:
+                vectors = await self.embedding_service._aget_embeddings(client, texts)
+            except Exception as e:
+                throttled = getattr(e, "throttled", False)
+                retry_after = getattr(e, "retry_after", None)
+                await limiter.release(throttled=throttled, retry_after=retry_after)
+                if throttled:
+                    report.throttled += 1
+                status_code = getattr(e, "status_code", None)
+                if status_code in AUTH_ERRORS:
+                    report.aborted = report.aborted or str(e)
+                    print(f"[IngestionEngine] Embedding API rejected the credentials, aborting: {e}")
+                    self._drop(batch, pending, report)
+                    return
+                if status_code in PAYLOAD_ERRORS:
+                    if len(batch) > 1:
+                        if DEBUG:
+                            print(f"[IngestionEngine] Batch of {len(batch)} rejected, splitting: {e}")
+                        middle = len(batch) // 2
+                        await asyncio.gather(
+                            self._embed_batch(client, limiter, batch[:middle], queue, report, pending),
+                            self._embed_batch(client, limiter, batch[middle:], queue, report, pending)
+                        )
+                        return
+                    print(f"Error processing document {batch[0][0]}: {e}")
+                    self._drop(batch, pending, report)
+                    return
+                attempt += 1
+                if attempt < self.embedding_service.max_retries:
+                    # A Retry-After hint pauses the limiter, otherwise back off before retrying
+                    if retry_after is None:
+                        await asyncio.sleep(self._backoff(attempt))
+                    continue
+                print(f"[IngestionEngine] Batch of {len(batch)} failed after {attempt} attempts: {e}")
+                self._drop(batch, pending, report)
+                return
+            await limiter.release()
+            report.embedded += len(batch)
+            print(f"Processed document {report.embedded}/{report.total}")
+            await queue.put(self._to_embedded(batch, vectors, pending))
+            return
+
+    @staticmethod
+    def _drop(batch: List[Tuple[str, str]], pending: Dict[str, Document], report: IngestionReport):
+        """
+        Count the chunks of a batch as failed and forget them
+        """
+        report.failed += len(batch)
+        for doc_id, _ in batch:
+            pending.pop(doc_id, None)
+
+    def _backoff(self, attempt: int) -> float:
+        """
+        Get the jittered exponential delay before the given retry of a batch
+
+        The delay doubles with every attempt from the service's retry delay, and a
+        random half of it is skipped so that failed batches do not retry in lockstep.
+        """
+        delay = min(self.embedding_service.retry_delay * 2 ** (attempt - 1), MAX_RETRY_BACKOFF)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def _to_embedded(batch: List[Tuple[str, str]],
+                     vectors: List[List[float]],
+                     pending: Dict[str, Document]) -> List[Dict[str, Any]]:
+        """
+        Pair the embedded batch with its pending documents
+        """
+        embedded = []
+        for (doc_id, _), vector in zip(batch, vectors):
+            doc = pending.pop(doc_id)
+            embedded.append({
+                "id": doc_id,
+                "content": doc.page_content,
+                "metadata": doc.metadata,
+                "embedding": vector
+            })
+        return embedded
+
+    async def _insert_worker(self,
+                             queue: asyncio.Queue,
+                             report: IngestionReport,
+                             on_insert: Optional[Callable[[Dict[str, Any]], None]]):
+        """
+        Insert embedded documents into the vector store as they arrive
+        """
+        buffer = []
+
+        async def flush():
+            if not buffer:
+                return
+            vector_data = self.embedding_service.get_chroma_data(buffer)
+            buffer.clear()
+            try:
+                inserted_ids = await asyncio.to_thread(self.vector_store.insert, vector_data)
+                report.inserted_ids.extend(inserted_ids)
+                if on_insert:
+                    on_insert(vector_data)
+            except Exception as e:
+                # Keep draining the queue so embedding tasks never block on a dead writer
+                print(f"[IngestionEngine] Insert failed: {e}")
+
+        while True:
+            embedded = await queue.get()
+            if embedded is None:
+                await flush()
+                return
+            buffer.extend(embedded)
+            if len(buffer) >= self.insert_batch_size:
+                await flush()
@@ -0,0 +1,290 @@
+from typing import List, Dict, Tuple, Any, Iterable, Optional, Union
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+import asyncio
+import json
+import re
+import unicodedata
+import numpy as np
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+_CJK_CHARS = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"  # Kana and CJK ideographs
+_TOKEN_PATTERN = re.compile(rf"[{_CJK_CHARS}]+|[^\W_]+")
+_CJK_START = re.compile(rf"[{_CJK_CHARS}]")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenize text for lexical matching
+
+    Latin words and numbers are case-folded tokens. CJK runs have no word boundaries,
+    so they produce character unigrams and bigrams, which keeps multi-character
+    terms such as drug and disease names matchable without a dictionary.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        List[str]: Tokens
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(unicodedata.normalize("NFKC", text).casefold()):
+        token = match.group()
+        if _CJK_START.match(token):
+            tokens.extend(token)
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+def bm25_idf(doc_freq: np.ndarray, doc_count: int) -> np.ndarray:
+    """
+    BM25 inverse document frequency, always positive
+    """
+    return np.log1p((doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+class LexicalScorer:
+    """
+    In-process BM25 scorer over a small candidate set, vectorized with NumPy
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            k1: Term frequency saturation
+            b: Document length normalization
+        """
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query: str, documents: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score documents against a query
+
+        Args:
+            query: Query text
+            documents: Candidate documents
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: BM25 scores, and relevance scores in [0, 1]
+            given by the IDF-weighted share of query terms found in each document
+        """
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not documents or not query_terms:
+            zeros = np.zeros(len(documents), dtype=np.float32)
+            return zeros, zeros
+
+        columns: Dict[str, int] = {term: i for i, term in enumerate(query_terms)}
+        tf = np.zeros((len(documents), len(query_terms)), dtype=np.float32)
+        lengths = np.zeros(len(documents), dtype=np.float32)
+        for row, document in enumerate(documents):
+            tokens = tokenize(document)
+            lengths[row] = len(tokens)
+            for term, count in Counter(tokens).items():
+                column = columns.get(term)
+                if column is not None:
+                    tf[row, column] = count
+
+        doc_freq = (tf > 0).sum(axis=0)
+        idf = bm25_idf(doc_freq, len(documents)).astype(np.float32)
+        avg_length = max(float(lengths.mean()), 1.0)
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_length)
+        bm25 = (tf * (self.k1 + 1.0) / (tf + norm[:, None])) @ idf
+
+        relevance = ((tf > 0) @ idf) / float(idf.sum()) if idf.sum() > 0 else np.zeros(len(documents))
+        return bm25, relevance.astype(np.float32)
+
+class BM25Index:
+    """
+    Inverted BM25 index over the chunks of the knowledge base
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            k1: Term frequency saturation
+            b: Document length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self.version: Optional[str] = None
+        self.ids: List[str] = []
+        self.contents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self._terms: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._postings_docs = np.zeros(0, dtype=np.int32)
+        self._postings_tf = np.zeros(0, dtype=np.float32)
+        self._doc_lengths = np.zeros(0, dtype=np.float32)
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="lexical-search")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def build(self, documents: Iterable[Tuple[str, str, Dict[str, Any]]], version: Optional[str] = None):
+        """
+        Build the index
+
+        Args:
+            documents: (id, content, metadata) tuples
+            version: Index version of the documents
+        """
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        ids, contents, metadatas, lengths = [], [], [], []
+        for doc_index, (doc_id, content, metadata) in enumerate(documents):
+            tokens = tokenize(content)
+            for term, count in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_index, count))
+            ids.append(doc_id)
+            contents.append(content)
+            metadatas.append(metadata)
+            lengths.append(len(tokens))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        flat = [posting for term in terms for posting in postings[term]]
+
+        self.version = version
+        self.ids, self.contents, self.metadatas = ids, contents, metadatas
+        self._terms = {term: i for i, term in enumerate(terms)}
+        self._offsets = offsets
+        self._postings_docs = np.fromiter((doc for doc, _ in flat), dtype=np.int32, count=len(flat))
+        self._postings_tf = np.fromiter((tf for _, tf in flat), dtype=np.float32, count=len(flat))
+        self._doc_lengths = np.asarray(lengths, dtype=np.float32)
+
+        if DEBUG:
+            print(f"[BM25Index] Built index of {len(ids)} documents and {len(terms)} terms")
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        """
+        Search documents by BM25 score
+
+        Args:
+            query: Query text
+            limit: Search limit
+
+        Returns:
+            List[Dict]: Search results in the format of VectorStore.search, "score" is the BM25 score
+        """
+        doc_count = len(self.ids)
+        if doc_count == 0:
+            return []
+
+        scores = np.zeros(doc_count, dtype=np.float32)
+        avg_length = max(float(self._doc_lengths.mean()), 1.0)
+        norm = self.k1 * (1.0 - self.b + self.b * self._doc_lengths / avg_length)
+        for term in dict.fromkeys(tokenize(query)):
+            term_index = self._terms.get(term)
+            if term_index is None:
+                continue
+            start, end = self._offsets[term_index], self._offsets[term_index + 1]
+            docs = self._postings_docs[start:end]
+            tf = self._postings_tf[start:end]
+            idf = bm25_idf(np.float32(end - start), doc_count)
+            scores[docs] += idf * tf * (self.k1 + 1.0) / (tf + norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+
+        return [{
+            "id": self.ids[i],
+            "content": self.contents[i],
+            "metadata": self.metadatas[i],
+            "score": float(scores[i])
+        } for i in matched]
+
+    def submit_search(self, query: str, limit: int = 10) -> Future:
+        """
+        Start a BM25 search on the lexical search threads
+
+        Returns:
+            Future: Future of the search results
+        """
+        return self._executor.submit(self.search, query, limit)
+
+    async def asearch(self, query: str, limit: int = 10) -> List[Dict]:
+        """
+        Search documents by BM25 score on the lexical search threads
+        """
+        return await asyncio.wrap_future(self.submit_search(query, limit))
+
+    def save(self, path: Union[str, Path]):
+        """
+        Atomically save the index as a single .npz file
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = json.dumps({
+            "version": self.version,
+            "k1": self.k1,
+            "b": self.b,
+            "terms": sorted(self._terms, key=self._terms.get),
+            "ids": self.ids,
+            "contents": self.contents,
+            "metadatas": self.metadatas
+        }, ensure_ascii=False).encode("utf-8")
+        tmp_path = path.with_name(path.name + ".tmp")
+        with tmp_path.open("wb") as f:
+            np.savez(
+                f,
+                meta=np.frombuffer(meta, dtype=np.uint8),
+                offsets=self._offsets,
+                postings_docs=self._postings_docs,
+                postings_tf=self._postings_tf,
+                doc_lengths=self._doc_lengths
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> Optional['BM25Index']:
+        """
+        Load a saved index, return None if it is missing or unreadable
+        """
+        path = Path(path)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+                index = cls(k1=meta["k1"], b=meta["b"])
+                index._offsets = data["offsets"]
+                index._postings_docs = data["postings_docs"]
+                index._postings_tf = data["postings_tf"]
+                index._doc_lengths = data["doc_lengths"]
+            index.version = meta["version"]
+            index.ids = meta["ids"]
+            index.contents = meta["contents"]
+            index.metadatas = meta["metadatas"]
+            index._terms = {term: i for i, term in enumerate(meta["terms"])}
+            return index
+        except Exception as e:
+            print(f"[BM25Index] Failed to load index {path}: {e}")
+            return None
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict]], limit: int = 10, k: int = 60) -> List[Dict]:
+    """
+    Fuse ranked search result lists by reciprocal rank fusion
+
+    Args:
+        result_lists: Search results of each retriever, best first, identified by "id"
+        limit: Number of fused results
+        k: Rank smoothing constant
+
+    Returns:
+        List[Dict]: Fused results, keeping the first retriever's entry of every document
+        and its fused score as "rrf_score"
+    """
+    fused: Dict[str, Dict] = {}
+    scores: Dict[str, float] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results):
+            doc_id = result["id"]
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+            fused.setdefault(doc_id, result)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [{**fused[doc_id], "rrf_score": scores[doc_id]} for doc_id in ranked]
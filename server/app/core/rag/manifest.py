@@ -0,0 +1,184 @@
+from typing import Dict, Any, List, Optional, Set, Union
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
+from langchain.schema import Document
+from dotenv import load_dotenv
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+MANIFEST_VERSION = 1
+
+def chunk_id(document: Document) -> str:
+    """
+    Get the content-addressed ID of a document chunk
+
+    The ID only depends on the source file name, source type and chunk content,
+    so an unchanged chunk keeps its ID across restarts and re-chunking.
+
+    Args:
+        document: Document chunk
+
+    Returns:
+        str: Chunk ID
+    """
+    metadata = document.metadata or {}
+    source_name = Path(str(metadata.get("source", ""))).name
+    digest = hashlib.sha256()
+    digest.update(str(metadata.get("type", "")).encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(source_name.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(document.page_content.encode("utf-8"))
+    return f"chunk_{digest.hexdigest()[:32]}"
+
+def source_key(source: Dict[str, Any]) -> str:
+    """
+    Get the key identifying a data source of config.json in the manifest
+    """
+    return f"{source.get('type', 'text')}:{source['filename']}"
+
+def source_fingerprint(source: Dict[str, Any], path: Union[str, Path]) -> str:
+    """
+    Fingerprint a data source by its configuration and raw file content
+
+    Args:
+        source: Data source configuration
+        path: Data source path
+
+    Returns:
+        str: Hex digest, changes whenever the config entry or the file changes
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(source, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    path = Path(path)
+    if path.is_file():
+        with path.open("rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+class IndexManifest:
+    """
+    Persisted record of the chunks held in a vector store collection, grouped by data source
+    """
+    def __init__(self, path: Union[str, Path], embedding_model: Optional[str] = None):
+        """
+        Initialize an empty manifest
+
+        Args:
+            path: Manifest file path
+            embedding_model: Embedding model the indexed vectors were produced with
+        """
+        self.path = Path(path)
+        self.embedding_model = embedding_model
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        self.updated_at: Optional[int] = None
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'IndexManifest':
+        """
+        Load the manifest from disk, return an empty one if it is missing or unreadable
+        """
+        manifest = cls(path)
+        if not manifest.path.exists():
+            return manifest
+        try:
+            with manifest.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != MANIFEST_VERSION:
+                print(f"[IndexManifest] Ignoring manifest with unsupported version: {data.get('version')}")
+                return manifest
+            manifest.embedding_model = data.get("embedding_model")
+            manifest.sources = data.get("sources", {})
+            manifest.updated_at = data.get("updated_at")
+        except Exception as e:
+            print(f"[IndexManifest] Failed to load manifest {manifest.path}: {e}")
+        return manifest
+
+    def save(self):
+        """
+        Atomically write the manifest to disk
+        """
+        self.updated_at = int(time.time())
+        data = {
+            "version": MANIFEST_VERSION,
+            "embedding_model": self.embedding_model,
+            "updated_at": self.updated_at,
+            "index_version": self.index_version(),
+            "sources": self.sources
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        if DEBUG:
+            print(f"[IndexManifest] Manifest saved to {self.path}")
+
+    def reset(self, embedding_model: Optional[str] = None):
+        """
+        Forget all indexed sources
+        """
+        self.embedding_model = embedding_model
+        self.sources = {}
+
+    def chunk_ids(self, exclude: Optional[str] = None) -> Set[str]:
+        """
+        Get all chunk IDs recorded in the manifest
+
+        Args:
+            exclude: Source key to leave out
+        """
+        ids = set()
+        for key, entry in self.sources.items():
+            if key != exclude:
+                ids.update(entry.get("chunks", []))
+        return ids
+
+    def total_chunks(self) -> int:
+        return len(self.chunk_ids())
+
+    def index_version(self) -> str:
+        """
+        Get a version string of the indexed content, changes whenever chunks are added or removed
+        """
+        digest = hashlib.sha256(str(self.embedding_model).encode("utf-8"))
+        for chunk in sorted(self.chunk_ids()):
+            digest.update(chunk.encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def is_current(self, key: str, fingerprint: str) -> bool:
+        """
+        Check whether a source is indexed with the given fingerprint
+        """
+        entry = self.sources.get(key)
+        return entry is not None and entry.get("fingerprint") == fingerprint
+
+    def update_source(self, key: str, fingerprint: str, chunks: List[str], complete: bool = True):
+        """
+        Record the indexed chunks of a source
+
+        Args:
+            key: Source key
+            fingerprint: Source fingerprint
+            chunks: IDs of the chunks stored for the source
+            complete: False if some chunks failed to index, forces a retry on next sync
+        """
+        self.sources[key] = {
+            "fingerprint": fingerprint if complete else None,
+            "chunks": sorted(set(chunks))
+        }
+
+    def remove_source(self, key: str) -> List[str]:
+        """
+        Remove a source from the manifest
+
+        Returns:
+            List[str]: Chunk IDs that were recorded for the source
+        """
+        entry = self.sources.pop(key, None)
+        return entry.get("chunks", []) if entry else []
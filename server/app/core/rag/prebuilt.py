@@ -0,0 +1,143 @@
+from typing import Dict, Any, Optional, Union, Callable
+from pathlib import Path
+import json
+import shutil
+import time
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+INDEX_INFO_FILE = "index.json"
+LATEST_FILE = "LATEST"
+PREBUILT_VERSION = 1
+
+# The embedding snapshot is a build cache, a published index does not need it
+_EXCLUDED = ("snapshot", "*.tmp")
+
+def publish_index(index_dir: Union[str, Path],
+                  output_dir: Union[str, Path],
+                  version: str,
+                  info: Dict[str, Any],
+                  prepare: Optional[Callable[[Path], None]] = None) -> Path:
+    """
+    Publish a built index as an immutable, versioned directory
+
+    The vector store, manifest and BM25 index in `index_dir` are copied to
+    `<output_dir>/<version>` together with an index.json describing them, and
+    `<output_dir>/LATEST` is pointed at the new version. The copy is written to a
+    temporary directory first, so a published version is always complete.
+
+    Args:
+        index_dir: Directory of the built index
+        output_dir: Directory holding the published versions
+        version: Index version, the name of the published directory
+        info: Description of the index stored in index.json
+        prepare: Called with the copied directory before it is published, e.g. to
+            let the vector store finish its files
+
+    Returns:
+        Path: Published index directory
+    """
+    output_dir = Path(output_dir)
+    target = output_dir / version
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if _is_published(target, info):
+        print(f"[PrebuiltIndex] Index version {version} is already published: {target}")
+    else:
+        tmp_dir = output_dir / f".{version}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.copytree(index_dir, tmp_dir, ignore=shutil.ignore_patterns(*_EXCLUDED))
+        if prepare is not None:
+            prepare(tmp_dir)
+        with (tmp_dir / INDEX_INFO_FILE).open("w", encoding="utf-8") as f:
+            json.dump({
+                **info,
+                "format": PREBUILT_VERSION,
+                "version": version,
+                "created_at": int(time.time())
+            }, f, ensure_ascii=False, indent=2)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_dir, target)
+        print(f"[PrebuiltIndex] Published index version {version}: {target}")
+
+    latest_tmp = output_dir / f"{LATEST_FILE}.tmp"
+    latest_tmp.write_text(version, encoding="utf-8")
+    os.replace(latest_tmp, output_dir / LATEST_FILE)
+    return target
+
+def _is_published(target: Path, info: Dict[str, Any]) -> bool:
+    """
+    Check whether the same index, e.g. not of another vector store backend, is published at `target`
+    """
+    try:
+        with (target / INDEX_INFO_FILE).open("r", encoding="utf-8") as f:
+            published = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return all(published.get(key) == value for key, value in info.items() if key != "stats")
+
+def resolve_index(path: Union[str, Path]) -> Path:
+    """
+    Resolve a published index directory
+
+    Args:
+        path: A published index directory, or a directory of published versions
+            whose LATEST version is used
+
+    Returns:
+        Path: Published index directory
+    """
+    path = Path(path)
+    if (path / INDEX_INFO_FILE).exists():
+        return path
+    latest = path / LATEST_FILE
+    if latest.exists():
+        resolved = path / latest.read_text(encoding="utf-8").strip()
+        if (resolved / INDEX_INFO_FILE).exists():
+            return resolved
+    raise ValueError(f"No prebuilt index found at {path}")
+
+def read_index_info(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Read the description of a published index
+
+    Args:
+        path: Published index directory or directory of published versions
+
+    Returns:
+        Dict[str, Any]: Content of index.json, with "path" set to the resolved directory
+    """
+    path = resolve_index(path)
+    with (path / INDEX_INFO_FILE).open("r", encoding="utf-8") as f:
+        info = json.load(f)
+    if info.get("format") != PREBUILT_VERSION:
+        raise ValueError(f"Unsupported prebuilt index format: {info.get('format')}")
+    info["path"] = str(path)
+    return info
+
+def prune_versions(output_dir: Union[str, Path], keep: int) -> int:
+    """
+    Delete the oldest published versions, always keeping the LATEST one
+
+    Args:
+        output_dir: Directory holding the published versions
+        keep: Number of versions to keep
+
+    Returns:
+        int: Number of deleted versions
+    """
+    output_dir = Path(output_dir)
+    versions = sorted(
+        (path for path in output_dir.iterdir() if (path / INDEX_INFO_FILE).exists()),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True
+    )
+    latest = resolve_index(output_dir) if versions else None
+    deleted = 0
+    for path in versions[max(keep, 1):]:
+        if path != latest:
+            shutil.rmtree(path, ignore_errors=True)
+            deleted += 1
+    return deleted
@@ -0,0 +1,207 @@
+from typing import Dict, Any, Optional, List, Tuple
+from pathlib import Path
+import argparse
+import tempfile
+import time
+import numpy as np
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+class Int8Quantizer:
+    """
+    Symmetric int8 quantization with one float32 scale per vector
+
+    A code row holds `dim` int8 values followed by the 4 bytes of the scale,
+    so rows can be appended without refitting any global statistics.
+    """
+    name = "int8"
+
+    def code_size(self, dim: int) -> int:
+        return dim + 4
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Encode float vectors
+
+        Args:
+            vectors: (n, dim) float matrix
+
+        Returns:
+            np.ndarray: (n, code_size) uint8 codes
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return np.hstack([codes.view(np.uint8), scales.astype(np.float32)[:, None].view(np.uint8)])
+
+    def approximate_distances(self, codes: np.ndarray, norms: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        Approximate squared L2 distances of all code rows to the query
+
+        Args:
+            codes: (n, code_size) uint8 codes
+            norms: Exact squared norms of the encoded vectors
+            query: float32 query vector
+        """
+        dim = codes.shape[1] - 4
+        scales = np.ascontiguousarray(codes[:, dim:]).view(np.float32).ravel()
+        dots = np.empty(len(codes), dtype=np.float32)
+        block = 16384
+        for start in range(0, len(codes), block):
+            dots[start:start + block] = codes[start:start + block, :dim].view(np.int8).astype(np.float32) @ query
+        return norms - 2.0 * scales * dots + float(query @ query)
+
+class BinaryQuantizer:
+    """
+    One bit per dimension, the sign of the value, compared by Hamming distance
+    """
+    name = "binary"
+
+    def code_size(self, dim: int) -> int:
+        return (dim + 7) // 8
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+    def approximate_distances(self, codes: np.ndarray, norms: np.ndarray, query: np.ndarray) -> np.ndarray:
+        query_bits = np.packbits(query > 0)
+        distances = np.empty(len(codes), dtype=np.float32)
+        block = 65536
+        for start in range(0, len(codes), block):
+            distances[start:start + block] = _POPCOUNT[codes[start:start + block] ^ query_bits].sum(axis=1, dtype=np.int32)
+        return distances
+
+QUANTIZERS = {
+    Int8Quantizer.name: Int8Quantizer,
+    BinaryQuantizer.name: BinaryQuantizer
+}
+
+def get_quantizer(name: Optional[str]):
+    """
+    Get a quantizer by name
+
+    Args:
+        name: "int8", "binary", or "none"/None for full precision only
+
+    Returns:
+        Int8Quantizer, BinaryQuantizer or None
+    """
+    if name is None or name.lower() in ("", "none"):
+        return None
+    if name.lower() not in QUANTIZERS:
+        raise ValueError(f"Unsupported quantization: {name}")
+    return QUANTIZERS[name.lower()]()
+
+def quantization_report(reference_store,
+                        queries: np.ndarray,
+                        limit: int = 10,
+                        quantizations: Tuple[str, ...] = ("none", "int8", "binary"),
+                        rescore_factor: int = 4) -> List[Dict[str, Any]]:
+    """
+    Compare quantized flat indexes with a reference vector store
+
+    Every stored vector of `reference_store` is copied into a temporary
+    FlatVectorStore per quantization. Recall is the share of the reference
+    top-k IDs that the quantized index also returns.
+
+    Args:
+        reference_store: Vector store to compare with, e.g. the Chroma `VectorStore`
+        queries: (n, dim) query vectors
+        limit: Top-k of every search
+        quantizations: Quantizations to compare
+        rescore_factor: Shortlist size as a multiple of `limit`
+
+    Returns:
+        List[Dict[str, Any]]: One row per index with recall, mean/p95 latency in ms and bytes per vector
+    """
+    from server.app.core.rag.flat_store import FlatVectorStore
+
+    def measure(search) -> Dict[str, Any]:
+        results, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append([result["id"] for result in search(query.tolist(), limit)])
+            latencies.append((time.perf_counter() - start) * 1000)
+        return {
+            "results": results,
+            "latency_ms": float(np.mean(latencies)),
+            "p95_latency_ms": float(np.percentile(latencies, 95))
+        }
+
+    reference = measure(reference_store.search)
+    dim = queries.shape[1]
+    rows = [{
+        "index": type(reference_store).__name__,
+        "recall": 1.0,
+        "latency_ms": reference["latency_ms"],
+        "p95_latency_ms": reference["p95_latency_ms"],
+        "bytes_per_vector": dim * 4
+    }]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for quantization in quantizations:
+            store = FlatVectorStore(
+                collection_name=f"report_{quantization}",
+                persist_directory=tmp_dir,
+                quantization=quantization,
+                rescore_factor=rescore_factor
+            )
+            for batch in reference_store.export_batches():
+                store.insert(batch)
+
+            measured = measure(store.search)
+            recalls = [
+                len(set(found) & set(expected)) / len(expected)
+                for found, expected in zip(measured["results"], reference["results"]) if expected
+            ]
+            quantizer = get_quantizer(quantization)
+            rows.append({
+                "index": f"FlatVectorStore[{quantization}]",
+                "recall": float(np.mean(recalls)) if recalls else 0.0,
+                "latency_ms": measured["latency_ms"],
+                "p95_latency_ms": measured["p95_latency_ms"],
+                "bytes_per_vector": quantizer.code_size(dim) if quantizer else dim * 4
+            })
+    return rows
+
+def main():
+    """
+    Print a recall/latency report of the quantized indexes against the persisted Chroma collection
+    """
+    parser = argparse.ArgumentParser(description="Compare quantized vector indexes with the Chroma vector store")
+    parser.add_argument("--queries", type=int, default=200, help="Number of stored chunks sampled as queries")
+    parser.add_argument("--limit", type=int, default=10, help="Top-k of every search")
+    parser.add_argument("--rescore-factor", type=int, default=4, help="Shortlist size as a multiple of the limit")
+    parser.add_argument("--noise", type=float, default=0.05, help="Relative Gaussian noise added to the sampled queries")
+    args = parser.parse_args()
+
+    project_root = Path(__file__).resolve().parent.parent.parent.parent.parent
+    from server.app.core.rag.store import VectorStore
+
+    store = VectorStore(
+        collection_name="medical_knowledge",
+        persist_directory=str(project_root / "server" / "data" / "vectors")
+    )
+    batches = [np.asarray(batch["vectors"], dtype=np.float32) for batch in store.export_batches()]
+    if not batches:
+        print("The vector store is empty, index the knowledge base first")
+        return
+
+    vectors = np.concatenate(batches)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+    queries = queries + rng.normal(size=queries.shape).astype(np.float32) * args.noise * np.abs(queries).mean()
+
+    print(f"{len(vectors)} vectors, {queries.shape[1]} dimensions, {len(queries)} queries, top {args.limit}")
+    print(f"{'index':<28}{'recall':>8}{'mean ms':>10}{'p95 ms':>10}{'bytes/vec':>11}")
+    for row in quantization_report(store, queries, args.limit, rescore_factor=args.rescore_factor):
+        print(f"{row['index']:<28}{row['recall']:>8.3f}{row['latency_ms']:>10.2f}{row['p95_latency_ms']:>10.2f}{row['bytes_per_vector']:>11}")
+
+if __name__ == "__main__":
+    main()
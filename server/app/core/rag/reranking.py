@@ -2,8 +2,12 @@ from typing import List, Dict, Any, Optional, Tuple
 import os
 import requests
 import time
+import asyncio
 from dotenv import load_dotenv
 from dataclasses import dataclass
+from server.app.utils.http import AsyncHTTPClient
+from server.app.core.rag.cache import RerankScoreCache
+from server.app.core.rag.lexical import LexicalScorer
 
 load_dotenv()
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
@@ -18,6 +22,7 @@ class RerankResult:
     relevance_score: float        # Reranking score
     index: int                    # Index after reranking
     metadata: Dict[str, Any]      # Metadata
+    fallback: bool = False        # Scored by the local reranker after the reranking API failed
 
 class Reranker:
     def __init__(self,
@@ -25,7 +30,11 @@ class Reranker:
                  api_key: str = os.getenv("RERANKING_API_KEY"),
                  model_name: str = os.getenv("RERANKING_MODEL_NAME"),
                  max_retries: int = 3,
-                 retry_delay: int = 1):
+                 retry_delay: int = 1,
+                 score_cache_size: int = int(os.getenv("RERANK_CACHE_SIZE", "4096")),
+                 score_cache_ttl: float = float(os.getenv("RERANK_CACHE_TTL", "3600")),
+                 backend: str = os.getenv("RERANKING_BACKEND", "remote"),
+                 latency_budget: float = float(os.getenv("RERANKING_LATENCY_BUDGET", "0"))):
         """
         Initialize reranker
         
@@ -35,16 +44,47 @@ class Reranker:
             model_name: Model name. Default: BAAI/bge-reranker-v2-m3
             max_retries: Maximum retries
             retry_delay: Retry delay (seconds)
+            score_cache_size: Maximum number of cached (query, chunk) scores, 0 disables the cache
+            score_cache_ttl: Seconds a cached score stays valid, 0 never expires
+            backend: "remote" for the reranking API with local fallback, "local" for the in-process lexical reranker only
+            latency_budget: Seconds to wait for the reranking API before falling back to the local reranker, 0 waits for all retries
         """
         self.base_url = base_url
         self.api_key = api_key
         self.model = model_name
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self._http = AsyncHTTPClient()
+        self.score_cache = RerankScoreCache(score_cache_size, score_cache_ttl) if score_cache_size > 0 else None
+        self.backend = backend.lower()
+        self.latency_budget = latency_budget if latency_budget > 0 else None
+        self.lexical_scorer = LexicalScorer()
         
-        if not all([self.base_url, self.api_key]):
+        if self.backend not in ("remote", "local"):
+            raise ValueError(f"Unsupported reranking backend: {backend}")
+        if self.backend == "remote" and not all([self.base_url, self.api_key]):
             raise ValueError("Missing required configuration for reranking. Check your .env file.")
         
+    def _payload(self, query: str, documents: List[str], top_n: Optional[int]) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "query": query,
+            "documents": documents,
+            "return_documents": False,
+            "max_chunks_per_doc": 1024,
+            "overlap_tokens": 80
+        }
+        
+        if top_n is not None:
+            payload["top_n"] = top_n
+        return payload
+    
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+    
     def _get_rerank(self, 
                         query: str, 
                         documents: List[str],
@@ -60,34 +100,42 @@ class Reranker:
         Returns:
             Dict: Full response from the reranking API
         """
-        payload = {
-            "model": self.model,
-            "query": query,
-            "documents": documents,
-            "return_documents": True,
-            "max_chunks_per_doc": 1024,
-            "overlap_tokens": 80
-        }
+        payload = self._payload(query, documents, top_n)
         
-        if top_n is not None:
-            payload["top_n"] = top_n
-            
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        # Within a latency budget there is no time to retry, fail fast to the local reranker
+        max_retries = 1 if self.latency_budget else self.max_retries
+        retries = 0
+        while retries < max_retries:
+            try:
+                response = requests.post(self.base_url, json=payload, headers=self._headers(), timeout=self.latency_budget)
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                retries += 1
+                if retries == max_retries:
+                    raise ValueError(f"Reranking API call failed after {max_retries} retries: {e}")
+                time.sleep(self.retry_delay)
+    
+    async def _aget_rerank(self,
+                           query: str,
+                           documents: List[str],
+                           top_n: Optional[int] = 5) -> Dict[str, Any]:
+        """
+        Call reranking API without blocking the event loop
+        """
+        payload = self._payload(query, documents, top_n)
         
         retries = 0
         while retries < self.max_retries:
             try:
-                response = requests.post(self.base_url, json=payload, headers=headers)
+                response = await self._http.get().post(self.base_url, json=payload, headers=self._headers())
                 response.raise_for_status()
                 return response.json()
             except Exception as e:
                 retries += 1
                 if retries == self.max_retries:
                     raise ValueError(f"Reranking API call failed after {self.max_retries} retries: {e}")
-                time.sleep(self.retry_delay)
+                await asyncio.sleep(self.retry_delay)
     
     def rerank(self, query: str, search_results: List[Dict], top_k: Optional[int] = 5) -> Tuple[List[RerankResult], float]:
         """
@@ -104,63 +152,187 @@ class Reranker:
         if DEBUG:
             print(f"\n[Reranker] Reranking {len(search_results)} search results")
         
+        if self.backend == "local":
+            return self.local_rerank(query, search_results, top_k)
+        
         try:
             documents = [result["content"] for result in search_results]
+            scores, uncached = self._split_cached(query, documents)
             
-            # Call reranking API
-            api_response = self._get_rerank(
-                query=query,
-                documents=documents,
-                top_n=top_k
-            )
-            
-            reranked = []
-            max_relevance_score = 0.0
-            
-            for result in api_response["results"]:
-                relevance_score = float(result["relevance_score"])
-                max_relevance_score = max(max_relevance_score, relevance_score)
-                original_result = search_results[result["index"]]
-                
-                reranked.append(RerankResult(
-                    content=result["document"]["text"],
-                    score=original_result.get("score", 0.0),
-                    relevance_score=relevance_score,
-                    index=result["index"],
-                    metadata=original_result["metadata"]
-                ))
-            
-            if DEBUG:
-                print(f"[Reranker] Reranking completed")
-                print(f"[Reranker] Highest relevance score: {max_relevance_score:.3f}")
-                if reranked:
-                    print(f"[Reranker] Most relevant document (score={reranked[0].relevance_score:.3f}): {reranked[0].content[:100]}...")
-            
-            return reranked, max_relevance_score
+            # Call reranking API for the pairs that were not scored yet
+            if uncached:
+                api_response = self._get_rerank(
+                    query=query,
+                    documents=[documents[i] for i in uncached],
+                    top_n=self._api_top_n(top_k)
+                )
+                self._collect_scores(query, documents, uncached, api_response, scores)
+            return self._merge_results(scores, search_results, top_k)
             
         except Exception as e:
-            print(f"[Reranker] Reranking failed, using original order: {e}")
-            # If API call fails, revert to using original retrieval scores
-            reranked = []
-            max_relevance_score = 0.0
-            
-            for idx, result in enumerate(search_results):
-                relevance_score = 1.0 - (result.get("score", 0.0) or 0.0)
-                max_relevance_score = max(max_relevance_score, relevance_score)
-                
-                reranked.append(RerankResult(
-                    content=result["content"],
-                    score=result.get("score", 0.0),
-                    relevance_score=relevance_score,
-                    index=idx,
-                    metadata=result["metadata"]
-                ))
+            return self._fallback_results(query, search_results, top_k, e)
+    
+    async def arerank(self, query: str, search_results: List[Dict], top_k: Optional[int] = 5) -> Tuple[List[RerankResult], float]:
+        """
+        Rerank search results without blocking the event loop
+        
+        Args:
+            query: Query text
+            search_results: List of search results
+            top_k: Number of results to return
             
-            # Sort by relevance score
-            reranked.sort(key=lambda x: x.relevance_score, reverse=True)
+        Returns:
+            Tuple[List[RerankResult], float]: Reranking results list and highest relevance score
+        """
+        if DEBUG:
+            print(f"\n[Reranker] Reranking {len(search_results)} search results")
+        
+        if self.backend == "local":
+            return self.local_rerank(query, search_results, top_k)
+        
+        try:
+            documents = [result["content"] for result in search_results]
+            scores, uncached = self._split_cached(query, documents)
+            if uncached:
+                api_response = await asyncio.wait_for(
+                    self._aget_rerank(
+                        query=query,
+                        documents=[documents[i] for i in uncached],
+                        top_n=self._api_top_n(top_k)
+                    ),
+                    timeout=self.latency_budget
+                )
+                self._collect_scores(query, documents, uncached, api_response, scores)
+            return self._merge_results(scores, search_results, top_k)
+        
+        except Exception as e:
+            return self._fallback_results(query, search_results, top_k, e)
+    
+    async def aclose(self):
+        """
+        Close the async HTTP client
+        """
+        await self._http.aclose()
+    
+    def _api_top_n(self, top_k: Optional[int]) -> Optional[int]:
+        """
+        Every score is needed when caching, otherwise let the API truncate to top_k
+        """
+        return None if self.score_cache is not None else top_k
+    
+    def _split_cached(self, query: str, documents: List[str]) -> Tuple[Dict[int, float], List[int]]:
+        """
+        Look up cached scores
+
+        Returns:
+            Tuple[Dict[int, float], List[int]]: Cached scores by document index and indexes of unscored documents
+        """
+        scores = {}
+        uncached = []
+        for i, document in enumerate(documents):
+            score = self.score_cache.get_score(query, document, self.model) if self.score_cache is not None else None
+            if score is None:
+                uncached.append(i)
+            else:
+                scores[i] = score
+        if DEBUG and scores:
+            print(f"[Reranker] {len(scores)}/{len(documents)} scores served from cache")
+        return scores, uncached
+    
+    def _collect_scores(self,
+                        query: str,
+                        documents: List[str],
+                        uncached: List[int],
+                        api_response: Dict[str, Any],
+                        scores: Dict[int, float]):
+        """
+        Add the scores of a reranking API response, whose indexes refer to the uncached documents
+        """
+        for result in api_response["results"]:
+            i = uncached[result["index"]]
+            scores[i] = float(result["relevance_score"])
+            if self.score_cache is not None:
+                self.score_cache.put_score(query, documents[i], self.model, scores[i])
+    
+    def _merge_results(self,
+                       scores: Dict[int, float],
+                       search_results: List[Dict],
+                       top_k: Optional[int]) -> Tuple[List[RerankResult], float]:
+        """
+        Order search results by relevance score
+        """
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if top_k is not None:
+            ranked = ranked[:top_k]
+        
+        reranked = []
+        max_relevance_score = 0.0
+        
+        for i, relevance_score in ranked:
+            max_relevance_score = max(max_relevance_score, relevance_score)
+            original_result = search_results[i]
             
-            if DEBUG:
-                print(f"[Reranker] Using original retrieval scores")
-                print(f"[Reranker] Highest relevance score: {max_relevance_score:.3f}")
+            reranked.append(RerankResult(
+                content=original_result["content"],
+                score=original_result.get("score", 0.0),
+                relevance_score=relevance_score,
+                index=i,
+                metadata=original_result["metadata"]
+            ))
+        
+        if DEBUG:
+            print(f"[Reranker] Reranking completed")
+            print(f"[Reranker] Highest relevance score: {max_relevance_score:.3f}")
+            if reranked:
+                print(f"[Reranker] Most relevant document (score={reranked[0].relevance_score:.3f}): {reranked[0].content[:100]}...")
+        
+        return reranked, max_relevance_score
+    
+    def local_rerank(self, query: str, search_results: List[Dict], top_k: Optional[int] = 5) -> Tuple[List[RerankResult], float]:
+        """
+        Rerank search results in process by BM25 over the candidates, no network involved
+        
+        Args:
+            query: Query text
+            search_results: List of search results
+            top_k: Number of results to return
             
-            return reranked, max_relevance_score
+        Returns:
+            Tuple[List[RerankResult], float]: Reranking results list and highest relevance score
+        """
+        documents = [result["content"] for result in search_results]
+        bm25, relevance = self.lexical_scorer.score(query, documents)
+        
+        # Stable sort keeps the retrieval order among equally scored documents
+        order = sorted(range(len(documents)), key=lambda i: -bm25[i])
+        if top_k is not None:
+            order = order[:top_k]
+        
+        reranked = [RerankResult(
+            content=search_results[i]["content"],
+            score=search_results[i].get("score", 0.0),
+            relevance_score=float(relevance[i]),
+            index=i,
+            metadata=search_results[i]["metadata"]
+        ) for i in order]
+        max_relevance_score = max((result.relevance_score for result in reranked), default=0.0)
+        
+        if DEBUG:
+            print(f"[Reranker] Local reranking completed")
+            print(f"[Reranker] Highest relevance score: {max_relevance_score:.3f}")
+        
+        return reranked, max_relevance_score
+    
+    def _fallback_results(self,
+                          query: str,
+                          search_results: List[Dict],
+                          top_k: Optional[int],
+                          error: Exception) -> Tuple[List[RerankResult], float]:
+        """
+        Rerank locally when the reranking API fails or exceeds the latency budget
+        """
+        print(f"[Reranker] Reranking API failed, using local reranker: {error!r}")
+        reranked, max_relevance_score = self.local_rerank(query, search_results, top_k)
+        for result in reranked:
+            result.fallback = True
+        return reranked, max_relevance_score
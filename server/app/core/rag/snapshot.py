@@ -0,0 +1,326 @@
+from typing import Dict, Any, Optional, List, Iterator, Union, Tuple
+from pathlib import Path
+import json
+import threading
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+SNAPSHOT_VERSION = 1
+MAX_SEGMENTS = 32
+# Rows per Parquet row group, the unit read when restoring chunks
+ROW_GROUP_SIZE = 1024
+
+_RECORD_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("row", pa.int64()),
+    ("content", pa.string()),
+    ("metadata", pa.string())
+])
+
+class EmbeddingSnapshot:
+    """
+    Compact on-disk snapshot of the embedded chunks
+
+    A snapshot is a directory holding:
+        vectors-<n>.f32        raw row-major float32 vectors, appended to and memory-mapped on load
+        records-<n>.parquet    one segment per append with id, vector row, content and
+                               the remaining metadata as JSON
+        snapshot.json          embedding model, dimension, row count, current files and deleted IDs
+
+    Appends only add a segment and extend the vector block, and snapshot.json is
+    replaced atomically afterwards, so an interrupted write leaves the previous
+    snapshot intact. When an ID is written again, the latest row wins.
+    """
+    def __init__(self, path: Union[str, Path], embedding_model: Optional[str] = None):
+        """
+        Open or create a snapshot
+
+        Args:
+            path: Snapshot directory
+            embedding_model: Embedding model of the vectors, a snapshot of another model is cleared
+        """
+        self.path = Path(path)
+        self.embedding_model = embedding_model
+        self._lock = threading.RLock()
+        self._locations: Optional[Dict[str, Tuple[int, int]]] = None
+        self._state = self._read_state()
+        if embedding_model is not None and self._state["embedding_model"] not in (None, embedding_model):
+            print(f"[EmbeddingSnapshot] Embedding model changed, clearing snapshot {self.path}")
+            self.clear()
+
+    def _read_state(self) -> Dict[str, Any]:
+        state_path = self.path / "snapshot.json"
+        if state_path.exists():
+            try:
+                with state_path.open("r", encoding="utf-8") as f:
+                    state = json.load(f)
+                if state.get("version") == SNAPSHOT_VERSION:
+                    return state
+                print(f"[EmbeddingSnapshot] Ignoring snapshot with unsupported version: {state.get('version')}")
+            except Exception as e:
+                print(f"[EmbeddingSnapshot] Failed to read snapshot {state_path}: {e}")
+        return self._empty_state(0)
+
+    def _empty_state(self, next_segment: int) -> Dict[str, Any]:
+        return {
+            "version": SNAPSHOT_VERSION,
+            "embedding_model": self.embedding_model,
+            "dim": None,
+            "rows": 0,
+            "vectors": f"vectors-{next_segment:06d}.f32",
+            "segments": [],
+            "deleted": [],
+            "next_segment": next_segment + 1,
+            "updated_at": None
+        }
+
+    def _write_state(self):
+        self._locations = None
+        self._state["updated_at"] = int(time.time())
+        tmp_path = self.path / "snapshot.json.tmp"
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(self._state, f)
+        os.replace(tmp_path, self.path / "snapshot.json")
+
+    @property
+    def vectors_path(self) -> Path:
+        return self.path / self._state["vectors"]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index())
+
+    def append(self, vector_data: Dict[str, Any]) -> Dict[str, Path]:
+        """
+        Append embedded chunks
+
+        Args:
+            vector_data: Vector data in Chroma format
+
+        Returns:
+            Dict[str, Path]: Paths of the vector block and the new record segment
+        """
+        ids = list(vector_data["ids"])
+        if not ids:
+            return {}
+        vectors = np.ascontiguousarray(vector_data["vectors"], dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError(f"Expected {len(ids)} vectors, got shape {vectors.shape}")
+
+        with self._lock:
+            state = self._state
+            if state["dim"] is None:
+                state["dim"] = vectors.shape[1]
+            if vectors.shape[1] != state["dim"]:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match snapshot dimension {state['dim']}")
+            self.path.mkdir(parents=True, exist_ok=True)
+
+            start = state["rows"]
+            metadatas = [{key: value for key, value in meta.items() if key != "content"} for meta in vector_data["metadata"]]
+            table = pa.table({
+                "id": ids,
+                "row": np.arange(start, start + len(ids), dtype=np.int64),
+                "content": [meta.get("content", "") for meta in vector_data["metadata"]],
+                "metadata": [json.dumps(meta, ensure_ascii=False) for meta in metadatas]
+            }, schema=_RECORD_SCHEMA)
+            segment = f"records-{state['next_segment']:06d}.parquet"
+            pq.write_table(table, self.path / segment, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+
+            # Drop rows of an interrupted append before extending the vector block
+            with self.vectors_path.open("ab") as f:
+                f.truncate(start * state["dim"] * 4)
+                f.write(vectors.tobytes())
+
+            state["rows"] = start + len(ids)
+            state["segments"].append(segment)
+            state["next_segment"] += 1
+            state["embedding_model"] = self.embedding_model or state["embedding_model"]
+            if state["deleted"]:
+                state["deleted"] = sorted(set(state["deleted"]) - set(ids))
+            self._write_state()
+
+        if DEBUG:
+            print(f"[EmbeddingSnapshot] Appended {len(ids)} vectors to {self.path / segment}")
+        paths = {"vectors": self.vectors_path, "records": self.path / segment}
+        if len(self._state["segments"]) > MAX_SEGMENTS:
+            self.compact()
+        return paths
+
+    def delete(self, ids: List[str]):
+        """
+        Mark chunks as deleted, compacting the snapshot once most rows are deleted
+        """
+        ids = set(ids)
+        if not ids or self._state["rows"] == 0:
+            return
+        with self._lock:
+            deleted = set(self._state["deleted"]) | ids
+            self._state["deleted"] = sorted(deleted)
+            self._write_state()
+        if len(deleted) * 2 > self._state["rows"]:
+            self.compact()
+
+    def clear(self):
+        """
+        Remove all chunks
+        """
+        with self._lock:
+            for segment in self._state["segments"]:
+                (self.path / segment).unlink(missing_ok=True)
+            self.vectors_path.unlink(missing_ok=True)
+            self._state = self._empty_state(self._state["next_segment"])
+            self._locations = None
+            if self.path.exists():
+                self._write_state()
+
+    def _index(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Location (segment, row) of the live row of every ID, read from the ID columns only
+        """
+        if self._locations is not None:
+            return self._locations
+        locations = {}
+        for segment, name in enumerate(self._state["segments"]):
+            ids = pq.read_table(self.path / name, columns=["id"]).column("id").to_pylist()
+            # Keep the last row of every ID
+            for row, doc_id in enumerate(ids):
+                locations.pop(doc_id, None)
+                locations[doc_id] = (segment, row)
+        for doc_id in self._state["deleted"]:
+            locations.pop(doc_id, None)
+        self._locations = locations
+        return locations
+
+    def _iter_tables(self, segments: List[str], locations: Dict[str, Tuple[int, int]], ids: Optional[set] = None) -> Iterator[pa.Table]:
+        """
+        Read the live records one row group at a time, only the row groups holding wanted rows
+
+        Args:
+            segments: Record segments of the snapshot
+            locations: Location of the live row of every ID
+            ids: Only read these IDs
+        """
+        wanted = locations.values() if ids is None else (locations[doc_id] for doc_id in ids if doc_id in locations)
+        rows_by_segment: Dict[int, List[int]] = {}
+        for segment, row in wanted:
+            rows_by_segment.setdefault(segment, []).append(row)
+
+        for segment in sorted(rows_by_segment):
+            rows = np.sort(np.array(rows_by_segment[segment], dtype=np.int64))
+            parquet = pq.ParquetFile(self.path / segments[segment])
+            start = 0
+            for group in range(parquet.metadata.num_row_groups):
+                end = start + parquet.metadata.row_group(group).num_rows
+                selected = rows[(rows >= start) & (rows < end)]
+                if len(selected):
+                    yield parquet.read_row_group(group).take(pa.array(selected - start))
+                start = end
+
+    def _table(self) -> pa.Table:
+        """
+        Record table of the live chunks, one row per ID
+        """
+        tables = list(self._iter_tables(self._state["segments"], self._index()))
+        return pa.concat_tables(tables) if tables else _RECORD_SCHEMA.empty_table()
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Load the snapshot without copying the vectors
+
+        The record table holds the content of every chunk, use `ids` or
+        `iter_batches` to read the snapshot with flat memory.
+
+        Returns:
+            Dict[str, Any]: "vectors", a read-only memory map of all vector rows,
+            and "records", the record table of the live chunks whose "row" column
+            indexes into "vectors"
+        """
+        with self._lock:
+            state = dict(self._state)
+            table = self._table()
+        return {"vectors": self._vectors(state), "records": table, "embedding_model": state["embedding_model"]}
+
+    def _vectors(self, state: Dict[str, Any]) -> np.ndarray:
+        if not state["rows"]:
+            return np.zeros((0, state["dim"] or 0), dtype=np.float32)
+        return np.memmap(self.path / state["vectors"], dtype=np.float32, mode="r", shape=(state["rows"], state["dim"]))
+
+    def ids(self) -> List[str]:
+        """
+        Get the IDs of the live chunks, in the order of their rows
+        """
+        with self._lock:
+            locations = self._index()
+            return sorted(locations, key=locations.get)
+
+    def iter_batches(self, batch_size: int = 1000, ids: Optional[set] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over the live chunks in Chroma format
+
+        Only the row groups holding the yielded chunks are read, one at a time.
+
+        Args:
+            batch_size: Chunks per batch
+            ids: Only yield these IDs
+
+        Yields:
+            Dict[str, Any]: Batches in the format accepted by `VectorStore.insert`
+        """
+        with self._lock:
+            state = dict(self._state)
+            locations = self._index()
+        vectors = self._vectors(state)
+        for table in self._iter_tables(state["segments"], locations, ids):
+            for batch in table.to_batches(max_chunksize=batch_size):
+                rows = batch.column("row").to_numpy()
+                metadatas = []
+                for content, metadata in zip(batch.column("content").to_pylist(), batch.column("metadata").to_pylist()):
+                    metadatas.append({"content": content, **json.loads(metadata)})
+                yield {
+                    "ids": batch.column("id").to_pylist(),
+                    "vectors": vectors[rows].tolist(),
+                    "metadata": metadatas
+                }
+
+    def compact(self):
+        """
+        Rewrite the snapshot as a single segment without deleted or overwritten rows
+        """
+        with self._lock:
+            table = self._table()
+            if self._state["rows"] == 0:
+                return
+            vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                shape=(self._state["rows"], self._state["dim"]))
+            rows = table.column("row").to_numpy()
+            compacted = np.ascontiguousarray(vectors[rows])
+            del vectors
+
+            table = table.set_column(1, "row", pa.array(np.arange(len(rows), dtype=np.int64)))
+            generation = self._state["next_segment"]
+            segment = f"records-{generation:06d}.parquet"
+            vectors_file = f"vectors-{generation:06d}.f32"
+            pq.write_table(table, self.path / segment, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+            (self.path / vectors_file).write_bytes(compacted.tobytes())
+
+            old_files = self._state["segments"] + [self._state["vectors"]]
+            self._state.update({
+                "rows": len(rows),
+                "vectors": vectors_file,
+                "segments": [segment],
+                "deleted": [],
+                "next_segment": generation + 1
+            })
+            self._write_state()
+            for old_file in old_files:
+                (self.path / old_file).unlink(missing_ok=True)
+
+        if DEBUG:
+            print(f"[EmbeddingSnapshot] Compacted snapshot to {len(rows)} vectors")
@@ -2,8 +2,9 @@ from typing import Dict, Any, Optional, List
 from pathlib import Path
 import chromadb
 from chromadb.config import Settings
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import time
-import gc
 from dotenv import load_dotenv
 import os
 
@@ -13,17 +14,25 @@ DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 class VectorStore:
     def __init__(self, 
                  collection_name: str = "medical_knowledge",
-                 persist_directory: Optional[str] = None):
+                 persist_directory: Optional[str] = None,
+                 reset: bool = False,
+                 search_workers: int = int(os.getenv("VECTOR_SEARCH_WORKERS", "4"))):
         """
         Initialize vector database Chroma
         
         Args:
             collection_name: Collection name
             persist_directory: Persistent directory path, if not provided, use in-memory storage
+            reset: Drop the existing collection instead of reusing the persisted one
+            search_workers: Threads serving async searches, bounds concurrent Chroma queries
         """
         try:
             self.collection_name = collection_name
             self.persist_directory = persist_directory
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, search_workers),
+                thread_name_prefix="vector-search"
+            )
             
             # Configure Chroma settings
             settings = Settings(
@@ -36,32 +45,31 @@ class VectorStore:
             # Initialize client
             self.client = chromadb.Client(settings)
             
-            # If the collection exists, delete it
-            try:
-                if self.client.get_collection(collection_name):
-                    self.client.delete_collection(collection_name)
-            except:
-                pass
+            if reset:
+                self.drop_collection()
             
-            # Create new collection
-            self.collection = self.client.create_collection(
+            # Reuse the persisted collection if it exists
+            self.collection = self.client.get_or_create_collection(
                 name=collection_name,
                 metadata={"description": "Medical knowledge base"}
             )
             
             if DEBUG:   
-                print(f"[VectorStore] Successfully initialized vector store: {collection_name}")
+                print(f"[VectorStore] Successfully initialized vector store: {collection_name} ({self.collection.count()} documents)")
             
         except Exception as e:
             print(f"[VectorStore] Initialization failed: {str(e)}")
             raise
     
-    def insert(self, data: Dict[str, Any]):
+    def insert(self, data: Dict[str, Any]) -> List[str]:
         """
-        Insert data by batch
+        Insert data by batch, existing IDs are overwritten
 
         Args:
             data: Data in Chroma format
+
+        Returns:
+            List[str]: IDs of the inserted documents
         """
         try:
             documents = [meta["content"] for meta in data["metadata"]]
@@ -71,6 +79,7 @@ class VectorStore:
             
             batch_size = 32
             total_docs = len(documents)
+            inserted_ids = []
             
             if DEBUG:
                 print(f"\n[VectorStore] Starting to insert {total_docs} documents in batches")
@@ -88,12 +97,13 @@ class VectorStore:
                     print(f"[VectorStore] Preparing to insert {i+1}-{end_idx} documents")
                 
                 try:
-                    self.collection.add(
+                    self.collection.upsert(
                         ids=batch_data["ids"],
                         embeddings=batch_data["embeddings"],
                         documents=batch_data["documents"],
                         metadatas=batch_data["metadatas"]
                     )
+                    inserted_ids.extend(batch_data["ids"])
                     if DEBUG:
                         print(f"[VectorStore] Successfully inserted {i+1}-{end_idx} documents")
                     
@@ -102,12 +112,13 @@ class VectorStore:
                     retry_count = 3
                     for attempt in range(retry_count):
                         try:
-                            self.collection.add(
+                            self.collection.upsert(
                                 ids=batch_data["ids"],
                                 embeddings=batch_data["embeddings"],
                                 documents=batch_data["documents"],
                                 metadatas=batch_data["metadatas"]
                             )
+                            inserted_ids.extend(batch_data["ids"])
                             if DEBUG:
                                 print(f"[VectorStore] Successfully inserted {i+1}-{end_idx} documents (Retry {attempt + 1})")
                             break
@@ -117,13 +128,12 @@ class VectorStore:
                     else:
                         print(f"[VectorStore] Failed to insert {i+1}-{end_idx} documents, skipping this batch")
                         continue
-                
-                gc.collect()
-                time.sleep(1)
 
             if DEBUG:
                 print("[VectorStore] Data insertion completed")
             
+            return inserted_ids
+            
         except Exception as e:
             print(f"[VectorStore] Insert data failed: {str(e)}")
             raise ValueError(f"Failed to insert data: {str(e)}")
@@ -169,12 +179,126 @@ class VectorStore:
             print(f"[VectorStore] Search failed: {e}")
             raise ValueError(f"Search failed: {e}")
     
+    async def asearch(self, query_vector: List[float], limit: int = 10) -> List[Dict]:
+        """
+        Search for the most similar vector on the search thread pool, without blocking the event loop
+
+        Args:
+            query_vector: Query vector
+            limit: Search limit
+            
+        Returns:
+            List[Dict]: Search results
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.search, query_vector, limit)
+    
+    def delete(self, ids: List[str]):
+        """
+        Delete documents by ID
+
+        Args:
+            ids: Document IDs
+        """
+        ids = list(ids)
+        batch_size = 256
+        try:
+            for i in range(0, len(ids), batch_size):
+                self.collection.delete(ids=ids[i:i + batch_size])
+            if DEBUG and ids:
+                print(f"[VectorStore] Deleted {len(ids)} documents")
+        except Exception as e:
+            print(f"[VectorStore] Delete failed: {e}")
+            raise ValueError(f"Failed to delete data: {e}")
+    
+    def iter_documents(self, batch_size: int = 1000):
+        """
+        Iterate over all stored documents without their embeddings
+
+        Args:
+            batch_size: Documents fetched per Chroma call
+
+        Yields:
+            Tuple[str, str, Dict]: Document ID, content and metadata
+        """
+        offset = 0
+        while True:
+            batch = self.collection.get(
+                include=["documents", "metadatas"],
+                limit=batch_size,
+                offset=offset
+            )
+            if not batch["ids"]:
+                break
+            yield from zip(batch["ids"], batch["documents"], batch["metadatas"])
+            offset += len(batch["ids"])
+    
+    def export_batches(self, batch_size: int = 1000):
+        """
+        Iterate over all stored documents with their embeddings
+
+        Args:
+            batch_size: Documents fetched per Chroma call
+
+        Yields:
+            Dict[str, Any]: Batches in the format accepted by `insert`
+        """
+        offset = 0
+        while True:
+            batch = self.collection.get(
+                include=["embeddings", "metadatas"],
+                limit=batch_size,
+                offset=offset
+            )
+            if not batch["ids"]:
+                break
+            yield {
+                "ids": batch["ids"],
+                "vectors": [list(vector) for vector in batch["embeddings"]],
+                "metadata": batch["metadatas"]
+            }
+            offset += len(batch["ids"])
+    
+    def count(self) -> int:
+        """
+        Get the number of stored documents
+        """
+        return self.collection.count()
+    
+    def warm_up(self):
+        """
+        Load the vector index into memory with a single query
+        
+        Chroma loads the HNSW index lazily and applies writes it has not persisted
+        yet to the index files on load, so this also brings a copied collection up to date.
+        """
+        if self.collection.count() == 0:
+            return
+        # Reading embeddings with get() rewrites the index files again, so query by dimension when it is known
+        dimension = getattr(getattr(self.collection, "_model", None), "dimension", None)
+        if dimension:
+            query_vector = [0.0] * dimension
+        else:
+            query_vector = list(self.collection.get(limit=1, include=["embeddings"])["embeddings"][0])
+        self.collection.query(query_embeddings=[query_vector], n_results=1)
+    
+    def reset_collection(self):
+        """
+        Drop all stored documents and recreate an empty collection
+        """
+        self.drop_collection()
+        self.collection = self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata={"description": "Medical knowledge base"}
+        )
+    
     def drop_collection(self):
         """
         Drop collection
         """
         try:
-            self.client.delete_collection(self.collection_name)
+            if self.collection_name in [c.name for c in self.client.list_collections()]:
+                self.client.delete_collection(self.collection_name)
         except Exception as e:
             print(f"[VectorStore] Drop collection failed: {e}")
     
@@ -183,3 +307,38 @@ class VectorStore:
         Get collection instance
         """
         return self.collection
+
+def create_vector_store(collection_name: str = "medical_knowledge",
+                        persist_directory: Optional[str] = None,
+                        backend: str = os.getenv("VECTOR_STORE_BACKEND", "chroma"),
+                        **kwargs):
+    """
+    Create the vector store of the configured backend
+
+    Args:
+        collection_name: Collection name
+        persist_directory: Persistent directory path
+        backend: "chroma" for the Chroma `VectorStore`, "flat" for the memory-mapped `FlatVectorStore`
+        **kwargs: Backend specific arguments
+
+    Returns:
+        VectorStore or FlatVectorStore
+    """
+    backend = backend.lower()
+    if backend == "chroma":
+        return VectorStore(collection_name=collection_name, persist_directory=persist_directory, **kwargs)
+    if backend == "flat":
+        from server.app.core.rag.flat_store import FlatVectorStore
+        return FlatVectorStore(collection_name=collection_name, persist_directory=persist_directory, **kwargs)
+    raise ValueError(f"Unsupported vector store backend: {backend}")
+
+def warm_up_vector_store(collection_name: str, persist_directory: str, backend: str, **kwargs) -> int:
+    """
+    Open a persisted vector store and load its index, see `VectorStore.warm_up`
+
+    Returns:
+        int: Number of stored documents
+    """
+    store = create_vector_store(collection_name, persist_directory, backend, **kwargs)
+    store.warm_up()
+    return store.count()
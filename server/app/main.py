@@ -1,10 +1,9 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from server.app.api.routes import server
+from server.app.api.routes import server, openai_compatible
 from server.app.utils.config import RAGPipeline
-
-# Initialize RAG Pipeline at startup
-rag_pipeline = RAGPipeline.get_instance()
+from server.app.core.models.history import close_history_backends
 
 app = FastAPI(title="SympAI API")
 
@@ -17,11 +16,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Make RAG pipeline available to the app
-app.state.rag_pipeline = rag_pipeline
-
 app.include_router(server.router)
+app.include_router(openai_compatible.router)
+
+@app.on_event("startup")
+async def start_rag_pipeline():
+    # Build the index in the background, the server accepts requests meanwhile
+    app.state.rag_pipeline = RAGPipeline.get_instance(background=True)
+
+@app.on_event("shutdown")
+async def close_rag_pipeline():
+    await app.state.rag_pipeline.aclose()
+
+@app.on_event("shutdown")
+async def flush_chat_histories():
+    # Write the buffered chat histories before the process exits
+    close_history_backends()
+
+@app.on_event("shutdown")
+async def flush_token_usage():
+    # Write the metered token usage of the OpenAI-compatible API
+    openai_compatible.usage_meter.close()
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"} 
+    return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Report whether the knowledge base is ready, with 503 until it is
+    """
+    readiness = app.state.rag_pipeline.readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness) 
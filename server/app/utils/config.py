@@ -1,102 +1,397 @@
 import sys
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Optional, List, Dict, Any, Tuple
 import threading
+import asyncio
+import time
+import contextlib
+import psutil
+from filelock import FileLock, Timeout
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 from server.app.core.rag.data_preprocess import DataPreprocessor
 from server.app.core.rag.embedding import EmbeddingService
-from server.app.core.rag.store import VectorStore
+from server.app.core.rag.store import create_vector_store, warm_up_vector_store
 from server.app.core.rag.indexing import VectorIndexer
-from server.app.core.rag.reranking import Reranker
+from server.app.core.rag.reranking import Reranker, RerankResult
 from server.app.core.rag.generator import PromptGenerator
+from server.app.core.rag.cache import SemanticCache
+from server.app.core.rag.lexical import BM25Index, reciprocal_rank_fusion
+from server.app.core.rag.prebuilt import publish_index, read_index_info
+from server.app.utils.tokens import TokenBudget
 
 class RAGPipeline:
     """RAG pipeline for enhancing prompts with relevant context"""
     _instance: Optional['RAGPipeline'] = None
     _lock = threading.Lock()
     _initialized = False
+    # Serializes building the writable index across worker processes
+    index_lock_path = PROJECT_ROOT / "server" / "data" / "vectors" / "medical_knowledge.lock"
 
-    def __new__(cls):
+    def __new__(cls, background: bool = False):
         if not cls._instance:
             with cls._lock:
                 if not cls._instance:
                     cls._instance = super().__new__(cls)
         return cls._instance
 
-    def __init__(self):
+    def __init__(self, background: bool = False):
         with self._lock:
-            if not self._initialized:
-                print("Initializing new RAG Pipeline instance...")
-                self._initialize_components()
-                self._setup_database()
-                RAGPipeline._initialized = True
-                print("RAG Pipeline initialization completed.")
+            if self._initialized:
+                return
+            type(self)._initialized = True
+            self._ready = threading.Event()
+            self.status: Dict[str, Any] = {"state": "starting", "progress": {}, "error": None, "started_at": time.time(), "ready_at": None}
+            if background:
+                threading.Thread(target=self._initialize, kwargs={"raise_errors": False}, name="rag-warm-up", daemon=True).start()
+            else:
+                try:
+                    self._initialize()
+                except Exception:
+                    type(self)._initialized = False
+                    raise
 
     @classmethod
-    def get_instance(cls) -> 'RAGPipeline':
-        """Get or create RAGPipeline instance"""
-        instance = cls()
+    def get_instance(cls, background: bool = False) -> 'RAGPipeline':
+        """
+        Get or create RAGPipeline instance
+        
+        Args:
+            background: Initialize a new instance on a background thread and return at once,
+                prompts are served without context until `is_ready`
+        """
+        instance = cls(background)
         return instance
 
+    def _initialize(self, raise_errors: bool = True):
+        """Initialize the components and the index, recording the progress in `status`"""
+        try:
+            print("Initializing new RAG Pipeline instance...")
+            self.status["state"] = "loading"
+            with self._index_lock():
+                self._initialize_components()
+                self._setup_database()
+            self.status["state"] = "warming"
+            self.vector_store.warm_up()
+            self.status.update({"state": "ready", "ready_at": time.time()})
+            self._ready.set()
+            print(f"RAG Pipeline initialization completed in {self.status['ready_at'] - self.status['started_at']:.1f}s.")
+            memory = self.memory_usage()
+            print(f"Worker {memory['pid']} memory: {memory['rss_mb']} MB resident, {memory['uss_mb']} MB private, "
+                  f"{memory['shared_mb']} MB shared")
+        except Exception as e:
+            self.status.update({"state": "failed", "error": str(e)})
+            print(f"RAG Pipeline initialization failed: {e}")
+            if raise_errors:
+                raise
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        """
+        Let one worker process at a time build or open the writable index
+        
+        With several uvicorn workers, the first one syncs the index while the others
+        wait, then open the synced index without embedding anything. A prebuilt index
+        is never written, so it is opened without the lock.
+        """
+        if os.getenv("INDEX_SNAPSHOT", "").strip():
+            yield
+            return
+        self.index_lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock = FileLock(str(self.index_lock_path))
+        try:
+            lock.acquire(timeout=0)
+        except Timeout:
+            print(f"Worker {os.getpid()} waiting for another worker to build the index...")
+            self.status["state"] = "waiting"
+            lock.acquire()
+            self.status["state"] = "loading"
+        try:
+            yield
+        finally:
+            lock.release()
+
+    @staticmethod
+    def memory_usage() -> Dict[str, Any]:
+        """
+        Get the memory of this worker process in MB
+        
+        "uss" is private to the process, "shared" includes memory-mapped index files
+        that all workers map, and "pss" splits shared pages among the processes
+        mapping them, so summing it over the workers gives their real total.
+        """
+        process = psutil.Process()
+        info = process.memory_full_info()
+        to_mb = lambda value: round(value / (1 << 20), 1) if value is not None else None
+        return {
+            "pid": process.pid,
+            "rss_mb": to_mb(info.rss),
+            "uss_mb": to_mb(getattr(info, "uss", None)),
+            "pss_mb": to_mb(getattr(info, "pss", None)),
+            "shared_mb": to_mb(getattr(info, "shared", None))
+        }
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the pipeline is ready
+
+        Returns:
+            bool: True if ready, False on timeout
+        """
+        return self._ready.wait(timeout)
+
+    def readiness(self) -> Dict[str, Any]:
+        """
+        Get the initialization state and progress of the pipeline
+
+        Returns:
+            Dict[str, Any]: "ready", "state" (starting, waiting, loading, indexing, warming, ready
+            or failed), indexing "progress", "index_version", "error", elapsed "seconds" and the
+            "memory" of this worker
+        """
+        status = dict(self.status)
+        end = status["ready_at"] or time.time()
+        return {
+            "ready": self.is_ready,
+            "state": status["state"],
+            "progress": dict(status["progress"]),
+            "index_version": getattr(self, "index_version", None),
+            "read_only": getattr(self, "read_only", None),
+            "error": status["error"],
+            "seconds": round(end - status["started_at"], 3),
+            "memory": self.memory_usage()
+        }
+
+    def _on_index_progress(self, progress: Dict[str, Any]):
+        self.status["progress"] = progress
+
     def _initialize_components(self):
         """Initialize all RAG components"""
         try:
             os.environ["CHROMA_BATCH_SIZE"] = "32"
             self.vector_db_path = PROJECT_ROOT / "server" / "data"
             self.config_path = self.vector_db_path / "config.json"
-            self.db_dir = self.vector_db_path / "vectors"
-            self.db_dir.mkdir(parents=True, exist_ok=True)
+            
+            # A prebuilt index is served read-only, without syncing the data sources
+            prebuilt_index = os.getenv("INDEX_SNAPSHOT", "").strip()
+            self.index_info = read_index_info(prebuilt_index) if prebuilt_index else None
+            self.read_only = self.index_info is not None
+            if self.read_only:
+                self.db_dir = Path(self.index_info["path"])
+                self.vector_store_backend = self.index_info["backend"]
+                store_options = self.index_info.get("store_options", {})
+            else:
+                self.db_dir = self.vector_db_path / "vectors"
+                self.db_dir.mkdir(parents=True, exist_ok=True)
+                self.vector_store_backend = os.getenv("VECTOR_STORE_BACKEND", "chroma").lower()
+                store_options = {}
+            self.manifest_path = self.db_dir / "medical_knowledge_manifest.json"
+            self.lexical_index_path = self.db_dir / "medical_knowledge_bm25.npz"
 
             self.preprocessor = DataPreprocessor()
             self.embedding_service = EmbeddingService()
-            self.vector_store = VectorStore(
+            self.vector_store = create_vector_store(
                 collection_name="medical_knowledge",
-                persist_directory=str(self.db_dir)
+                persist_directory=str(self.db_dir),
+                backend=self.vector_store_backend,
+                **store_options
             )
-            self.indexer = VectorIndexer(
+            self.indexer = None if self.read_only else VectorIndexer(
                 embedding_service=self.embedding_service,
                 vector_store=self.vector_store
             )
             self.reranker = Reranker()
             self.generator = PromptGenerator()
+            
+            semantic_cache_size = int(os.getenv("SEMANTIC_CACHE_SIZE", "0"))
+            self.semantic_cache = SemanticCache(
+                max_size=semantic_cache_size,
+                threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+            ) if semantic_cache_size > 0 else None
+            self.index_version = None
+            self.hybrid_retrieval = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+            self.lexical_index: Optional[BM25Index] = None
             print("RAG Pipeline components initialized successfully")
         except Exception as e:
             print(f"Failed to initialize RAG components: {e}")
             raise
 
     def _setup_database(self):
-        """Setup and index the vector database"""
+        """Setup the vector database, only indexing data sources changed since the last run"""
+        if self.read_only:
+            self._open_prebuilt_index()
+            return
         try:
-            self.documents = self.preprocessor.process(self.config_path)
-            print(f"\nProcessed {len(self.documents)} document chunks")
-            self.preprocessor.splitter.print_split_result(self.documents)
-            self.indexer.index_documents(self.documents)
+            self.status["state"] = "indexing"
+            self.index_stats = self.indexer.sync_sources(
+                preprocessor=self.preprocessor,
+                config_path=self.config_path,
+                manifest_path=self.manifest_path,
+                on_progress=self._on_index_progress
+            )
+            self._set_index_version(self.index_stats["version"])
+            if self.hybrid_retrieval:
+                self.lexical_index = self._load_lexical_index()
         except Exception as e:
             print(f"Failed to setup vector database: {e}")
             raise
 
-    def get_enhanced_prompt(self, query: str) -> str:
+    def _open_prebuilt_index(self):
+        """Serve a prebuilt index as it is"""
+        info = self.index_info
+        if info.get("embedding_model") != self.embedding_service.model:
+            print(f"Warning: prebuilt index was embedded with {info.get('embedding_model')}, "
+                  f"queries are embedded with {self.embedding_service.model}")
+        self.index_stats = {"added": 0, "deleted": 0, "unchanged": info.get("chunks", 0), "version": info["version"]}
+        self._set_index_version(info["version"])
+        if self.hybrid_retrieval:
+            self.lexical_index = self._load_lexical_index()
+        print(f"Opened prebuilt index {info['version']} of {info.get('chunks', 0)} chunks read-only: {self.db_dir}")
+
+    def publish(self, output_dir: Path) -> Path:
+        """
+        Publish the synced index as a versioned prebuilt index
+
+        Args:
+            output_dir: Directory holding the published versions
+
+        Returns:
+            Path: Published index directory
+        """
+        if self.read_only:
+            raise ValueError("A prebuilt index can not be published again")
+        if self.hybrid_retrieval and self.lexical_index is None:
+            self.lexical_index = self._load_lexical_index()
+        store_options = {}
+        if self.vector_store_backend == "flat":
+            store_options = {"dtype": self.vector_store.dtype, "quantization": self.vector_store.quantization}
+        
+        def prepare(path: Path):
+            # Chroma finishes the index files of a copied collection when a new process
+            # first loads it, so do that once here and serving never writes to the index
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                pool.submit(
+                    warm_up_vector_store, "medical_knowledge", str(path), self.vector_store_backend, **store_options
+                ).result()
+        
+        return publish_index(self.db_dir, output_dir, self.index_version, {
+            "embedding_model": self.embedding_service.model,
+            "backend": self.vector_store_backend,
+            "store_options": store_options,
+            "chunks": self.vector_store.count(),
+            "stats": {key: value for key, value in self.index_stats.items() if key != "version"}
+        }, prepare=prepare)
+
+    def _set_index_version(self, version: str):
+        """
+        Record the version of the indexed content, invalidating cached retrieval results
+        """
+        self.index_version = version
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear(version)
+
+    def _load_lexical_index(self) -> BM25Index:
+        """
+        Load the persisted BM25 index, rebuilding it from the vector store if it is
+        missing or was built for another index version
+        """
+        index = BM25Index.load(self.lexical_index_path)
+        if index is not None and index.version == self.index_version:
+            print(f"Loaded BM25 index of {len(index)} chunks")
+            return index
+        
+        index = BM25Index()
+        index.build(self.vector_store.iter_documents(), version=self.index_version)
+        if not self.read_only:
+            index.save(self.lexical_index_path)
+        print(f"Built BM25 index of {len(index)} chunks")
+        return index
+
+    def _search(self, query: str, query_vector: List[float], limit: int = 10) -> List[Dict]:
+        """
+        Search relevant documents, fusing vector and BM25 results when hybrid retrieval is enabled
+        """
+        if self.lexical_index is None:
+            return self.vector_store.search(query_vector=query_vector, limit=limit)
+        
+        # The lexical search runs on its own threads while the vector search runs here
+        lexical_future = self.lexical_index.submit_search(query, limit)
+        vector_results = self.vector_store.search(query_vector=query_vector, limit=limit)
+        return reciprocal_rank_fusion([vector_results, lexical_future.result()], limit=limit)
+
+    async def _asearch(self, query: str, query_vector: List[float], limit: int = 10) -> List[Dict]:
+        """
+        Search relevant documents without blocking the event loop, see `_search`
+        """
+        if self.lexical_index is None:
+            return await self.vector_store.asearch(query_vector=query_vector, limit=limit)
+        
+        vector_results, lexical_results = await asyncio.gather(
+            self.vector_store.asearch(query_vector=query_vector, limit=limit),
+            self.lexical_index.asearch(query, limit)
+        )
+        return reciprocal_rank_fusion([vector_results, lexical_results], limit=limit)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters of the retrieval caches
+        """
+        if not self.is_ready:
+            return {"index_version": None, "query_embedding": None, "semantic": None, "rerank_score": None}
+        query_cache = self.embedding_service.query_cache
+        score_cache = self.reranker.score_cache
+        return {
+            "index_version": self.index_version,
+            "query_embedding": query_cache.stats() if query_cache is not None else None,
+            "semantic": self.semantic_cache.stats() if self.semantic_cache is not None else None,
+            "rerank_score": score_cache.stats() if score_cache is not None else None
+        }
+
+    def _cached_results(self, query_vector: List[float]) -> Optional[Tuple[List[RerankResult], float]]:
+        if self.semantic_cache is None:
+            return None
+        return self.semantic_cache.lookup(query_vector, self.index_version)
+
+    def _cache_results(self, query_vector: List[float], reranked_results: List[RerankResult], max_relevance_score: float):
+        # Results of the local fallback are only a stand-in until the reranking API recovers
+        if any(result.fallback for result in reranked_results):
+            return
+        if self.semantic_cache is not None:
+            self.semantic_cache.store(query_vector, self.index_version, (reranked_results, max_relevance_score))
+
+    def get_enhanced_prompt(self, query: str, budget: Optional[TokenBudget] = None) -> str:
         """
         Get RAG-enhanced prompt for a given query
         
         Args:
             query: User's input query
+            budget: Token budget of the chat, limiting the retrieved context
             
         Returns:
             Enhanced prompt with relevant context
         """
+        if not self.is_ready:
+            # Serve without context while the index is being built
+            return query
         try:
             # Get query embedding
             query_vector = self.embedding_service.embed_query(query)
             
+            # Reuse the results of a semantically equivalent query
+            cached = self._cached_results(query_vector)
+            if cached is not None:
+                return self._build_prompt(query, *cached, budget=budget)
+            
             # Search relevant documents
-            search_results = self.vector_store.search(
-                query_vector=query_vector,
-                limit=10
-            )
+            search_results = self._search(query, query_vector, limit=10)
             
             # Rerank results
             reranked_results, max_relevance_score = self.reranker.rerank(
@@ -104,22 +399,77 @@ class RAGPipeline:
                 search_results=search_results,
                 top_k=5
             )
+            self._cache_results(query_vector, reranked_results, max_relevance_score)
+            
+            return self._build_prompt(query, reranked_results, max_relevance_score, budget=budget)
+        except Exception as e:
+            print(f"Error generating enhanced prompt: {e}")
+            # Fallback to original query if RAG fails
+            return query
+
+    async def aget_enhanced_prompt(self, query: str, budget: Optional[TokenBudget] = None) -> str:
+        """
+        Get RAG-enhanced prompt for a given query without blocking the event loop
+        
+        Embedding and reranking use async HTTP, the vector and BM25 searches run
+        concurrently on their search thread pools.
+        
+        Args:
+            query: User's input query
+            budget: Token budget of the chat, limiting the retrieved context
+            
+        Returns:
+            Enhanced prompt with relevant context
+        """
+        if not self.is_ready:
+            return query
+        try:
+            query_vector = await self.embedding_service.aembed_query(query)
+            
+            cached = self._cached_results(query_vector)
+            if cached is not None:
+                return self._build_prompt(query, *cached, budget=budget)
             
-            # Prepare documents for prompt
-            documents_for_prompt = [{
-                "content": result.content,
-                "metadata": result.metadata
-            } for result in reranked_results]
+            search_results = await self._asearch(query, query_vector, limit=10)
             
-            # Generate enhanced prompt
-            enhanced_prompt = self.generator.generate(
+            reranked_results, max_relevance_score = await self.reranker.arerank(
                 query=query,
-                documents=documents_for_prompt,
-                max_relevance_score=max_relevance_score
+                search_results=search_results,
+                top_k=5
             )
+            self._cache_results(query_vector, reranked_results, max_relevance_score)
             
-            return enhanced_prompt
+            return self._build_prompt(query, reranked_results, max_relevance_score, budget=budget)
         except Exception as e:
             print(f"Error generating enhanced prompt: {e}")
             # Fallback to original query if RAG fails
             return query
+
+    def _build_prompt(self, query: str, reranked_results: List[RerankResult], max_relevance_score: float,
+                      budget: Optional[TokenBudget] = None) -> str:
+        """
+        Generate the enhanced prompt from reranked documents, within the RAG share of the token budget
+        """
+        # Prepare documents for prompt
+        documents_for_prompt = [{
+            "content": result.content,
+            "metadata": result.metadata
+        } for result in reranked_results]
+        
+        # Generate enhanced prompt
+        return self.generator.generate(
+            query=query,
+            documents=documents_for_prompt,
+            max_relevance_score=max_relevance_score,
+            max_context_tokens=budget.rag if budget else None,
+            model_name=budget.model_name if budget else None
+        )
+
+    async def aclose(self):
+        """
+        Release the async HTTP clients
+        """
+        if hasattr(self, "embedding_service"):
+            await self.embedding_service.aclose()
+        if hasattr(self, "reranker"):
+            await self.reranker.aclose()
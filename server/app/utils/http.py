@@ -0,0 +1,41 @@
+from typing import Optional
+import asyncio
+import httpx
+
+class AsyncHTTPClient:
+    """
+    Lazily created httpx.AsyncClient bound to the running event loop
+
+    Keeps one connection pool per service so keep-alive connections are reused across
+    requests, and transparently recreates the client if it is used from another loop.
+    """
+    def __init__(self, timeout: float = 30.0, max_connections: int = 100,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get(self) -> httpx.AsyncClient:
+        """
+        Get the client of the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections),
+                transport=self.transport
+            )
+            self._loop = loop
+        return self._client
+
+    async def aclose(self):
+        """
+        Close the client of the running event loop
+        """
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
@@ -0,0 +1,189 @@
+from typing import List, Optional, Sequence, Any
+from dataclasses import dataclass
+from functools import lru_cache
+import re
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+# Prompt tokens of a chat request (0 disables token budgets), and the shares of the RAG context and the summary
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "8192"))
+RAG_CONTEXT_SHARE = float(os.getenv("RAG_CONTEXT_SHARE", "0.4"))
+SUMMARY_TOKEN_SHARE = float(os.getenv("SUMMARY_TOKEN_SHARE", "0.1"))
+# Tokens left for the reply when max_tokens is not set
+REPLY_RESERVE = 1024
+
+# Context windows by model name substring, the longest match wins
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "claude-3": 200000,
+    "Llama-3.1": 128000,
+    "Mixtral-8x7B": 32768,
+    "Qwen": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens OpenAI adds per chat message and to prime the reply
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 3
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the number of tokens of a text without a tokenizer
+
+    CJK characters usually take about one token each, other text about four characters per token.
+    """
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+@lru_cache(maxsize=32)
+def get_encoding(model_name: Optional[str]):
+    """
+    Get the cached tiktoken encoding of a model
+
+    Unknown models use o200k_base. None is returned if the encoding is not
+    available, e.g. offline without a tiktoken cache, and token counts are estimated.
+    """
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model_name or "")
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"[Tokens] tiktoken encoding unavailable for {model_name}, estimating token counts: {e}")
+        return None
+
+@lru_cache(maxsize=8192)
+def _count_cached(text: str, model_name: Optional[str]) -> int:
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    """
+    Count the tokens of a text, counts of repeated texts such as history messages are cached
+
+    Args:
+        text: Text to count
+        model_name: Model whose tokenizer is used
+
+    Returns:
+        int: Number of tokens
+    """
+    if not text:
+        return 0
+    return _count_cached(text, model_name)
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    # Multimodal content, count its text parts
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+def count_message_tokens(messages: Sequence[Any], model_name: Optional[str] = None) -> int:
+    """
+    Count the prompt tokens of chat messages, including the per-message overhead
+
+    Args:
+        messages: LangChain messages
+        model_name: Model whose tokenizer is used
+
+    Returns:
+        int: Number of tokens
+    """
+    return sum(MESSAGE_OVERHEAD + count_tokens(_content_text(message.content), model_name) for message in messages)
+
+def context_window(model_name: Optional[str]) -> int:
+    """
+    Get the context window of a model
+    """
+    matches = [name for name in MODEL_CONTEXT_WINDOWS if model_name and name.lower() in model_name.lower()]
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+@dataclass(frozen=True)
+class TokenBudget:
+    """
+    Prompt token budget of a chat request split between its parts
+    """
+    model_name: Optional[str]
+    total: int                    # Prompt tokens, within the model's context window
+    system: int                   # Tokens of the system prompt
+    rag: int                      # Maximum tokens of the retrieved context
+    summary: int                  # Share of the history summary, the maximum tokens of a new summary
+    history: int                  # Share of the history messages, it also gets what the other parts leave
+
+    def count(self, messages: Sequence[Any]) -> int:
+        return count_message_tokens(messages, self.model_name)
+
+    def window(self, history: List[Any], used: int) -> List[Any]:
+        """
+        Keep the latest history messages fitting into the tokens not `used` by the other parts
+
+        A leading summary is kept whenever it fits.
+
+        Args:
+            history: History messages, optionally starting with the summary
+            used: Tokens of the system prompt, the input and the reply priming
+
+        Returns:
+            List[Any]: Windowed history
+        """
+        remaining = self.total - used
+        summary, messages = (history[:1], history[1:]) if history and getattr(history[0], "type", None) == "system" else ([], history)
+        summary_tokens = self.count(summary)
+        if summary_tokens <= remaining:
+            remaining -= summary_tokens
+        else:
+            summary = []
+
+        kept = 0
+        for message in reversed(messages):
+            tokens = self.count([message])
+            if tokens > remaining:
+                break
+            remaining -= tokens
+            kept += 1
+        return summary + messages[len(messages) - kept:]
+
+def token_budget(model_name: Optional[str],
+                 system_prompt: str,
+                 budget: int = CHAT_TOKEN_BUDGET,
+                 max_tokens: Optional[int] = None) -> Optional[TokenBudget]:
+    """
+    Split the prompt token budget of a model
+
+    Args:
+        model_name: Chat model
+        system_prompt: System prompt of the chat
+        budget: Maximum prompt tokens, 0 disables token budgets
+        max_tokens: Maximum reply tokens, reserved in the context window up to half of it
+
+    Returns:
+        Optional[TokenBudget]: Budget, None if disabled
+    """
+    if budget <= 0:
+        return None
+    window = context_window(model_name)
+    # A reply limit as large as the window would leave no room for the prompt
+    total = min(budget, window - min(max_tokens or REPLY_RESERVE, window // 2))
+    system = MESSAGE_OVERHEAD + count_tokens(system_prompt, model_name)
+    remaining = max(total - system - REPLY_PRIMING, 0)
+    rag = int(remaining * RAG_CONTEXT_SHARE)
+    summary = int(remaining * SUMMARY_TOKEN_SHARE)
+    return TokenBudget(
+        model_name=model_name,
+        total=total,
+        system=system,
+        rag=rag,
+        summary=summary,
+        history=remaining - rag - summary
+    )
@@ -0,0 +1,162 @@
+from typing import Dict, Any, List, Optional, Tuple
+from dataclasses import dataclass, asdict
+from pathlib import Path
+import atexit
+import hashlib
+import json
+import threading
+import time
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
+
+# JSONL file of the token usage per API key and model (empty keeps it in memory), and seconds between its writes
+USAGE_LOG_FILE = os.getenv("USAGE_LOG_FILE", str(PROJECT_ROOT / "server" / "data" / "usage" / "usage.jsonl"))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "60"))
+
+def key_id(api_key: Optional[str]) -> str:
+    """
+    Identify an API key without storing it
+    """
+    if not api_key:
+        return "anonymous"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+@dataclass
+class UsageCounts:
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, other: "UsageCounts"):
+        self.requests += other.requests
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+
+    def to_dict(self) -> Dict[str, int]:
+        return {**asdict(self), "total_tokens": self.total_tokens}
+
+class UsageMeter:
+    """
+    In-process token usage per API key and model
+
+    Recording a request only adds to counters in memory. The usage since the last
+    write is appended to `path` as one JSON line per key and model by a background
+    thread every `flush_interval` seconds, and on `flush` or `close`. Keys are
+    stored as a hash, never in plain text.
+    """
+    def __init__(self, path: Optional[str] = USAGE_LOG_FILE, flush_interval: float = USAGE_FLUSH_INTERVAL):
+        """
+        Args:
+            path: JSONL file the usage is appended to, None keeps it in memory only
+            flush_interval: Seconds between writes, 0 writes on `flush` and `close` only
+        """
+        self.path = Path(path) if path else None
+        self.flush_interval = flush_interval
+        self._totals: Dict[Tuple[str, str], UsageCounts] = {}
+        self._pending: Dict[Tuple[str, str], UsageCounts] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self.flushes = 0
+        self._thread = None
+        if self.path is not None and flush_interval > 0:
+            self._thread = threading.Thread(target=self._flush_loop, name="usage-flush", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, api_key: Optional[str], model: Optional[str], prompt_tokens: int, completion_tokens: int):
+        """
+        Add the usage of a request
+
+        Args:
+            api_key: API key of the request
+            model: Requested model
+            prompt_tokens: Tokens of the prompt
+            completion_tokens: Tokens of the reply
+        """
+        key = (key_id(api_key), model or "")
+        counts = UsageCounts(1, prompt_tokens, completion_tokens)
+        with self._lock:
+            self._totals.setdefault(key, UsageCounts()).add(counts)
+            if self.path is not None:
+                self._pending.setdefault(key, UsageCounts()).add(counts)
+
+    def usage(self, api_key: Optional[str]) -> Dict[str, Dict[str, int]]:
+        """
+        Get the usage of an API key by model since the process started
+        """
+        key = key_id(api_key)
+        with self._lock:
+            return {model: counts.to_dict() for (owner, model), counts in self._totals.items() if owner == key}
+
+    def flush(self):
+        """
+        Append the usage since the last flush to the usage file
+        """
+        if self.path is None:
+            return
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            now = int(time.time())
+            lines = [
+                json.dumps({"time": now, "key": key, "model": model, **counts.to_dict()})
+                for (key, model), counts in pending.items()
+            ]
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with self.path.open("a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                self.flushes += 1
+            except OSError as e:
+                print(f"[UsageMeter] Failed to write usage to {self.path}: {e}")
+                # Keep the usage for the next flush
+                with self._lock:
+                    for key, counts in pending.items():
+                        self._pending.setdefault(key, UsageCounts()).add(counts)
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        """
+        Get the total usage and the API keys using the most tokens
+
+        Args:
+            top: Number of keys listed
+        """
+        with self._lock:
+            total = UsageCounts()
+            by_key: Dict[str, UsageCounts] = {}
+            for (key, _), counts in self._totals.items():
+                total.add(counts)
+                by_key.setdefault(key, UsageCounts()).add(counts)
+            pending = len(self._pending)
+        ranked: List[Tuple[str, UsageCounts]] = sorted(by_key.items(), key=lambda item: item[1].total_tokens, reverse=True)
+        return {
+            **total.to_dict(),
+            "keys": len(by_key),
+            "top_keys": [{"key": key, **counts.to_dict()} for key, counts in ranked[:top]],
+            "pending": pending,
+            "flushes": self.flushes
+        }
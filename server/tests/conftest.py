@@ -0,0 +1,9 @@
+from pathlib import Path
+import sys
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# The embedding service imports the RAG configuration, which imports the embedding
+# service in turn, so the configuration has to be imported first
+import server.app.utils.config
@@ -0,0 +1,100 @@
+import pytest
+from pathlib import Path
+import sys
+import asyncio
+import httpx
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from server.app.core.rag.embedding import EmbeddingService
+from server.app.core.rag.reranking import Reranker
+from server.app.utils.http import AsyncHTTPClient
+
+class MockAPI:
+    """
+    Mock transport answering with the queued responses, then with `default`
+    """
+    def __init__(self, *responses, default=None, delay=0.0):
+        self.responses = list(responses)
+        self.default = default
+        self.delay = delay
+        self.requests = []
+        self.transport = httpx.MockTransport(self.handle)
+
+    async def handle(self, request):
+        self.requests.append(request)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.responses.pop(0) if self.responses else self.default
+
+def make_results(contents):
+    return [{"content": content, "metadata": {"source": "test"}, "score": 0.5} for content in contents]
+
+def rerank_response(scores):
+    return httpx.Response(200, json={"results": [{"index": i, "relevance_score": score} for i, score in enumerate(scores)]})
+
+def make_reranker(api, **kwargs):
+    reranker = Reranker(base_url="http://reranker.test", api_key="test", model_name="fake", retry_delay=0, **kwargs)
+    reranker._http = AsyncHTTPClient(transport=api.transport)
+    return reranker
+
+def test_arerank_retries_failed_requests():
+    """A failed reranking request is retried before falling back"""
+    api = MockAPI(httpx.Response(503), default=rerank_response([0.1, 0.9]))
+    reranker = make_reranker(api, score_cache_size=0)
+
+    reranked, max_score = asyncio.run(reranker.arerank("ibuprofen", make_results(["fever", "ibuprofen"]), top_k=2))
+
+    assert len(api.requests) == 2
+    assert [result.content for result in reranked] == ["ibuprofen", "fever"]
+    assert max_score == pytest.approx(0.9) and not any(result.fallback for result in reranked)
+
+def test_arerank_falls_back_after_latency_budget():
+    """A reranking API slower than the latency budget is replaced by the local reranker"""
+    api = MockAPI(default=rerank_response([0.9, 0.1]), delay=5.0)
+    reranker = make_reranker(api, latency_budget=0.1)
+
+    reranked, _ = asyncio.run(asyncio.wait_for(
+        reranker.arerank("ibuprofen", make_results(["fever", "ibuprofen"]), top_k=1), timeout=2
+    ))
+
+    assert [result.content for result in reranked] == ["ibuprofen"]
+    assert reranked[0].fallback and len(api.requests) == 1
+
+def test_aembed_query_uses_cache():
+    """Normalized repeats of a query are embedded once, a transient error is retried"""
+    api = MockAPI(httpx.Response(503), default=httpx.Response(200, json={"data": [{"index": 0, "embedding": [0.6, 0.8]}]}))
+    service = EmbeddingService(base_url="http://embedding.test", api_key="test", model_name="fake", retry_delay=0)
+    service._http = AsyncHTTPClient(transport=api.transport)
+
+    async def embed_twice():
+        return await service.aembed_query("Headache"), await service.aembed_query("  headache ")
+
+    first, second = asyncio.run(embed_twice())
+
+    assert first == second == pytest.approx([0.6, 0.8])
+    assert len(api.requests) == 2
+    assert service.query_cache.stats()["hits"] == 1
+
+def test_async_client_follows_the_event_loop():
+    """The client is reused within an event loop and recreated for a new one"""
+    api = MockAPI(default=httpx.Response(200, json={}))
+    http = AsyncHTTPClient(transport=api.transport)
+
+    async def request_twice():
+        first = http.get()
+        await first.get("http://service.test")
+        second = http.get()
+        await second.get("http://service.test")
+        return first, second
+
+    first, second = asyncio.run(request_twice())
+    third, _ = asyncio.run(request_twice())
+
+    assert first is second and third is not first
+    assert len(api.requests) == 4
+    asyncio.run(http.aclose())
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
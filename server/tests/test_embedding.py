@@ -0,0 +1,196 @@
+import pytest
+from pathlib import Path
+import sys
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from langchain.schema import Document
+from server.app.core.rag.embedding import EmbeddingService, EmbeddingAPIError, estimate_tokens
+from server.app.core.rag.ingestion import AdaptiveConcurrency, AsyncIngestionEngine
+from server.app.core.rag.cache import QueryEmbeddingCache
+
+class FakeEmbeddingService(EmbeddingService):
+    """
+    Embedding service answering from memory, fails every batch containing "poison"
+    """
+    def __init__(self, **kwargs):
+        super().__init__(base_url="http://localhost", api_key="test", model_name="fake", **kwargs)
+        self.requests = []
+
+    def _get_embedding(self, text):
+        return self._get_embeddings([text])[0]
+
+    def _get_embeddings(self, texts):
+        self.requests.append(list(texts))
+        if any("poison" in text for text in texts):
+            raise ValueError("bad input")
+        return [[float(len(text)), 1.0] for text in texts]
+
+def make_documents(texts):
+    return [Document(page_content=text, metadata={"source": "test.txt", "type": "text"}) for text in texts]
+
+def test_estimate_tokens():
+    """CJK characters count as one token each"""
+    assert estimate_tokens("头痛发热") == 4
+    assert estimate_tokens("abcdefgh") == 2
+
+def test_embed_documents_batches_by_count_and_tokens():
+    """Chunks are packed by count and by estimated token budget"""
+    service = FakeEmbeddingService(batch_size=3, batch_max_tokens=8)
+    documents = make_documents(["a", "b", "c", "d", "头痛发热头痛发热"])
+    embedded = service.embed_documents(documents)
+
+    assert [len(batch) for batch in service.requests] == [3, 1, 1]
+    assert [doc["content"] for doc in embedded] == ["a", "b", "c", "d", "头痛发热头痛发热"]
+    assert embedded[4]["embedding"] == [8.0, 1.0]
+
+def test_embed_documents_isolates_failed_chunks():
+    """A failing batch is split until only the bad chunk is dropped"""
+    service = FakeEmbeddingService(batch_size=8)
+    documents = make_documents(["a", "b", "poison", "d", "a"])
+    embedded = service.embed_documents(documents)
+
+    assert [doc["content"] for doc in embedded] == ["a", "b", "d"]
+    assert len({doc["id"] for doc in embedded}) == 3
+
+def test_iter_embeddings_consumes_documents_lazily():
+    """Only the batch being embedded is pulled from the document stream"""
+    service = FakeEmbeddingService(batch_size=2)
+    consumed = []
+
+    def stream():
+        for text in ["a", "b", "poison", "d", "e"]:
+            consumed.append(text)
+            yield make_documents([text])[0]
+
+    batches = service.iter_embeddings(stream())
+    first = next(batches)
+    assert first["metadata"][0]["content"] == "a" and len(first["ids"]) == 2
+    assert len(consumed) == 3
+    assert [meta["content"] for batch in batches for meta in batch["metadata"]] == ["d", "e"]
+
+def test_embed_query_uses_normalized_cache():
+    """Trivially different queries share one embedding request"""
+    service = FakeEmbeddingService()
+    first = service.embed_query("I have a headache")
+    second = service.embed_query("  i have a  HEADACHE ")
+
+    assert first == second
+    assert len(service.requests) == 1
+    assert service.query_cache.stats()["hits"] == 1
+    assert service.query_cache.stats()["misses"] == 1
+
+def test_query_cache_eviction():
+    """Entries are evicted by size in LRU order and expire after the TTL"""
+    import time
+
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put_vector("a", "m", [1.0])
+    cache.put_vector("b", "m", [2.0])
+    assert cache.get_vector("a", "m") is not None
+    cache.put_vector("c", "m", [3.0])
+    assert cache.get_vector("b", "m") is None
+    assert cache.get_vector("a", "m").dtype.name == "float32"
+    assert cache.get_vector("a", "other-model") is None
+
+    cache = QueryEmbeddingCache(max_size=2, ttl=0.01)
+    cache.put_vector("a", "m", [1.0])
+    time.sleep(0.02)
+    assert cache.get_vector("a", "m") is None
+
+def test_adaptive_concurrency_aimd():
+    """Concurrency grows additively and halves when throttled"""
+    import asyncio
+
+    async def run():
+        limiter = AdaptiveConcurrency(initial=4, max_limit=6)
+        for _ in range(4):
+            await limiter.acquire()
+            await limiter.release()
+        assert limiter.limit == 5
+
+        await limiter.acquire()
+        await limiter.release(throttled=True)
+        assert limiter.limit == 2
+        assert limiter.peak == 5
+        assert limiter.in_flight == 0
+
+    asyncio.run(run())
+
+def test_ingestion_engine_drops_failing_chunks():
+    """A chunk the API keeps rejecting is dropped, the others of its batch are stored"""
+    import asyncio
+
+    class FakeAsyncEmbeddingService(FakeEmbeddingService):
+        async def _aget_embeddings(self, client, texts):
+            self.requests.append(list(texts))
+            if any("poison" in text for text in texts):
+                raise EmbeddingAPIError("Embedding API returned 400: bad input", status_code=400)
+            return [[float(len(text)), 1.0] for text in texts]
+
+    class FakeStore:
+        def __init__(self):
+            self.ids = []
+
+        def insert(self, vector_data):
+            self.ids.extend(vector_data["ids"])
+            return vector_data["ids"]
+
+    service = FakeAsyncEmbeddingService(batch_size=4, retry_delay=0)
+    store = FakeStore()
+    engine = AsyncIngestionEngine(service, store)
+    report = asyncio.run(engine.run(make_documents(["a", "b", "poison", "d", "e"])))
+
+    assert report.failed == 1 and report.embedded == 4
+    assert len(store.ids) == 4 and report.inserted_ids == store.ids
+
+def test_ingestion_engine_backs_off_without_retry_after(monkeypatch):
+    """Server errors without Retry-After are retried after growing, jittered delays"""
+    import asyncio
+    from server.app.core.rag import ingestion
+
+    class FlakyEmbeddingService(FakeEmbeddingService):
+        async def _aget_embeddings(self, client, texts):
+            self.requests.append(list(texts))
+            if len(self.requests) < 3:
+                raise EmbeddingAPIError("Embedding API returned 503: busy", status_code=503)
+            return [[1.0, 1.0] for _ in texts]
+
+    engine = AsyncIngestionEngine(FlakyEmbeddingService(retry_delay=1), None)
+    assert 0.5 <= engine._backoff(1) <= 1 and 2 <= engine._backoff(3) <= 4
+
+    delays = []
+    monkeypatch.setattr(ingestion.AsyncIngestionEngine, "_backoff", lambda self, attempt: delays.append(attempt) or 0)
+    engine.vector_store = type("Store", (), {"insert": lambda self, data: data["ids"]})()
+    report = asyncio.run(engine.run(make_documents(["a"])))
+
+    assert delays == [1, 2] and report.throttled == 2 and report.embedded == 1
+
+def test_ingestion_engine_splits_only_rejected_payloads(monkeypatch):
+    """Outages fail a batch without splitting it, rejected credentials abort the run"""
+    import asyncio
+    from server.app.core.rag import ingestion
+
+    class FailingEmbeddingService(FakeEmbeddingService):
+        def __init__(self, status_code, **kwargs):
+            super().__init__(**kwargs)
+            self.status_code = status_code
+
+        async def _aget_embeddings(self, client, texts):
+            self.requests.append(list(texts))
+            raise EmbeddingAPIError(f"Embedding API returned {self.status_code}", status_code=self.status_code)
+
+    monkeypatch.setattr(ingestion.AsyncIngestionEngine, "_backoff", lambda self, attempt: 0)
+    documents = make_documents([f"chunk {i}" for i in range(32)])
+
+    service = FailingEmbeddingService(503, batch_size=32, max_retries=3)
+    report = asyncio.run(AsyncIngestionEngine(service, None).run(documents))
+    assert len(service.requests) == 3 and report.failed == 32
+
+    service = FailingEmbeddingService(401, batch_size=8, max_retries=3)
+    report = asyncio.run(AsyncIngestionEngine(service, None, max_concurrency=1, initial_concurrency=1).run(documents))
+    assert len(service.requests) == 1 and report.failed == 32 and "401" in report.aborted
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,93 @@
+import pytest
+from pathlib import Path
+import sys
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from server.app.core.rag.flat_store import FlatVectorStore
+from server.app.core.rag.store import create_vector_store
+
+def make_data(ids, vectors):
+    return {
+        "ids": ids,
+        "vectors": vectors,
+        "metadata": [{"content": f"content {doc_id}", "source": "test"} for doc_id in ids]
+    }
+
+def test_search_matches_brute_force(tmp_path):
+    """Results and scores equal an exact squared L2 scan"""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32)
+    store = FlatVectorStore("test_collection", str(tmp_path))
+    store.insert(make_data([f"id{i}" for i in range(100)], vectors[:100].tolist()))
+    store.insert(make_data([f"id{i}" for i in range(100, 200)], vectors[100:].tolist()))
+
+    query = rng.normal(size=16).astype(np.float32)
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    results = store.search(query.tolist(), limit=5)
+
+    assert [result["id"] for result in results] == [f"id{i}" for i in np.argsort(distances)[:5]]
+    assert results[0]["score"] == pytest.approx(float(distances.min()), rel=1e-4)
+    assert results[0]["content"] == results[0]["metadata"]["content"]
+
+def test_upsert_delete_and_reopen(tmp_path):
+    """Overwritten and deleted rows survive a reopen and compaction"""
+    store = FlatVectorStore("test_collection", str(tmp_path))
+    store.insert(make_data(["a", "b", "c"], [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]))
+    store.insert(make_data(["a"], [[-1.0, 0.0]]))
+    store.delete(["b"])
+
+    reopened = FlatVectorStore("test_collection", str(tmp_path))
+    assert reopened.count() == 2
+    assert [result["id"] for result in reopened.search([-1.0, 0.0], limit=5)] == ["a", "c"]
+
+    reopened.delete(["c"])
+    assert reopened.count() == 1
+    assert [doc_id for doc_id, _, _ in reopened.iter_documents()] == ["a"]
+    assert len(list((tmp_path / "test_collection.flat").glob("vectors.*.bin"))) == 1
+
+def test_float16_backend(tmp_path):
+    """The factory creates a float16 flat store with the same ranking"""
+    store = create_vector_store("test_collection", str(tmp_path), backend="flat", dtype="float16")
+    store.insert(make_data(["a", "b"], [[0.1, 0.2, 0.3], [0.9, 0.8, 0.7]]))
+
+    assert store.search([1.0, 1.0, 1.0], limit=1)[0]["id"] == "b"
+    store.reset_collection()
+    assert store.count() == 0 and store.search([1.0, 1.0, 1.0]) == []
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_quantized_search_rescores_exactly(tmp_path, quantization):
+    """Quantized search finds the nearest vector and returns exact distances"""
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(500, 256)).astype(np.float32)
+    store = FlatVectorStore("test_collection", str(tmp_path), quantization=quantization, rescore_factor=10)
+    store.insert(make_data([f"id{i}" for i in range(500)], vectors.tolist()))
+
+    queries = vectors[:20] + rng.normal(size=(20, 256)).astype(np.float32) * 0.3
+    for i, query in enumerate(queries):
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        results = store.search(query.tolist(), limit=5)
+        assert results[0]["id"] == f"id{i}"
+        assert results[0]["score"] == pytest.approx(float(distances[i]), rel=1e-4)
+        assert [result["score"] for result in results] == sorted(result["score"] for result in results)
+
+def test_quantization_report_and_requantize(tmp_path):
+    """The report compares every quantization with the reference store, existing stores are re-encoded"""
+    from server.app.core.rag.quantization import quantization_report
+
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(100, 32)).astype(np.float32)
+    reference = FlatVectorStore("reference_collection", str(tmp_path))
+    reference.insert(make_data([f"id{i}" for i in range(100)], vectors.tolist()))
+    rows = quantization_report(reference, vectors[:5], limit=3)
+
+    assert [row["index"] for row in rows][1:] == ["FlatVectorStore[none]", "FlatVectorStore[int8]", "FlatVectorStore[binary]"]
+    assert rows[1]["recall"] == 1.0 and rows[3]["bytes_per_vector"] == 4
+
+    requantized = FlatVectorStore("reference_collection", str(tmp_path), quantization="int8")
+    assert requantized.search(vectors[7].tolist(), limit=1)[0]["id"] == "id7"
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
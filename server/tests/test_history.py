@@ -0,0 +1,206 @@
+import pytest
+from pathlib import Path
+import sys
+import json
+import asyncio
+import sqlite3
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, messages_to_dict
+from server.app.core.models.history import SQLiteHistoryBackend, CachedHistoryBackend, FileHistoryBackend, create_history_backend, migrate_json_histories, SUMMARY_PREFIX
+from server.app.core.models.online import ChatMessageManager
+
+def test_sqlite_history_appends_and_summarizes(tmp_path):
+    """Messages are appended as rows, a summary hides all but the kept messages without rewriting them"""
+    backend = SQLiteHistoryBackend(tmp_path / "history.db")
+    history = backend.get_history("s1")
+    history.add_messages([HumanMessage(content=f"question {i}") for i in range(5)])
+    backend.get_history("s2").add_message(AIMessage(content="other session"))
+
+    summary = SystemMessage(content=SUMMARY_PREFIX + "earlier questions")
+    messages = backend.summarize("s1", summary, keep_last=2)
+    history.add_message(AIMessage(content="answer"))
+
+    reopened = SQLiteHistoryBackend(tmp_path / "history.db")
+    assert [message.content for message in reopened.get_history("s1").messages] == \
+        [summary.content, "question 3", "question 4", "answer"]
+    assert [message.content for message in messages] == [summary.content, "question 3", "question 4"]
+    assert reopened._conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = 's1'").fetchone()[0] == 7
+    assert reopened._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert set(reopened.list_sessions()) == {"s1", "s2"}
+
+    reopened.delete("s1")
+    assert reopened.get_history("s1").messages == [] and reopened.list_sessions() == ["s2"]
+
+def test_sqlite_summary_keeps_earlier_summaries_hidden(tmp_path):
+    """A second summary keeping more messages than visible does not bring back the ones the first summary hid"""
+    backend = SQLiteHistoryBackend(tmp_path / "history.db")
+    backend.append("s1", [HumanMessage(content=str(i)) for i in range(10)])
+    first = SystemMessage(content=SUMMARY_PREFIX + "0 to 7")
+    backend.summarize("s1", first, keep_last=2)
+    backend.append("s1", [AIMessage(content="10")])
+
+    second = SystemMessage(content=SUMMARY_PREFIX + "0 to 9")
+    messages = backend.summarize("s1", second, keep_last=4)
+
+    assert [message.content for message in messages] == [second.content, "8", "9", "10"]
+    backend.close()
+
+def test_migrate_json_histories(tmp_path):
+    """JSON files are imported once, a leading summary becomes a summary row"""
+    summary = SystemMessage(content=SUMMARY_PREFIX + "a fever")
+    (tmp_path / "s1.json").write_text(json.dumps(messages_to_dict([summary, HumanMessage(content="still hot"), AIMessage(content="rest")])))
+    (tmp_path / "s2.json").write_text(json.dumps(messages_to_dict([HumanMessage(content="hello")])))
+    backend = SQLiteHistoryBackend(tmp_path / "history.db")
+
+    assert migrate_json_histories(tmp_path, backend) == 2
+    assert migrate_json_histories(tmp_path, backend) == 0
+    assert [message.content for message in backend.get_history("s1").messages] == [summary.content, "still hot", "rest"]
+    assert backend._conn.execute("SELECT COUNT(*) FROM messages WHERE kind = 'summary'").fetchone()[0] == 1
+    assert migrate_json_histories(tmp_path, backend, overwrite=True, delete=True) == 2
+    assert [message.content for message in backend.get_history("s2").messages] == ["hello"]
+    assert not list(tmp_path.glob("*.json"))
+
+def test_manager_summarizes_into_sqlite(tmp_path):
+    """The message manager summarizes long sessions through the SQLite backend"""
+    manager = ChatMessageManager(history_dir=tmp_path, max_messages=4, llm=FakeListChatModel(responses=["short summary"]), backend="sqlite")
+    history = manager.get_history("s1")
+    history.add_messages([HumanMessage(content=f"message {i}") for i in range(6)])
+
+    messages = asyncio.run(manager.process_messages("s1"))
+    assert messages[0].content == SUMMARY_PREFIX + "short summary"
+    assert [message.content for message in manager.get_history("s1").messages[1:]] == [f"message {i}" for i in range(2, 6)]
+    assert manager.list_sessions() == ["s1"] and (tmp_path / "history.db").exists()
+
+    manager.clear_all_histories()
+    assert manager.list_sessions() == []
+
+def test_hot_session_cache_writes_behind(tmp_path):
+    """Cached sessions are read without the storage, writes reach it on flush in order"""
+    storage = SQLiteHistoryBackend(tmp_path / "history.db")
+    cache = CachedHistoryBackend(storage, max_sessions=2, flush_interval=60)
+    history = cache.get_history("s1")
+    history.add_messages([HumanMessage(content=f"question {i}") for i in range(4)])
+    summary = SystemMessage(content=SUMMARY_PREFIX + "earlier questions")
+    cache.summarize("s1", summary, keep_last=1)
+    history.add_message(AIMessage(content="answer"))
+
+    assert [message.content for message in history.messages] == [summary.content, "question 3", "answer"]
+    assert storage.get_history("s1").messages == [] and cache.list_sessions() == ["s1"]
+
+    cache.flush()
+    assert [message.content for message in storage.get_history("s1").messages] == [summary.content, "question 3", "answer"]
+    assert cache.stats()["flushes"] == 1 and cache.stats()["pending"] == 0
+
+    # Only sessions without pending writes are evicted
+    for session_id in ("s2", "s3", "s4"):
+        cache.get_history(session_id).add_message(HumanMessage(content=session_id))
+    assert cache.stats()["sessions"] == 3 and cache.stats()["pending"] == 3
+    cache.flush()
+    assert cache.stats()["sessions"] == 2
+    assert [message.content for message in cache.get_history("s1").messages][-1] == "answer"
+
+    cache.get_history("s4").add_message(HumanMessage(content="s4 again"))
+    cache.close()
+    assert [message.content for message in SQLiteHistoryBackend(tmp_path / "history.db").get_history("s4").messages] == ["s4", "s4 again"]
+
+def test_failed_flush_keeps_only_unwritten_operations(tmp_path):
+    """A flush failing midway through a session retries the failed write without repeating the written ones"""
+    class FlakyBackend(SQLiteHistoryBackend):
+        failures = 1
+
+        def summarize(self, session_id, summary, keep_last):
+            if self.failures:
+                self.failures -= 1
+                raise sqlite3.OperationalError("database is locked")
+            return super().summarize(session_id, summary, keep_last)
+
+    storage = FlakyBackend(tmp_path / "history.db")
+    cache = CachedHistoryBackend(storage, flush_interval=60)
+    history = cache.get_history("s1")
+    history.add_messages([HumanMessage(content=f"question {i}") for i in range(3)])
+    summary = SystemMessage(content=SUMMARY_PREFIX + "earlier questions")
+    cache.summarize("s1", summary, keep_last=1)
+    cache.get_history("s2").add_message(HumanMessage(content="other session"))
+
+    cache.flush()
+    assert [message.content for message in storage.get_history("s1").messages] == ["question 0", "question 1", "question 2"]
+    assert cache.stats()["pending"] == 2
+    cache.flush()
+    assert [message.content for message in storage.get_history("s1").messages] == [summary.content, "question 2"]
+    assert storage._conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = 's1'").fetchone()[0] == 4
+    assert [message.content for message in storage.get_history("s2").messages] == ["other session"]
+    cache.close()
+
+def test_file_cache_bounds_bytes(tmp_path):
+    """The byte bound evicts sessions, a write-through cache writes at once"""
+    cache = CachedHistoryBackend(FileHistoryBackend(tmp_path), max_bytes=2000, flush_interval=0)
+    for i in range(5):
+        cache.get_history(f"s{i}").add_message(HumanMessage(content="x" * 400))
+
+    assert cache.stats()["sessions"] < 5 and cache.stats()["bytes"] <= 2000
+    assert len(json.loads((tmp_path / "s0.json").read_text())) == 1
+    assert [message.content for message in cache.get_history("s0").messages] == ["x" * 400]
+
+def test_workers_share_histories_without_cache(tmp_path, monkeypatch):
+    """With several workers every backend reads the messages the others wrote"""
+    monkeypatch.setattr("server.app.core.models.history.SERVER_WORKERS", 2)
+    first = create_history_backend("sqlite", tmp_path)
+    second = create_history_backend("sqlite", tmp_path)
+    assert not isinstance(first, CachedHistoryBackend)
+
+    first.get_history("s1").add_message(HumanMessage(content="question"))
+    second.get_history("s1").add_message(AIMessage(content="answer"))
+    assert [message.content for message in first.get_history("s1").messages] == ["question", "answer"]
+    first.close()
+    second.close()
+
+def test_spawned_workers_bypass_cache(tmp_path, monkeypatch):
+    """Worker processes spawned without run.py still bypass the per-process cache"""
+    monkeypatch.setattr("multiprocessing.parent_process", lambda: object())
+    backend = create_history_backend("sqlite", tmp_path)
+
+    assert not isinstance(backend, CachedHistoryBackend)
+    backend.close()
+
+def test_rolling_summary_runs_after_the_response(tmp_path, monkeypatch):
+    """Long sessions are summarized in the background with the summary model, keeping messages added meanwhile"""
+    from server.app.core.models.online import LangChainChat, LLMClientPool
+
+    class FakeClientPool(LLMClientPool):
+        def _create_client(self, base_url, api_key, model_name, params):
+            return FakeListChatModel(responses=[f"{model_name} output"])
+
+    monkeypatch.setattr("server.app.core.models.online.LLMClientPool", FakeClientPool)
+    chat = LangChainChat(base_url="http://llm", api_key="key", model_name="chat-model", history_dir=tmp_path,
+                         max_messages=4, summary_model_name="summary-model", token_budget=0)
+    context = chat.context("http://llm", "key", "chat-model", max_messages=4)
+
+    async def conversation():
+        for i in range(2):
+            await chat.achat(f"question {i}", "s1", context=context)
+        assert chat.summarizer.stats()["scheduled"] == 0
+        await chat.achat("question 2", "s1", context=context)
+        assert chat.summarizer.stats()["running"] == 1
+        await chat.summarizer.join()
+
+    # The next turn starts while the summary is being created
+    create_summary = chat.message_manager.create_summary
+    async def slow_summary(*args):
+        chat.message_manager.get_history("s1").add_message(HumanMessage(content="question 3"))
+        return await create_summary(*args)
+    monkeypatch.setattr(chat.message_manager, "create_summary", slow_summary)
+
+    asyncio.run(conversation())
+    assert [message.content for message in chat.get_history("s1")] == [
+        SUMMARY_PREFIX + "summary-model output", "question 1", "chat-model output", "question 2", "chat-model output", "question 3"
+    ]
+    assert chat.summarizer.stats()["completed"] == 1
+    chat.chat("title please", context=chat.context(max_messages=1, api_key="key", model_name="chat-model"))
+    assert chat.summarizer.stats()["scheduled"] == 1
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,99 @@
+import pytest
+from pathlib import Path
+import sys
+import json
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from langchain.schema import Document
+from server.app.core.rag.manifest import IndexManifest, chunk_id, source_fingerprint
+from server.app.core.rag.embedding import EmbeddingService
+from server.app.core.rag.flat_store import FlatVectorStore
+from server.app.core.rag.indexing import VectorIndexer
+
+def test_chunk_id_is_content_addressed():
+    """Chunk IDs only depend on source name, type and content"""
+    a = Document(page_content="头痛", metadata={"source": "/a/raw/test.txt", "type": "text"})
+    b = Document(page_content="头痛", metadata={"source": "/b/raw/test.txt", "type": "text", "title": "x"})
+    c = Document(page_content="头痛。", metadata={"source": "/a/raw/test.txt", "type": "text"})
+    assert chunk_id(a) == chunk_id(b)
+    assert chunk_id(a) != chunk_id(c)
+
+def test_source_fingerprint_tracks_config_and_file(tmp_path):
+    """Fingerprints change with the config entry and the raw file"""
+    raw = tmp_path / "test.txt"
+    raw.write_text("hello", encoding="utf-8")
+    source = {"type": "text", "filename": "test.txt", "chunk_size": 100}
+    fingerprint = source_fingerprint(source, raw)
+
+    assert fingerprint == source_fingerprint(dict(source), raw)
+    assert fingerprint != source_fingerprint({**source, "chunk_size": 120}, raw)
+    raw.write_text("hello world", encoding="utf-8")
+    assert fingerprint != source_fingerprint(source, raw)
+
+def test_manifest_roundtrip(tmp_path):
+    """Manifest keeps sources and chunks across save and load"""
+    path = tmp_path / "manifest.json"
+    manifest = IndexManifest(path, embedding_model="bge")
+    manifest.update_source("text:a.txt", "fp-a", ["c2", "c1", "c1"])
+    manifest.update_source("text:b.txt", "fp-b", ["c3"], complete=False)
+    manifest.save()
+
+    loaded = IndexManifest.load(path)
+    assert loaded.embedding_model == "bge"
+    assert loaded.sources["text:a.txt"]["chunks"] == ["c1", "c2"]
+    assert loaded.is_current("text:a.txt", "fp-a")
+    assert not loaded.is_current("text:b.txt", "fp-b")
+    assert loaded.chunk_ids(exclude="text:a.txt") == {"c3"}
+    assert loaded.remove_source("text:a.txt") == ["c1", "c2"]
+    assert loaded.total_chunks() == 1
+
+def test_sync_refreshes_metadata_of_kept_chunks(tmp_path):
+    """A renamed source title reaches its stored chunks from the snapshot, without embedding them again"""
+    class FakeEmbeddingService(EmbeddingService):
+        def __init__(self):
+            super().__init__(base_url="http://localhost", api_key="test", model_name="fake")
+            self.embedded = []
+
+        def _get_embeddings(self, texts):
+            self.embedded.extend(texts)
+            return [[float(len(text)), 1.0] for text in texts]
+
+        def snapshot(self, output_dir=None):
+            return super().snapshot(tmp_path / "vectors")
+
+    class FakePreprocessor:
+        def load_config(self, config_path):
+            return json.loads(Path(config_path).read_text(encoding="utf-8"))
+
+        def source_path(self, source):
+            return tmp_path / source["filename"]
+
+        def iter_sources(self, sources):
+            for source, path in sources:
+                yield source, iter([
+                    Document(page_content=text, metadata={"source": str(path), "type": "text", "title": source["title"]})
+                    for text in path.read_text(encoding="utf-8").split()
+                ])
+
+    (tmp_path / "test.txt").write_text("fever cough", encoding="utf-8")
+    config = tmp_path / "config.json"
+    service = FakeEmbeddingService()
+    store = FlatVectorStore(persist_directory=str(tmp_path / "flat"))
+    indexer = VectorIndexer(service, store, max_concurrency=0)
+
+    config.write_text(json.dumps([{"type": "text", "filename": "test.txt", "title": "Old"}]), encoding="utf-8")
+    indexer.sync_sources(FakePreprocessor(), config, tmp_path / "manifest.json")
+    config.write_text(json.dumps([{"type": "text", "filename": "test.txt", "title": "New"}]), encoding="utf-8")
+    stats = indexer.sync_sources(FakePreprocessor(), config, tmp_path / "manifest.json")
+
+    assert stats["refreshed"] == 2 and stats["added"] == 0 and service.embedded == ["fever", "cough"]
+    assert {metadata["source"] for _, _, metadata in store.iter_documents()} == {"New"}
+    assert {json.loads(batch)["source"] for batch in service.snapshot().load()["records"].column("metadata").to_pylist()} == {"New"}
+    assert IndexManifest.load(tmp_path / "manifest.json").is_current(
+        "text:test.txt", source_fingerprint({"type": "text", "filename": "test.txt", "title": "New"}, tmp_path / "test.txt")
+    )
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
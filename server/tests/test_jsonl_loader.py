@@ -0,0 +1,50 @@
+import pytest
+from pathlib import Path
+import sys
+import json
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from server.app.core.rag.data_preprocess import JsonlLoader, iter_json_records
+
+RECORDS = [
+    {"Q": "阿司匹林的副作用？", "A": "常见胃肠道不适。"},
+    {"Q": "What is \"fever\"? [1]", "A": "A body temperature above 38°C, see {note}."},
+    {"Q": "高血压怎么办？", "A": "控制饮食，规律服药。" * 30}
+]
+
+def write_array(path):
+    path.write_text(json.dumps(RECORDS, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+def write_jsonl(path):
+    path.write_text("\n".join(json.dumps(record, ensure_ascii=False) for record in RECORDS) + "\n", encoding="utf-8")
+    return path
+
+def test_array_and_lines_stream_the_same_records(tmp_path):
+    """JSON arrays decode element by element, even with tiny read blocks"""
+    array = write_array(tmp_path / "qa.json")
+    lines = write_jsonl(tmp_path / "qa.jsonl")
+
+    assert list(iter_json_records(array, block_size=7)) == RECORDS
+    assert list(iter_json_records(lines)) == RECORDS
+
+def test_records_are_chunked_separately(tmp_path):
+    """Every chunk belongs to one record and carries its index and question"""
+    documents = JsonlLoader(chunk_size=100, chunk_overlap=10).load(write_jsonl(tmp_path / "qa.jsonl"), "qa")
+
+    assert documents[0].page_content == "<Question>: 阿司匹林的副作用？\n<Answer>: 常见胃肠道不适。"
+    assert [doc.metadata["record"] for doc in documents[:2]] == [1, 2]
+    assert all(doc.metadata["record"] == 3 for doc in documents[2:]) and len(documents) > 3
+    assert documents[-1].metadata["question"] == "高血压怎么办？"
+
+def test_bad_records_are_skipped(tmp_path):
+    """Malformed lines and records without Q&A fields do not stop the load"""
+    path = tmp_path / "qa.jsonl"
+    path.write_text('{"Q": "a", "A": "b"}\n{broken\n{"text": "no qa"}\n', encoding="utf-8")
+
+    assert [doc.metadata["record"] for doc in JsonlLoader().load(path)] == [1]
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
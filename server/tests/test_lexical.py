@@ -0,0 +1,79 @@
+import pytest
+from pathlib import Path
+import sys
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from server.app.core.rag.lexical import tokenize, LexicalScorer, BM25Index, reciprocal_rank_fusion
+from server.app.core.rag.reranking import Reranker
+
+def make_results(contents):
+    return [{"content": content, "metadata": {"source": "test"}, "score": 0.5} for content in contents]
+
+def test_tokenize_mixed_cjk_and_latin():
+    """CJK runs become unigrams and bigrams, Latin words are case folded"""
+    tokens = tokenize("Aspirin 阿司匹林")
+    assert tokens[0] == "aspirin"
+    assert "阿司" in tokens and "匹林" in tokens and "林" in tokens
+
+def test_lexical_scorer_ranks_exact_terms_first():
+    """Documents containing the query terms score highest"""
+    bm25, relevance = LexicalScorer().score("阿司匹林 过敏", ["头痛发热", "患者对阿司匹林过敏", "青霉素过敏史"])
+    assert list(bm25.argsort()[::-1]) == [1, 2, 0]
+    assert relevance[1] == pytest.approx(1.0)
+    assert relevance[0] == 0.0
+
+def test_local_backend_needs_no_api():
+    """The local backend reranks without remote configuration"""
+    reranker = Reranker(base_url=None, api_key=None, backend="local")
+    reranked, max_score = reranker.rerank("ibuprofen dose", make_results(["fever", "ibuprofen dose for adults", "dose"]), top_k=2)
+
+    assert [result.index for result in reranked] == [1, 2]
+    assert max_score == pytest.approx(1.0)
+
+def test_remote_failure_falls_back_to_local():
+    """Unreachable rerank API falls back to lexical scores instead of distances"""
+    reranker = Reranker(base_url="http://127.0.0.1:9", api_key="test", max_retries=1, latency_budget=0.5)
+    reranked, _ = reranker.rerank("ibuprofen", make_results(["fever", "ibuprofen"]), top_k=1)
+
+    assert [result.content for result in reranked] == ["ibuprofen"]
+
+def make_index():
+    index = BM25Index()
+    index.build([
+        ("a", "头痛发热", {"source": "test"}),
+        ("b", "患者对阿司匹林过敏", {"source": "test"}),
+        ("c", "青霉素过敏史", {"source": "test"}),
+        ("d", "ibuprofen dose for adults", {"source": "test"})
+    ], version="v1")
+    return index
+
+def test_bm25_index_finds_exact_terms():
+    """Only documents sharing query terms are returned, best match first"""
+    results = make_index().search("阿司匹林过敏", limit=10)
+    assert [result["id"] for result in results] == ["b", "c"]
+    assert make_index().search("Ibuprofen", limit=1)[0]["id"] == "d"
+
+def test_bm25_index_round_trip(tmp_path):
+    """A saved index loads with its version and identical scores"""
+    index = make_index()
+    path = tmp_path / "bm25.npz"
+    index.save(path)
+    loaded = BM25Index.load(path)
+
+    assert loaded.version == "v1"
+    assert loaded.search("过敏") == index.search("过敏")
+    assert BM25Index.load(tmp_path / "missing.npz") is None
+
+def test_reciprocal_rank_fusion():
+    """Documents ranked by both retrievers come first, vector entries are kept"""
+    vector = [{"id": "a", "score": 0.1}, {"id": "b", "score": 0.2}, {"id": "c", "score": 0.3}]
+    lexical = [{"id": "c", "score": 9.0}, {"id": "b", "score": 5.0}, {"id": "d", "score": 1.0}]
+    fused = reciprocal_rank_fusion([vector, lexical], limit=3)
+
+    assert [result["id"] for result in fused] == ["c", "b", "a"]
+    assert fused[0]["score"] == 0.3
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,66 @@
+import pytest
+from pathlib import Path
+import sys
+import asyncio
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from langchain_core.language_models import FakeListChatModel
+from server.app.core.models.online import LangChainChat, LLMClientPool
+
+class FakeClientPool(LLMClientPool):
+    """Pool of fake models answering with their model name"""
+    created = 0
+
+    def _create_client(self, base_url, api_key, model_name, params):
+        FakeClientPool.created += 1
+        return FakeListChatModel(responses=[f"answer of {model_name}"])
+
+@pytest.fixture
+def chat(tmp_path, monkeypatch):
+    monkeypatch.setattr("server.app.core.models.online.LLMClientPool", FakeClientPool)
+    FakeClientPool.created = 0
+    return LangChainChat(base_url="http://llm", api_key="key", model_name="default", history_dir=tmp_path)
+
+def test_pool_reuses_clients_per_settings():
+    """Clients are shared by equal settings, other keys or parameters get their own, the oldest is evicted"""
+    pool = LLMClientPool(max_size=2)
+    client = pool.get("http://llm", "key-a", "model", temperature=0.5, stop=["\n"])
+
+    assert pool.get("http://llm", "key-a", "model", stop=["\n"], temperature=0.5) is client
+    assert pool.get("http://llm", "key-b", "model", temperature=0.5, stop=["\n"]) is not client
+    assert client.temperature == 0.5 and client.openai_api_key.get_secret_value() == "key-a"
+
+    pool.get("http://llm", "key-a", "model", temperature=0.9)
+    assert len(pool) == 2 and pool.get("http://llm", "key-a", "model", temperature=0.5, stop=["\n"]) is not client
+    assert pool.stats()["hits"] == 1
+
+def test_concurrent_pool_misses_share_one_client():
+    """Threads asking for the same settings at once end up with the same client"""
+    pool = LLMClientPool()
+    with ThreadPoolExecutor(8) as executor:
+        clients = list(executor.map(lambda _: pool.get("http://llm", "key", "model"), range(32)))
+
+    assert len({id(client) for client in clients}) == 1 and len(pool) == 1
+
+def test_concurrent_requests_keep_their_context(chat):
+    """Requests with different models run concurrently without changing each other or the default"""
+    contexts = [chat.context("http://llm", f"key-{i % 2}", f"model-{i % 2}", max_messages=4) for i in range(4)]
+    assert contexts[0] is contexts[2] and contexts[0] is not contexts[1]
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        contexts[0].max_messages = 10
+
+    async def ask():
+        return await asyncio.gather(*(chat.achat("hello", f"session-{i}", context=context) for i, context in enumerate(contexts)))
+
+    assert asyncio.run(ask()) == ["answer of model-0", "answer of model-1"] * 2
+    assert chat.default_context.model_name == "default"
+    # Three chat models, each with a summary client limited to the summary budget
+    assert FakeClientPool.created == 6
+    assert [message.content for message in chat.get_history("session-1")] == ["hello", "answer of model-1"]
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,60 @@
+import pytest
+from pathlib import Path
+import sys
+import json
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from server.app.core.rag.data_preprocess import DataPreprocessor, iter_json_records
+
+def make_sources(tmp_path):
+    jsonl = tmp_path / "qa.jsonl"
+    jsonl.write_text("\n".join(
+        json.dumps({"Q": f"问题 {i}？", "A": f"回答 {i}。" * (i % 7 + 1)}, ensure_ascii=False) for i in range(300)
+    ) + "\n", encoding="utf-8")
+    text = tmp_path / "notes.txt"
+    text.write_text("\n\n".join(f"Paragraph {i} about symptoms and treatment." * 3 for i in range(50)), encoding="utf-8")
+    return [
+        ({"type": "jsonl", "filename": "qa.jsonl", "title": "qa", "chunk_size": 40, "chunk_overlap": 5}, jsonl),
+        ({"type": "text", "filename": "notes.txt", "title": "notes", "chunk_size": 80, "chunk_overlap": 10}, text)
+    ]
+
+def collect(preprocessor, sources):
+    return [
+        (source["filename"], doc.page_content, doc.metadata)
+        for source, documents in preprocessor.iter_sources(sources)
+        for doc in documents
+    ]
+
+def test_byte_ranges_cover_every_line_once(tmp_path):
+    """Adjacent byte ranges split a JSONL file without losing or repeating records"""
+    path = make_sources(tmp_path)[0][1]
+    size = path.stat().st_size
+    records = [
+        record
+        for start in range(0, size, 333)
+        for record in iter_json_records(path, byte_range=(start, min(start + 333, size)))
+    ]
+
+    assert records == list(iter_json_records(path))
+
+def test_parallel_matches_serial(tmp_path):
+    """Worker processes return the serial chunks in the same order with the same record numbers"""
+    sources = make_sources(tmp_path)
+    serial = collect(DataPreprocessor(workers=0), sources)
+    preprocessor = DataPreprocessor(workers=2, part_bytes=2048)
+
+    assert collect(preprocessor, sources) == serial
+    assert preprocessor.timings["jsonl:qa.jsonl"]["parts"] > 1
+    assert sum(timing["chunks"] for timing in preprocessor.timings.values()) == len(serial)
+
+def test_unconsumed_sources_are_skipped(tmp_path):
+    """Moving on to the next source discards the rest of the previous one"""
+    sources = make_sources(tmp_path)
+    seen = [source["filename"] for source, _ in DataPreprocessor(workers=2, part_bytes=2048).iter_sources(sources)]
+
+    assert seen == ["qa.jsonl", "notes.txt"]
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
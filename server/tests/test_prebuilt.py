@@ -0,0 +1,59 @@
+import pytest
+from pathlib import Path
+import sys
+import os
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from server.app.core.rag.flat_store import FlatVectorStore
+from server.app.core.rag.prebuilt import publish_index, read_index_info, prune_versions
+
+INFO = {"embedding_model": "test-model", "backend": "flat", "store_options": {}, "chunks": 2}
+
+def build_index(index_dir):
+    store = FlatVectorStore("medical_knowledge", str(index_dir))
+    store.insert({
+        "ids": ["a", "b"],
+        "vectors": [[1.0, 0.0], [0.0, 1.0]],
+        "metadata": [{"content": "a"}, {"content": "b"}]
+    })
+    (index_dir / "snapshot").mkdir()
+    (index_dir / "snapshot" / "vectors-000000.f32").write_bytes(b"cache")
+
+def test_publish_and_open(tmp_path):
+    """A published version is self-contained, excludes the embedding snapshot and is found through LATEST"""
+    build_index(tmp_path / "vectors")
+    prepared = []
+    path = publish_index(tmp_path / "vectors", tmp_path / "indexes", "v1", INFO, prepare=prepared.append)
+
+    info = read_index_info(tmp_path / "indexes")
+    assert Path(info["path"]) == path and info["version"] == "v1" and info["backend"] == "flat"
+    assert prepared == [tmp_path / "indexes" / ".v1.tmp"]
+    assert not (path / "snapshot").exists()
+    assert FlatVectorStore("medical_knowledge", str(path)).search([0.0, 1.0], limit=1)[0]["id"] == "b"
+
+def test_republish_and_prune(tmp_path):
+    """The same index is published once, another backend replaces it, and old versions are pruned"""
+    build_index(tmp_path / "vectors")
+    output = tmp_path / "indexes"
+    first = publish_index(tmp_path / "vectors", output, "v1", INFO)
+    os.utime(first, (0, 0))
+
+    assert publish_index(tmp_path / "vectors", output, "v1", {**INFO, "stats": {"added": 0}}) == first
+    assert read_index_info(first).get("stats") is None
+    publish_index(tmp_path / "vectors", output, "v1", {**INFO, "store_options": {"quantization": "int8"}})
+    assert read_index_info(first)["store_options"] == {"quantization": "int8"}
+
+    publish_index(tmp_path / "vectors", output, "v2", INFO)
+    os.utime(output / "v1", (0, 0))
+    assert prune_versions(output, keep=1) == 1
+    assert read_index_info(output)["version"] == "v2" and not (output / "v1").exists()
+
+def test_missing_index():
+    """Serving a directory without a published index fails clearly"""
+    with pytest.raises(ValueError):
+        read_index_info(PROJECT_ROOT / "server" / "tests")
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
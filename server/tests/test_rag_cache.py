@@ -0,0 +1,121 @@
+import pytest
+from pathlib import Path
+import sys
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from server.app.core.rag.cache import SemanticCache
+from server.app.core.rag.reranking import Reranker
+from server.app.utils.config import RAGPipeline
+
+class FakeReranker(Reranker):
+    """
+    Reranker scoring documents by their length, records the documents sent to the API
+    """
+    def __init__(self, **kwargs):
+        super().__init__(base_url="http://localhost", api_key="test", model_name="fake", **kwargs)
+        self.requests = []
+        self.fail = False
+
+    def _get_rerank(self, query, documents, top_n=5):
+        self.requests.append(list(documents))
+        if self.fail:
+            raise ConnectionError("reranking API unavailable")
+        results = [{"index": i, "relevance_score": len(doc) / 10} for i, doc in enumerate(documents)]
+        results.sort(key=lambda result: result["relevance_score"], reverse=True)
+        return {"results": results[:top_n] if top_n else results}
+
+def make_results(contents):
+    return [{"content": content, "metadata": {"source": "test"}, "score": 0.5} for content in contents]
+
+class CachingPipeline(RAGPipeline):
+    """Pipeline with a semantic cache over a fixed search result"""
+    _instance = None
+    _initialized = False
+
+    def _initialize_components(self):
+        self.embedding_service = type("Embedding", (), {"embed_query": lambda self, query: [1.0, 0.0]})()
+        self.vector_store = type("Store", (), {
+            "warm_up": lambda self: None,
+            "search": lambda self, query_vector, limit: make_results(["a", "bbb"])
+        })()
+        self.reranker = FakeReranker(score_cache_size=0)
+        self.semantic_cache = SemanticCache(max_size=4, threshold=0.95)
+        self.lexical_index = None
+
+    def _setup_database(self):
+        self.index_version = "v1"
+
+    def _build_prompt(self, query, reranked_results, max_relevance_score, budget=None):
+        return query
+
+def test_semantic_cache_hits_similar_queries():
+    """Queries within the cosine threshold reuse the cached results"""
+    cache = SemanticCache(max_size=4, threshold=0.95)
+    cache.store([1.0, 0.0, 0.0], "v1", "headache")
+
+    assert cache.lookup([0.99, 0.05, 0.0], "v1") == "headache"
+    assert cache.lookup([0.0, 1.0, 0.0], "v1") is None
+    assert cache.stats()["hit_rate"] == 0.5
+
+def test_semantic_cache_invalidated_by_index_version():
+    """Results cached for another index version are never returned"""
+    cache = SemanticCache(max_size=4, threshold=0.95)
+    cache.store([1.0, 0.0], "v1", "old")
+
+    assert cache.lookup([1.0, 0.0], "v2") is None
+    assert len(cache) == 0
+    cache.store([1.0, 0.0], "v2", "new")
+    cache.clear("v3")
+    assert cache.lookup([1.0, 0.0], "v3") is None
+
+def test_semantic_cache_replaces_oldest_entry():
+    """The oldest entry is replaced once the cache is full"""
+    cache = SemanticCache(max_size=2, threshold=0.99)
+    cache.store([1.0, 0.0, 0.0], "v1", "a")
+    cache.store([0.0, 1.0, 0.0], "v1", "b")
+    cache.store([0.0, 0.0, 1.0], "v1", "c")
+
+    assert cache.lookup([1.0, 0.0, 0.0], "v1") is None
+    assert cache.lookup([0.0, 0.0, 1.0], "v1") == "c"
+
+def test_rerank_only_sends_unseen_pairs():
+    """Cached (query, chunk) scores are merged with fresh ones"""
+    reranker = FakeReranker()
+    first, first_max = reranker.rerank("Headache", make_results(["a", "bbb", "cc"]), top_k=2)
+    second, second_max = reranker.rerank("headache ", make_results(["cc", "dddd", "a"]), top_k=2)
+
+    assert reranker.requests == [["a", "bbb", "cc"], ["dddd"]]
+    assert [result.content for result in first] == ["bbb", "cc"]
+    assert [(result.content, result.index) for result in second] == [("dddd", 1), ("cc", 0)]
+    assert second_max == pytest.approx(0.4)
+    assert reranker.score_cache.stats()["hits"] == 2
+
+def test_rerank_without_cache_truncates_in_api():
+    """Without a cache the API still receives top_k"""
+    reranker = FakeReranker(score_cache_size=0)
+    reranker.rerank("q", make_results(["a", "bbb", "cc"]), top_k=1)
+    reranked, _ = reranker.rerank("q", make_results(["a", "bbb", "cc"]), top_k=1)
+
+    assert len(reranker.requests) == 2
+    assert [result.content for result in reranked] == ["bbb"]
+
+def test_fallback_results_are_not_cached(tmp_path, monkeypatch):
+    """Results of the local fallback are not reused once the reranking API is back"""
+    monkeypatch.delenv("INDEX_SNAPSHOT", raising=False)
+    monkeypatch.setattr(CachingPipeline, "index_lock_path", tmp_path / "medical_knowledge.lock")
+    pipeline = CachingPipeline.get_instance()
+    pipeline.reranker.fail = True
+
+    pipeline.get_enhanced_prompt("headache")
+    assert len(pipeline.semantic_cache) == 0
+    pipeline.reranker.fail = False
+    pipeline.get_enhanced_prompt("headache")
+    pipeline.get_enhanced_prompt("headache")
+
+    assert len(pipeline.reranker.requests) == 2
+    assert pipeline.semantic_cache.stats()["hits"] == 1
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
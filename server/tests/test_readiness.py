@@ -0,0 +1,98 @@
+import pytest
+from pathlib import Path
+import sys
+import threading
+import asyncio
+from filelock import FileLock
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from server.app.utils.config import RAGPipeline
+
+class SlowPipeline(RAGPipeline):
+    """Pipeline whose index build waits for the test"""
+    _instance = None
+    _initialized = False
+    release = threading.Event()
+    indexing = threading.Event()
+    fail = False
+
+    def _initialize_components(self):
+        self.vector_store = type("Store", (), {"warm_up": lambda self: None})()
+
+    def _setup_database(self):
+        self.status["state"] = "indexing"
+        self._on_index_progress({"sources_total": 2, "sources_done": 1, "source": "text:b.txt", "chunks": 10})
+        self.indexing.set()
+        self.release.wait(5)
+        if self.fail:
+            raise ValueError("embedding API unavailable")
+        self.index_version = "v1"
+
+    def _build_prompt(self, query, reranked_results, max_relevance_score, budget=None):
+        return f"context + {query}"
+
+@pytest.fixture
+def pipeline_class(tmp_path, monkeypatch):
+    monkeypatch.delenv("INDEX_SNAPSHOT", raising=False)
+    SlowPipeline.index_lock_path = tmp_path / "medical_knowledge.lock"
+    SlowPipeline._instance = None
+    SlowPipeline._initialized = False
+    SlowPipeline.release = threading.Event()
+    SlowPipeline.indexing = threading.Event()
+    SlowPipeline.fail = False
+    return SlowPipeline
+
+def test_background_start_serves_without_context(pipeline_class):
+    """Prompts fall back to the bare query until the index is ready"""
+    pipeline = pipeline_class.get_instance(background=True)
+
+    assert not pipeline.is_ready
+    assert pipeline.get_enhanced_prompt("fever") == "fever"
+    assert asyncio.run(pipeline.aget_enhanced_prompt("fever")) == "fever"
+    assert pipeline.cache_stats()["index_version"] is None
+    assert pipeline_class.indexing.wait(5)
+    readiness = pipeline.readiness()
+    assert readiness["state"] == "indexing" and readiness["progress"]["sources_done"] == 1
+
+    pipeline_class.release.set()
+    assert pipeline.wait_ready(5)
+    readiness = pipeline.readiness()
+    assert readiness["ready"] and readiness["state"] == "ready" and readiness["index_version"] == "v1"
+    assert pipeline_class.get_instance() is pipeline
+
+def test_failed_start_is_reported(pipeline_class):
+    """A failed background build is visible in the readiness state, a blocking one raises"""
+    pipeline_class.fail = True
+    pipeline_class.release.set()
+    pipeline = pipeline_class.get_instance(background=True)
+
+    assert not pipeline.wait_ready(0.5)
+    readiness = pipeline.readiness()
+    assert readiness["state"] == "failed" and "embedding API unavailable" in readiness["error"]
+
+    pipeline_class._instance = None
+    pipeline_class._initialized = False
+    with pytest.raises(ValueError):
+        pipeline_class.get_instance()
+    assert not pipeline_class._initialized
+
+def test_workers_build_the_index_one_at_a_time(pipeline_class):
+    """A worker waits while another process holds the index lock, then reports its memory"""
+    other_worker = FileLock(str(pipeline_class.index_lock_path))
+    other_worker.acquire()
+    pipeline_class.release.set()
+    pipeline = pipeline_class.get_instance(background=True)
+
+    assert not pipeline.wait_ready(0.5)
+    assert pipeline.readiness()["state"] == "waiting"
+    assert not pipeline_class.indexing.is_set()
+
+    other_worker.release()
+    assert pipeline.wait_ready(5)
+    memory = pipeline.readiness()["memory"]
+    assert memory["rss_mb"] > 0 and memory["uss_mb"] > 0
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
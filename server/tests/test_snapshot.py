@@ -0,0 +1,73 @@
+import pytest
+from pathlib import Path
+import sys
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from server.app.core.rag.snapshot import EmbeddingSnapshot
+
+def make_data(ids, vectors):
+    return {
+        "ids": ids,
+        "vectors": vectors,
+        "metadata": [{"content": f"内容 {doc_id}", "source": "test"} for doc_id in ids]
+    }
+
+def test_append_and_load_zero_copy(tmp_path):
+    """Appended chunks load as a memory map plus a record table, the latest row of an ID wins"""
+    snapshot = EmbeddingSnapshot(tmp_path / "snapshot", embedding_model="bge")
+    snapshot.append(make_data(["a", "b"], [[1.0, 0.0], [0.0, 1.0]]))
+    snapshot.append(make_data(["a"], [[2.0, 2.0]]))
+
+    loaded = EmbeddingSnapshot(tmp_path / "snapshot", embedding_model="bge").load()
+    records = loaded["records"].to_pydict()
+    assert isinstance(loaded["vectors"], np.memmap)
+    assert records["id"] == ["b", "a"]
+    assert loaded["vectors"][records["row"]].tolist() == [[0.0, 1.0], [2.0, 2.0]]
+
+def test_batches_restore_chroma_format(tmp_path):
+    """Batches carry the metadata and vectors accepted by VectorStore.insert"""
+    snapshot = EmbeddingSnapshot(tmp_path, embedding_model="bge")
+    snapshot.append(make_data(["a", "b", "c"], [[1.0], [2.0], [3.0]]))
+    batches = list(snapshot.iter_batches(batch_size=2, ids={"a", "c"}))
+
+    assert batches == [{"ids": ["a", "c"], "vectors": [[1.0], [3.0]], "metadata": [
+        {"content": "内容 a", "source": "test"}, {"content": "内容 c", "source": "test"}
+    ]}]
+
+def test_delete_compacts_and_model_change_clears(tmp_path):
+    """Deleting most rows compacts the files, another embedding model starts empty"""
+    snapshot = EmbeddingSnapshot(tmp_path, embedding_model="bge")
+    snapshot.append(make_data(["a", "b", "c"], [[1.0], [2.0], [3.0]]))
+    snapshot.delete(["a", "b"])
+
+    assert snapshot.ids() == ["c"]
+    assert len(list(tmp_path.glob("records-*.parquet"))) == 1
+    assert (tmp_path / snapshot._state["vectors"]).stat().st_size == 4
+    assert len(EmbeddingSnapshot(tmp_path, embedding_model="other")) == 0
+
+def test_restore_reads_only_the_needed_row_groups(tmp_path, monkeypatch):
+    """IDs come from the ID columns, restored batches read only the row groups holding them"""
+    import pyarrow.parquet as pq
+    from server.app.core.rag import snapshot as snapshot_module
+
+    monkeypatch.setattr(snapshot_module, "ROW_GROUP_SIZE", 4)
+    snapshot = EmbeddingSnapshot(tmp_path, embedding_model="bge")
+    ids = [f"doc-{i}" for i in range(20)]
+    snapshot.append(make_data(ids, [[float(i)] for i in range(20)]))
+    snapshot.append(make_data(["doc-5"], [[50.0]]))
+
+    read_groups = []
+    read_row_group = pq.ParquetFile.read_row_group
+    monkeypatch.setattr(pq.ParquetFile, "read_row_group", lambda self, i, *args, **kwargs: read_groups.append(i) or read_row_group(self, i, *args, **kwargs))
+    assert len(snapshot.ids()) == 20 and read_groups == []
+
+    batches = list(snapshot.iter_batches(ids={"doc-9", "doc-10", "doc-5"}))
+    assert [doc_id for batch in batches for doc_id in batch["ids"]] == ["doc-9", "doc-10", "doc-5"]
+    assert [vector for batch in batches for vector in batch["vectors"]] == [[9.0], [10.0], [50.0]]
+    assert read_groups == [2, 0]
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,54 @@
+import pytest
+from pathlib import Path
+import sys
+import random
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from server.app.core.rag.data_preprocess import TextSplitter
+from server.app.core.rag.splitter import split_on_separators, find_overlap
+
+PIECES = ["阿司匹林", "高血压", "患者", "fever", "dose", "。", "！", "？", "；", "，", "：", "\n", "\n\n", " ", ". ", ", ", "......"]
+
+def random_text(rng, length):
+    return "".join(rng.choice(PIECES) for _ in range(length))
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(10, 0), (50, 20), (200, 50)])
+def test_chunks_match_langchain(chunk_size, chunk_overlap):
+    """The recursive splitter cuts at the same boundaries as LangChain's"""
+    rng = random.Random(chunk_size)
+    splitter = TextSplitter(chunk_size, chunk_overlap)
+    reference = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=splitter.splitter.separators,
+        keep_separator=False,
+        is_separator_regex=False
+    )
+    for _ in range(200):
+        text = random_text(rng, rng.randint(1, 300))
+        assert splitter.splitter.split_text(text) == reference.split_text(text)
+
+def test_special_separators_match_chained_split():
+    """Separators applied in one pass split like repeated str.split, overlapping ones included"""
+    rng = random.Random(0)
+    for separators in (["\n\n", "。", "！", "？", "\n"], ["\n", "\n\n", "。", "；"], ["ab", "bc", "c", "a"]):
+        for _ in range(200):
+            text = random_text(rng, rng.randint(0, 50)) + "abcab"
+            expected = [text]
+            for separator in separators:
+                expected = [part for piece in expected for part in piece.split(separator)]
+            assert split_on_separators(text, separators) == expected
+
+def test_find_overlap():
+    """The overlap is the longest suffix of the first text starting the second"""
+    assert find_overlap("患者出现发热症状", "发热症状，建议就医") == "发热症状"
+    assert find_overlap("aaab", "aab") == "aab"
+    assert find_overlap("abcab", "abd") == "ab"
+    assert find_overlap("abc", "xyz") == ""
+    assert find_overlap("", "abc") == ""
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
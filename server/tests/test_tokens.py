@@ -0,0 +1,95 @@
+import pytest
+from pathlib import Path
+import sys
+import asyncio
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from server.app.utils import tokens
+from server.app.utils.tokens import token_budget, count_tokens, context_window
+from server.app.core.rag.generator import PromptGenerator
+from server.app.core.models.history import SUMMARY_PREFIX
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    """Count tokens with the estimate, whether or not tiktoken encodings are available"""
+    monkeypatch.setattr(tokens, "get_encoding", lambda model_name: None)
+    tokens._count_cached.cache_clear()
+    yield
+    tokens._count_cached.cache_clear()
+
+class RecordingModel(FakeListChatModel):
+    """Fake model recording the prompts it receives"""
+    prompts: list = []
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        RecordingModel.prompts.append(messages)
+        return super()._call(messages, stop, run_manager, **kwargs)
+
+def test_budget_split_and_window():
+    """The budget fits the context window, the window keeps the summary and the latest messages that fit"""
+    budget = token_budget("gpt-4o-mini", "You are a doctor.", budget=1000)
+    assert context_window("gpt-4o-mini") == 128000 and context_window("unknown") == 8192
+    assert budget.total == 1000 and budget.rag + budget.summary + budget.history + budget.system + 3 == 1000
+    assert token_budget("Qwen-7B", "", budget=100000, max_tokens=2000).total == 8192 - 2000
+    assert token_budget("Qwen-7B", "", budget=100000, max_tokens=9000).total == 8192 // 2
+    assert count_tokens("你好") == 2 and count_tokens("abcdefgh") == 2
+
+    summary = SystemMessage(content=SUMMARY_PREFIX + "fever")
+    report = HumanMessage(content="lab report " * 1000)
+    recent = [AIMessage(content="please rest"), HumanMessage(content="thanks")]
+    assert budget.window([summary, report] + recent, used=budget.system) == [summary] + recent
+    assert budget.window([summary] + recent, used=990) == recent[-1:]
+
+def test_summary_model_limited_to_summary_share(tmp_path):
+    """Summaries are created with the summary share of the budget as their maximum tokens"""
+    from server.app.core.models.online import LangChainChat
+
+    chat = LangChainChat(base_url="http://llm", api_key="key", model_name="gpt-4o-mini", history_dir=tmp_path, token_budget=1000)
+    context = chat.context("http://llm", "key", "gpt-4o-mini", temperature=0.2)
+
+    assert context.summary_llm.max_tokens == context.budget.summary and context.llm.max_tokens is None
+    assert context.summary_llm.temperature == 0.2
+
+def test_rag_context_within_budget():
+    """Less relevant documents beyond the context budget are left out"""
+    documents = [{"content": f"document {i} " + "x" * 400, "metadata": {"source": "kb"}} for i in range(5)]
+    prompt = PromptGenerator().generate("fever?", documents, max_relevance_score=0.9, max_context_tokens=250)
+
+    assert "document 1" in prompt and "document 2" not in prompt
+    assert "document 4" in PromptGenerator().generate("fever?", documents, max_relevance_score=0.9)
+
+def test_chat_sends_windowed_history_and_summarizes_by_tokens(tmp_path, monkeypatch):
+    """Prompts stay within the budget, a session is summarized only once its history exceeds its share"""
+    from server.app.core.models.online import LangChainChat, LLMClientPool
+
+    class FakeClientPool(LLMClientPool):
+        def _create_client(self, base_url, api_key, model_name, params):
+            return RecordingModel(responses=["noted"])
+
+    monkeypatch.setattr("server.app.core.models.online.LLMClientPool", FakeClientPool)
+    RecordingModel.prompts = []
+    chat = LangChainChat(base_url="http://llm", api_key="key", model_name="gpt-4o-mini", history_dir=tmp_path, token_budget=600)
+    context = chat.context("http://llm", "key", "gpt-4o-mini", system_prompt="You are a doctor.", max_messages=2)
+
+    async def conversation():
+        for i in range(4):
+            await chat.achat(f"short question {i}", "s1", context=context)
+        assert chat.summarizer.stats()["scheduled"] == 0
+        await chat.achat("lab report " * 120, "s1", context=context)
+        await chat.summarizer.join()
+        await chat.achat("what does it mean?", "s1", context=context)
+
+    asyncio.run(conversation())
+    chat_prompts = [prompt for prompt in RecordingModel.prompts if prompt[0].content == "You are a doctor."]
+    assert len(chat_prompts) == 6
+    assert all(context.budget.count(prompt) <= context.budget.total for prompt in chat_prompts)
+    assert chat.summarizer.stats()["completed"] == 1
+    assert chat_prompts[-1][1].content == SUMMARY_PREFIX + "noted"
+    assert not any("lab report" in message.content for message in chat_prompts[-1])
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,122 @@
+import pytest
+from pathlib import Path
+import sys
+import json
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.language_models import FakeListChatModel
+from server.app.core.models.online import LangChainChat, LLMClientPool
+from server.app.utils.tokens import count_tokens
+from server.app.utils.usage import UsageMeter, key_id
+
+class FakeClientPool(LLMClientPool):
+    """Pool of fake models streaming a fixed answer"""
+    def _create_client(self, base_url, api_key, model_name, params):
+        return FakeListChatModel(responses=["Drink water and rest."])
+
+# The routes create their default models on import
+with pytest.MonkeyPatch.context() as patch:
+    patch.setattr("server.app.core.models.online.LLMClientPool", FakeClientPool)
+    from server.app.api.routes import openai_compatible
+    from server.app.main import app as server_app
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr("server.app.core.models.online.LLMClientPool", FakeClientPool)
+    meter = UsageMeter(tmp_path / "usage.jsonl", flush_interval=0)
+    monkeypatch.setattr(openai_compatible, "model", LangChainChat(history_dir=tmp_path / "history"))
+    monkeypatch.setattr(openai_compatible, "usage_meter", meter)
+    app = FastAPI()
+    app.include_router(openai_compatible.router)
+    return TestClient(app)
+
+def request(**kwargs):
+    return {"model": "gpt-4o", "messages": [{"role": "user", "content": "I have a headache"}], **kwargs}
+
+def test_server_serves_openai_routes():
+    """The server app mounts the OpenAI-compatible API"""
+    paths = {route.path for route in server_app.routes}
+    assert {"/v1/chat/completions", "/v1/usage", "/v1/models", "/api/rag/stats"} <= paths
+
+def test_meter_flushes_usage_per_key(tmp_path):
+    """Usage is summed per key and model, and only the usage since the last flush is written, without the keys"""
+    meter = UsageMeter(tmp_path / "usage.jsonl", flush_interval=0)
+    meter.record("secret-a", "gpt-4o", 10, 5)
+    meter.record("secret-a", "gpt-4o", 20, 5)
+    meter.record("secret-b", "gpt-4o", 1, 1)
+    meter.flush()
+    meter.record("secret-a", "gpt-4o", 3, 0)
+    meter.close()
+
+    lines = [json.loads(line) for line in (tmp_path / "usage.jsonl").read_text().splitlines()]
+    assert [(line["key"], line["requests"], line["total_tokens"]) for line in lines] == [
+        (key_id("secret-a"), 2, 40), (key_id("secret-b"), 1, 2), (key_id("secret-a"), 1, 3)
+    ]
+    assert "secret" not in (tmp_path / "usage.jsonl").read_text()
+    stats = meter.stats()
+    assert stats["requests"] == 4 and stats["top_keys"][0]["key"] == key_id("secret-a")
+    assert meter.usage("secret-a")["gpt-4o"]["prompt_tokens"] == 33
+
+def test_completion_reports_and_meters_usage(client):
+    """Non-streaming completions count the prompt and the answer"""
+    response = client.post("/v1/chat/completions", headers={"Authorization": "Bearer key"}, json=request())
+
+    usage = response.json()["usage"]
+    assert usage["completion_tokens"] == count_tokens("Drink water and rest.", "gpt-4o")
+    assert usage["prompt_tokens"] > count_tokens("I have a headache", "gpt-4o")
+    assert usage["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"]
+    metered = client.get("/v1/usage", headers={"Authorization": "Bearer key"}).json()["data"]["gpt-4o"]
+    assert metered == {"requests": 1, **usage}
+
+def test_stream_sends_usage_chunk(client):
+    """Streams with include_usage end with a chunk holding the usage and no choices"""
+    response = client.post(
+        "/v1/chat/completions",
+        headers={"Authorization": "Bearer key"},
+        json=request(stream=True, stream_options={"include_usage": True})
+    )
+    chunks = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: {")]
+
+    assert all(chunk["usage"] is None for chunk in chunks[:-1]) and chunks[-1]["choices"] == []
+    usage = chunks[-1]["usage"]
+    assert "".join(chunk["choices"][0]["delta"]["content"] for chunk in chunks[:-1]) == "Drink water and rest."
+    assert usage["completion_tokens"] >= count_tokens("Drink water and rest.", "gpt-4o")
+    assert openai_compatible.usage_meter.usage("key")["gpt-4o"]["total_tokens"] == usage["total_tokens"]
+
+    plain = client.post("/v1/chat/completions", headers={"Authorization": "Bearer key"}, json=request(stream=True))
+    assert '"usage"' not in plain.text
+
+def test_failed_generation_meters_no_completion(client, tmp_path, monkeypatch):
+    """The error answer of a failed generation is not counted as completion tokens"""
+    class FailingModel(FakeListChatModel):
+        def _call(self, *args, **kwargs):
+            raise RuntimeError("provider down")
+
+        def _stream(self, *args, **kwargs):
+            raise RuntimeError("provider down")
+
+        async def _astream(self, *args, **kwargs):
+            raise RuntimeError("provider down")
+            yield
+
+    class FailingClientPool(LLMClientPool):
+        def _create_client(self, base_url, api_key, model_name, params):
+            return FailingModel(responses=["unused"])
+
+    monkeypatch.setattr("server.app.core.models.online.LLMClientPool", FailingClientPool)
+    monkeypatch.setattr(openai_compatible, "model", LangChainChat(history_dir=tmp_path / "failing"))
+    headers = {"Authorization": "Bearer key"}
+
+    assert client.post("/v1/chat/completions", headers=headers, json=request()).json()["usage"]["completion_tokens"] == 0
+    stream = client.post("/v1/chat/completions", headers=headers, json=request(stream=True, stream_options={"include_usage": True}))
+    assert "Error occurred" in stream.text
+    assert json.loads(stream.text.split("data: ")[-2])["usage"]["completion_tokens"] == 0
+    metered = openai_compatible.usage_meter.usage("key")["gpt-4o"]
+    assert metered["requests"] == 2 and metered["completion_tokens"] == 0 and metered["prompt_tokens"] > 0
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import argparse
+from dotenv import load_dotenv
+from pathlib import Path
+
+# Load environment variables
+load_dotenv()
+
+PROJECT_ROOT = Path(__file__).parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+DEFAULT_OUTPUT = PROJECT_ROOT / "server" / "data" / "indexes"
+
+def parse_args():
+    """
+    Parse command line arguments
+    """
+    parser = argparse.ArgumentParser(description="SympAI offline index builder")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser(
+        "build",
+        help="Preprocess, embed and index the data sources, then publish a versioned index"
+    )
+    build.add_argument(
+        "--output",
+        type=Path,
+        default=DEFAULT_OUTPUT,
+        help=f"Directory of the published index versions (default: {DEFAULT_OUTPUT})"
+    )
+    build.add_argument(
+        "--keep",
+        type=int,
+        default=3,
+        help="Number of published versions to keep (default: 3)"
+    )
+
+    info = commands.add_parser("info", help="Describe a published index")
+    info.add_argument(
+        "path",
+        type=Path,
+        nargs="?",
+        default=DEFAULT_OUTPUT,
+        help=f"Published index, or directory of versions to describe the latest of (default: {DEFAULT_OUTPUT})"
+    )
+
+    return parser.parse_args()
+
+def build(output: Path, keep: int):
+    """
+    Build the index in server/data/vectors and publish it to `output`
+    """
+    # The build always syncs the writable index, never a prebuilt one
+    os.environ.pop("INDEX_SNAPSHOT", None)
+    from server.app.utils.config import RAGPipeline
+    from server.app.core.rag.prebuilt import prune_versions
+
+    pipeline = RAGPipeline.get_instance()
+    path = pipeline.publish(output)
+    pruned = prune_versions(output, keep)
+    if pruned:
+        print(f"Removed {pruned} old index version(s)")
+    print(f"Index {pipeline.index_version} is ready, serve it with: python run.py --index {path}")
+
+def main():
+    """
+    Main entry point for the index builder
+    """
+    args = parse_args()
+    if args.command == "build":
+        build(args.output, args.keep)
+    elif args.command == "info":
+        from server.app.core.rag.prebuilt import read_index_info
+        print(json.dumps(read_index_info(args.path), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()